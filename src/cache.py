@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+
+from config import Config
+from objects import Query
+from utils import get_md5, get_execution_stats
+
+
+class MeasurementsCache:
+    """
+    Persistent execution time measurements shared between runs.
+
+    Measurements are keyed by database version, model data fingerprint, session properties,
+    measurement settings, query hash and cleaned execution plan hash, so that a query is timed again only if its plan
+    has changed or the stored measurement is older than the configured TTL.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.logger = config.logger
+        self.path = config.cache_path
+        self.ttl = config.cache_ttl
+        self.max_size = config.cache_size
+
+        self.context = ""
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        self.load()
+
+    def set_context(self, db_version: str, data_fingerprint: str):
+        # result hashes depend on fingerprint mode and timings on the retry policy,
+        # so measurements are shared only between runs with the same settings
+        self.context = get_md5(f"{db_version}|{data_fingerprint}|"
+                               f"{self.config.session_props}|{self.config.enable_statistics}|"
+                               f"{self.config.parametrized}|{self.config.prepared}|"
+                               f"{self.config.plan_cache_mode}|{self.config.explain_clause}|"
+                               f"{self.config.server_side_fingerprint}|"
+                               f"{self.config.num_retries}|{self.config.num_warmup}|"
+                               f"{self.config.adaptive_retries}|{self.config.target_precision}|"
+                               f"{self.config.max_retries}|{self.config.adaptive_time_budget}")
+
+    def get_key(self, query: Query):
+        plan_digest = query.execution_plan.plan_digest if query.execution_plan else get_md5("")
+
+        return get_md5(f"{self.context}|{query.query_hash}|{plan_digest}")
+
+    def get(self, query: Query):
+        if self.config.refresh_cache or not query.execution_plan or \
+                not query.execution_plan.get_clean_plan():
+            return False
+
+        with self.lock:
+            entry = self.entries.get(self.get_key(query))
+
+        if not entry or self.is_expired(entry):
+            return False
+
+        query.execution_time_ms = entry["execution_time_ms"]
+        query.execution_time_precision = entry.get("execution_time_precision")
+        query.execution_times = entry.get("execution_times")
+        query.execution_stats = get_execution_stats(query.execution_times)
+        query.planning_time_ms = entry.get("planning_time_ms")
+        query.result_cardinality = entry["result_cardinality"]
+        query.result_hash = entry["result_hash"]
+        query.cached = True
+
+        return True
+
+    def put(self, query: Query):
+        if not query.execution_plan or not query.execution_plan.get_clean_plan() or \
+                query.execution_time_ms <= 0:
+            return
+
+        with self.lock:
+            self.entries[self.get_key(query)] = {
+                "execution_time_ms": query.execution_time_ms,
+                "execution_time_precision": query.execution_time_precision,
+                "execution_times": query.execution_times,
+                "planning_time_ms": query.planning_time_ms,
+                "result_cardinality": query.result_cardinality,
+                "result_hash": query.result_hash,
+                "stored_at": time.time(),
+            }
+
+    def is_expired(self, entry):
+        return self.ttl > 0 and time.time() - entry["stored_at"] > self.ttl * 3600
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as cache_file:
+                self.entries = {key: entry for key, entry in json.load(cache_file).items()
+                                if not self.is_expired(entry)}
+            self.logger.info(f"Loaded {len(self.entries)} cached measurements from {self.path}")
+        except (OSError, ValueError) as e:
+            self.logger.warn(f"Unable to load measurements cache {self.path}: {e}")
+
+    def store(self):
+        with self.lock:
+            entries = {key: entry for key, entry in self.entries.items()
+                       if not self.is_expired(entry)}
+
+            if 0 < self.max_size < len(entries):
+                # evict oldest measurements first
+                entries = dict(sorted(entries.items(),
+                                      key=lambda item: item[1]["stored_at"])[-self.max_size:])
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path, "w") as cache_file:
+            json.dump(entries, cache_file)
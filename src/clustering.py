@@ -0,0 +1,41 @@
+from collections import Counter
+from typing import List
+
+from objects import Optimization
+
+
+def get_plan_similarity(left: Counter, right: Counter):
+    # weighted Jaccard similarity of hashed subtrees multisets
+    if not left and not right:
+        return 1.0
+
+    return sum((left & right).values()) / sum((left | right).values())
+
+
+def cluster_plans(optimizations: List[Optimization], threshold: float) -> List[List[Optimization]]:
+    """
+    Greedy clustering of optimizations with distinct plans: optimization joins the first
+    cluster whose leader plan is at least threshold similar, otherwise starts a new cluster.
+    Optimizations are expected to be ordered by priority, e.g. by estimated cost.
+    """
+    subtrees = {id(optimization): optimization.execution_plan.get_subtree_hashes() or Counter()
+                for optimization in optimizations}
+
+    clusters = []
+    for optimization in optimizations:
+        for cluster in clusters:
+            if get_plan_similarity(subtrees[id(cluster[0])],
+                                   subtrees[id(optimization)]) >= threshold:
+                cluster.append(optimization)
+                break
+        else:
+            clusters.append([optimization])
+
+    return [sorted(cluster, key=lambda member: -sum(
+        get_plan_similarity(subtrees[id(member)], subtrees[id(other)]) for other in cluster))
+            for cluster in clusters]
+
+
+def get_medoid(cluster: List[Optimization]):
+    # clusters are sorted by total similarity to other members
+    return cluster[0]
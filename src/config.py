@@ -62,6 +62,7 @@ class Config(metaclass=Singleton):
     with_optimizations: bool = False
     source_path: str = None
     output: str = ""
+    resume: bool = False
     revision: str = None
 
     num_nodes: int = None
@@ -88,13 +89,50 @@ class Config(metaclass=Singleton):
 
     num_queries: int = None
     parametrized: bool = False
+    prepared: bool = False
+    plan_cache_mode: str = None
     num_retries: int = None
     num_warmup: int = None
+    result_fetch_size: int = None
+    notices_buffer_size: int = None
+    server_side_fingerprint: bool = False
+    adaptive_retries: bool = False
+    target_precision: float = None
+    max_retries: int = None
+    adaptive_time_budget: int = None
     skip_timeout_delta: int = None
+    timeout_multiplier: float = None
+    timeout_floor_ms: int = None
+    watchdog_grace_ms: int = None
     ddl_query_timeout: int = None
     test_query_timeout: int = None
+    query_budget: int = 0
+    run_budget: int = 0
     all_pairs_threshold: int = None
-
+    join_graph_threshold: int = 0
+    bushy_join_orders: bool = False
+    optimizations_batch_size: int = 1000
+    search_strategy: str = "exhaustive"
+    search_budget: int = 500
+    search_timed_plans: int = 10
+    optimizations_sample_rate: float = 1.0
+    workers: int = 1
+    explain_first: bool = False
+    cost_guided: bool = False
+    cost_prune_factor: float = 0
+    plan_clustering: bool = False
+    plan_similarity: float = 0.8
+    cardinality_injection: bool = False
+    json_plans: bool = False
+    results_format: str = "json"
+
+    cache: bool = False
+    cache_path: str = None
+    cache_ttl: int = None
+    cache_size: int = None
+    refresh_cache: bool = False
+
+    estimator: str = "mean"
     asciidoctor_path: str = None
     clear: bool = False
 
@@ -107,6 +145,7 @@ class Config(metaclass=Singleton):
                f"with_optimizations - {self.with_optimizations}\n" \
                f"source_path - {self.source_path}\n" \
                f"output - {self.output}\n" \
+               f"resume - {self.resume}\n" \
                f"\n" \
                f"revision - {self.revision}\n" \
                f"num_nodes - {self.num_nodes}\n" \
@@ -129,11 +168,47 @@ class Config(metaclass=Singleton):
                f"look_near_best_plan - {self.look_near_best_plan}\n" \
                f"num_queries - {self.num_queries}\n" \
                f"parametrized - {self.parametrized}\n" \
+               f"prepared - {self.prepared}\n" \
+               f"plan_cache_mode - {self.plan_cache_mode}\n" \
                f"num_retries - {self.num_retries}\n" \
                f"num_warmup - {self.num_warmup}\n" \
+               f"result_fetch_size - {self.result_fetch_size}\n" \
+               f"notices_buffer_size - {self.notices_buffer_size}\n" \
+               f"server_side_fingerprint - {self.server_side_fingerprint}\n" \
+               f"adaptive_retries - {self.adaptive_retries}\n" \
+               f"target_precision - {self.target_precision}\n" \
+               f"max_retries - {self.max_retries}\n" \
+               f"adaptive_time_budget - {self.adaptive_time_budget}\n" \
                f"skip_timeout_delta - {self.skip_timeout_delta}\n" \
+               f"timeout_multiplier - {self.timeout_multiplier}\n" \
+               f"timeout_floor_ms - {self.timeout_floor_ms}\n" \
+               f"watchdog_grace_ms - {self.watchdog_grace_ms}\n" \
                f"ddl_query_timeout - {self.ddl_query_timeout}\n" \
                f"test_query_timeout - {self.test_query_timeout}\n" \
+               f"query_budget - {self.query_budget}\n" \
+               f"run_budget - {self.run_budget}\n" \
                f"all_pairs_threshold - {self.all_pairs_threshold}\n" \
+               f"join_graph_threshold - {self.join_graph_threshold}\n" \
+               f"bushy_join_orders - {self.bushy_join_orders}\n" \
+               f"optimizations_batch_size - {self.optimizations_batch_size}\n" \
+               f"search_strategy - {self.search_strategy}\n" \
+               f"search_budget - {self.search_budget}\n" \
+               f"search_timed_plans - {self.search_timed_plans}\n" \
+               f"optimizations_sample_rate - {self.optimizations_sample_rate}\n" \
+               f"workers - {self.workers}\n" \
+               f"explain_first - {self.explain_first}\n" \
+               f"cost_guided - {self.cost_guided}\n" \
+               f"cost_prune_factor - {self.cost_prune_factor}\n" \
+               f"plan_clustering - {self.plan_clustering}\n" \
+               f"plan_similarity - {self.plan_similarity}\n" \
+               f"cardinality_injection - {self.cardinality_injection}\n" \
+               f"json_plans - {self.json_plans}\n" \
+               f"results_format - {self.results_format}\n" \
+               f"cache - {self.cache}\n" \
+               f"cache_path - {self.cache_path}\n" \
+               f"cache_ttl - {self.cache_ttl}\n" \
+               f"cache_size - {self.cache_size}\n" \
+               f"refresh_cache - {self.refresh_cache}\n" \
+               f"estimator - {self.estimator}\n" \
                f"asciidoctor_path - {self.asciidoctor_path}\n" \
                f"clear - {self.clear}\n"
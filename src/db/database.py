@@ -1,3 +1,6 @@
+from collections import Counter
+
+
 class Database:
     def __init__(self, config):
         self.config = config
@@ -7,6 +10,9 @@ class Database:
     def change_version_and_compile(self, revision_or_path: str = None):
         pass
 
+    def create_connection(self, database: str):
+        pass
+
     def create_test_database(self):
         pass
 
@@ -16,6 +22,9 @@ class Database:
     def set_query_timeout(self, cur, timeout):
         pass
 
+    def set_query_timeout_ms(self, cur, timeout_ms):
+        pass
+
     def destroy(self):
         pass
 
@@ -31,8 +40,29 @@ class Database:
     def get_list_optimizations(self, original_query):
         pass
 
-    def get_execution_plan(self, execution_plan: str):
+    def get_optimization_batches(self, original_query):
         pass
 
+    def get_search_strategy(self, original_query):
+        return None
+
+    def get_execution_plan(self, execution_plan: str, plan_tree=None):
+        pass
+
+    def fetch_execution_plan(self, cur):
+        return self.get_execution_plan('\n'.join(str(item[0]) for item in cur.fetchall()))
+
+    def clear_notices(self, conn):
+        pass
+
+    def get_notices_counters(self, conn):
+        return Counter()
+
+    def get_cardinality_optimization(self, original_query, analyzed_plan):
+        return None
+
+    def get_hints_usage(self, conn):
+        return None, None
+
     def get_results_loader(self):
         pass
\ No newline at end of file
@@ -1,18 +1,20 @@
+import collections
 import dataclasses
 import itertools
+import random
 import re
-from difflib import SequenceMatcher
 from enum import Enum
 from typing import List, Type
 
 import psycopg2
 from allpairspy import AllPairs
+from sql_metadata import Parser
 
 from config import Config, ConnectionConfig, DDLStep
 from objects import Query, EPNode, ExecutionPlan, ListOfOptimizations, Table, Optimization, \
-    ListOfQueries, ResultsLoader
+    ListOfQueries, ResultsLoader, PlanNode, QueryAnalysis
 from db.database import Database
-from utils import evaluate_sql, allowed_diff
+from utils import evaluate_sql, allowed_diff, get_join_graph, get_md5
 
 DEFAULT_USERNAME = 'postgres'
 DEFAULT_PASSWORD = 'postgres'
@@ -20,37 +22,69 @@ DEFAULT_PASSWORD = 'postgres'
 ENABLE_PLAN_HINTING = "SET pg_hint_plan.enable_hint = ON;"
 ENABLE_DEBUG_HINTING = "SET pg_hint_plan.debug_print = ON;"
 CLIENT_MESSAGES_TO_LOG = "SET client_min_messages TO log;"
+DEFAULT_NOTICES_BUFFER_SIZE = 100
+HINT_PLAN_NOTICE = "pg_hint_plan:"
+HINT_PLAN_SECTIONS = {"used hint:": True, "not used hint:": False,
+                      "duplication hint:": False, "error hint:": False}
 DEBUG_MESSAGE_LEVEL = "SET pg_hint_plan.message_level = debug;"
 
-PLAN_CLEANUP_REGEX = r"\s\(actual time.*\)|\s\(never executed\)|\s\(cost.*\)|" \
-                     r"\sMemory:.*|Planning Time.*|Execution Time.*|Peak Memory Usage.*|" \
-                     r"Read RPC Count:.*|Read RPC Wait Time:.*|DocDB Scanned Rows:.*|" \
-                     r".*Partial Aggregate:.*|YB\s|Remote\s|" \
-                     r"JIT:.*|\s+Functions:.*|\s+Options:.*|\s+Timing:.*"  # PG14 JIT info
-PLAN_RPC_CALLS = r"\nRead RPC Count:\s(\d+)"
-PLAN_RPC_WAIT_TIMES = r"\nRead RPC Wait Time:\s([+-]?([0-9]*[.])?[0-9]+)"
-PLAN_DOCDB_SCANNED_ROWS = r"\nDocDB Scanned Rows:\s(\d+)"
-PLAN_PEAK_MEMORY = r"\nPeak memory:\s(\d+)"
-PLAN_TREE_CLEANUP = r"\n\s*->\s*|\n\s*"
+PLAN_CLEANUP_REGEX = re.compile(r"\s\(actual time.*\)|\s\(never executed\)|\s\(cost.*\)|"
+                                r"\sMemory:.*|Planning Time.*|Execution Time.*|Peak Memory Usage.*|"
+                                r"Read RPC Count:.*|Read RPC Wait Time:.*|DocDB Scanned Rows:.*|"
+                                r".*Partial Aggregate:.*|YB\s|Remote\s|"
+                                r"JIT:.*|\s+Functions:.*|\s+Options:.*|\s+Timing:.*")  # PG14 JIT info
+PLAN_RPC_CALLS = re.compile(r"\nRead RPC Count:\s(\d+)")
+PLAN_RPC_WAIT_TIMES = re.compile(r"\nRead RPC Wait Time:\s([+-]?([0-9]*[.])?[0-9]+)")
+PLAN_DOCDB_SCANNED_ROWS = re.compile(r"\nDocDB Scanned Rows:\s(\d+)")
+PLAN_PEAK_MEMORY = re.compile(r"\nPeak memory:\s(\d+)")
+PLAN_TREE_CLEANUP = re.compile(r"\n\s*->\s*|\n\s*")
+PLAN_ESTIMATED_COST = re.compile(r"\s\(cost=\d+\.\d+\.\.(\d+\.\d+)")
+PLAN_NODE_PROPERTIES = re.compile(r"\s+\((cost|actual)=.*$|\s+\(never executed\)$")
+PLAN_NODE_ACTUAL_ROWS = re.compile(r"\(actual (?:time=\S+ )?rows=(\d+) loops=(\d+)")
+# outer, semi and anti joins produce a different number of rows than the inner join of its inputs
+PLAN_INNER_JOIN = re.compile(r"^(?:YB Batched )?(?:Hash Join|Merge Join|Nested Loop)$")
+PLAN_NODE_RELATION = re.compile(r"\son\s(\S+)(?:\s(\S+))?$")
+EXPLAIN_OPTIONS_REGEX = re.compile(r"^\s*explain\s*(?:\((.*)\)|(.*))$", re.IGNORECASE | re.DOTALL)
+PLAN_JSON_PROPERTIES = ["Hash Cond", "Merge Cond", "Join Filter", "Index Cond", "Recheck Cond",
+                        "Filter", "Remote Filter", "Remote Index Filter", "Storage Filter",
+                        "Storage Index Filter", "Sort Key", "Group Key", "Cache Key"]
+# node metrics are summed up over all storage tables and indexes of a node
+PLAN_JSON_STORAGE_METRICS = {"read_requests": ("Read Requests", "Read RPC Count"),
+                             "read_wait_time": ("Read Execution Time", "Read RPC Wait Time"),
+                             "rows_scanned": ("Rows Scanned", "DocDB Scanned Rows")}
+EMPTY_PLAN_DIGEST = ExecutionPlan.get_plan_digest("")
+PLAN_PROPERTY_LINE = re.compile(r"^([A-Z][\w -]*):\s")
+PLAN_SUBPLAN_LINE = re.compile(r"^(InitPlan|SubPlan)\s\d+")
+PLAN_JSON_AGGREGATE_STRATEGIES = {"Sorted": "GroupAggregate", "Hashed": "HashAggregate",
+                                  "Mixed": "MixedAggregate"}
 
 
 class Postgres(Database):
 
     def establish_connection(self, database: str = "postgres"):
+        self.connection = self.create_connection(database)
+
+    def create_connection(self, database: str = "postgres"):
         config = ConnectionConfig(
             self.config.connection.host,
             self.config.connection.port,
             self.config.connection.username,
             self.config.connection.password,
             database, )
-        self.connection = Connection(config)
+        connection = Connection(config,
+                                self.config.notices_buffer_size or DEFAULT_NOTICES_BUFFER_SIZE)
+
+        connection.connect()
 
-        self.connection.connect()
+        return connection
 
     def prepare_query_execution(self, cur):
         for query in self.config.session_props:
             evaluate_sql(cur, query)
 
+        if self.config.prepared and self.config.plan_cache_mode:
+            evaluate_sql(cur, f"SET plan_cache_mode = {self.config.plan_cache_mode}")
+
     def create_test_database(self):
         if DDLStep.DATABASE in self.config.ddls:
             self.establish_connection("postgres")
@@ -66,8 +100,94 @@ class Postgres(Database):
         return PGListOfOptimizations(
             self.config, original_query).get_all_optimizations()
 
-    def get_execution_plan(self, execution_plan: str):
-        return PostgresExecutionPlan(execution_plan)
+    def get_optimization_batches(self, original_query):
+        return PGListOfOptimizations(
+            self.config, original_query).iterate_batches()
+
+    def get_search_strategy(self, original_query):
+        # search strategies replace AllPairs generation for queries with many tables
+        if self.config.search_strategy not in SEARCH_STRATEGIES or \
+                self.config.all_pairs_threshold == -1 or \
+                len(original_query.tables) < max(self.config.all_pairs_threshold, 2):
+            return None
+
+        return SEARCH_STRATEGIES[self.config.search_strategy](
+            self.config, PGListOfOptimizations(self.config, original_query))
+
+    def get_execution_plan(self, execution_plan: str, plan_tree=None):
+        return PostgresExecutionPlan(execution_plan, plan_tree)
+
+    def fetch_execution_plan(self, cur):
+        rows = cur.fetchall()
+        if len(rows) == 1 and isinstance(rows[0][0], list):
+            # EXPLAIN (FORMAT JSON) result, already decoded by psycopg2
+            return self.get_json_execution_plan(rows[0][0][0])
+
+        return self.get_execution_plan('\n'.join(str(item[0]) for item in rows))
+
+    def get_json_execution_plan(self, plan_json):
+        plan_tree = get_plan_tree(plan_json["Plan"])
+
+        plan_lines = get_plan_lines(plan_tree)
+        for key, value in plan_json.items():
+            if key != "Plan" and isinstance(value, (int, float, str)):
+                plan_lines.append(f"{key}: {value:.3f} ms"
+                                  if "Time" in key and isinstance(value, (int, float))
+                                  else f"{key}: {value}")
+
+        return self.get_execution_plan("\n".join(plan_lines), plan_tree)
+
+    def clear_notices(self, conn):
+        conn.notices.clear()
+
+    def get_notices_counters(self, conn):
+        if isinstance(conn.notices, NoticesBuffer):
+            return collections.Counter(conn.notices.counters)
+
+        return collections.Counter()
+
+    def get_cardinality_optimization(self, original_query, analyzed_plan):
+        # true join cardinalities from EXPLAIN ANALYZE are injected with pg_hint_plan Rows hints
+        aliases = {table.alias or table.name for table in original_query.tables}
+        rows_hints = [f"Rows({' '.join(sorted(join_aliases))} #{rows})"
+                      for join_aliases, rows in analyzed_plan.get_join_cardinalities().items()
+                      if join_aliases <= aliases]
+        if not rows_hints:
+            return None
+
+        return PostgresOptimization(
+            query=original_query.query,
+            query_hash=original_query.query_hash,
+            explain_hints=" ".join(rows_hints)
+        )
+
+    def get_hints_usage(self, conn):
+        """
+        Parses pg_hint_plan debug_print notices received since last clear_notices call.
+        Returns used and ignored hints or None if there is no such notice.
+        """
+        used_hints, ignored_hints = [], []
+        hint_plan_notice_found = False
+        for notice in conn.notices:
+            if HINT_PLAN_NOTICE not in notice:
+                continue
+
+            hint_plan_notice_found = True
+            section = None
+            for line in notice.split(HINT_PLAN_NOTICE, 1)[1].splitlines():
+                line = line.strip()
+                if line in HINT_PLAN_SECTIONS:
+                    section = HINT_PLAN_SECTIONS[line]
+                elif line and section is not None:
+                    (used_hints if section else ignored_hints).append(line)
+
+        if not hint_plan_notice_found:
+            return None, None
+
+        used_hints = list(dict.fromkeys(used_hints))
+        ignored_hints = [hint for hint in dict.fromkeys(ignored_hints) if hint not in used_hints]
+
+        return " ".join(used_hints), " ".join(ignored_hints)
 
     def get_results_loader(self):
         return PostgresResultsLoader()
@@ -76,11 +196,36 @@ class Postgres(Database):
         return PostgresListOfQueries()
 
 
+class NoticesBuffer:
+    """
+    Bounded replacement of psycopg2 connection notices list. Only the last notices
+    are kept for parsing, all received notices are counted by severity.
+    """
+
+    def __init__(self, size: int):
+        self.notices = collections.deque(maxlen=size)
+        self.counters = collections.Counter()
+
+    def append(self, notice: str):
+        self.notices.append(notice)
+        self.counters[notice.split(":", 1)[0].strip()] += 1
+
+    def clear(self):
+        self.notices.clear()
+
+    def __iter__(self):
+        return iter(self.notices)
+
+    def __len__(self):
+        return len(self.notices)
+
+
 class Connection:
     conn = None
 
-    def __init__(self, connection_config):
+    def __init__(self, connection_config, notices_buffer_size: int = DEFAULT_NOTICES_BUFFER_SIZE):
         self.connection_config = connection_config
+        self.notices_buffer_size = notices_buffer_size
 
     def connect(self):
         self.conn = psycopg2.connect(
@@ -90,6 +235,11 @@ class Connection:
             user=self.connection_config.username,
             password=self.connection_config.password)
         self.conn.autocommit = True
+        self.conn.notices = NoticesBuffer(self.notices_buffer_size)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
 
     def get_version(self):
         with self.conn.cursor() as cur:
@@ -116,41 +266,45 @@ class Joins(Enum):
 class Leading:
     LEADING = "Leading"
 
-    def __init__(self, config: Config, alias_to_table: List[Table]):
+    def __init__(self, config: Config, alias_to_table: List[Table], query: str = None):
         self.config = config
         self.alias_to_table = alias_to_table
-        self.joins = []
+        self.query = query
+        self.query_columns = None
         self.table_scan_hints = []
 
     def construct(self):
+        """
+        Lazily generates distinct Leading and join method hints, table scan hints
+        are filled before the first one is generated.
+        """
         if self.config.all_pairs_threshold == -1:
-            self.get_all_combinations()
+            yield from self.get_all_combinations()
+        elif adjacency := self.get_connected_join_graph():
+            yield from self.get_connected_combinations(adjacency)
         elif len(self.alias_to_table) < self.config.all_pairs_threshold:
-            self.get_all_combinations()
+            yield from self.get_all_combinations()
         else:
-            self.get_all_pairs_combinations()
+            yield from self.get_all_pairs_combinations()
 
     def filtered_permutations(self, tables):
         # todo check how it works
-        perms = list(itertools.permutations(tables))
-
         if len(tables) < self.config.all_pairs_threshold:
-            return perms
+            yield from itertools.permutations(tables)
+            return
 
-        combs = list(itertools.combinations(tables, len(tables) - 1))
+        comb_joins = ["".join([table.name for table in comb])
+                      for comb in itertools.combinations(tables, len(tables) - 1)]
 
-        result = []
-        for perm in perms:
+        for perm in itertools.permutations(tables):
             perm_join = "".join([table.name for table in perm])
-            for comb in combs:
-                comb_join = "".join([table.name for table in comb])
-                if comb_join in perm_join:
-                    result.append(perm)
-
-        return result
+            if any(comb_join in perm_join for comb_join in comb_joins):
+                yield perm
 
     def get_all_combinations(self):
         # algorithm with all possible combinations
+        self.construct_table_scan_hints()
+
         for tables_perm in itertools.permutations(self.alias_to_table):
             prev_el = None
             joins = []
@@ -173,15 +327,155 @@ class Leading:
                             joins.append(new_join.construct(joined_tables))
 
             for join in joins:
-                self.joins.append(f"{self.LEADING} ( {prev_el} ) {join}")
+                yield f"{self.LEADING} ( {prev_el} ) {join}"
+
+    def get_connected_join_graph(self):
+        """
+        Returns join graph as adjacency bitmasks indexed same as alias_to_table, or None
+        if the graph is not usable: query is too big, not known or contains cross products.
+        """
+        if not self.query or not 1 < len(self.alias_to_table) <= self.config.join_graph_threshold:
+            return None
+
+        aliases = [table.alias for table in self.alias_to_table]
+        join_graph = get_join_graph(self.query, aliases)
+        adjacency = [sum(1 << aliases.index(neighbour) for neighbour in join_graph[alias])
+                     for alias in aliases]
+
+        full_mask = (1 << len(aliases)) - 1
+        return adjacency if self.is_connected(full_mask, adjacency) else None
 
-        for table in self.alias_to_table:
+    @staticmethod
+    def is_connected(mask, adjacency):
+        reached = mask & -mask
+        while True:
+            expanded = reached
+            for idx, neighbours in enumerate(adjacency):
+                if reached & (1 << idx):
+                    expanded |= neighbours & mask
+            if expanded == reached:
+                return reached == mask
+            reached = expanded
+
+    def get_join_trees(self, mask, adjacency, memo):
+        # enumerates csg-cmp pairs of the join graph, so no tree contains a cross product
+        if mask in memo:
+            return memo[mask]
+
+        if mask & (mask - 1) == 0:
+            memo[mask] = [self.alias_to_table[mask.bit_length() - 1].alias]
+            return memo[mask]
+
+        trees = []
+        for outer in range(1, mask):
+            inner = mask & ~outer
+            if outer & ~mask or not inner:
+                continue
+            if not self.config.bushy_join_orders and inner & (inner - 1):
+                continue
+            if not any(adjacency[idx] & inner for idx in range(len(adjacency)) if outer & (1 << idx)):
+                continue
+            if not self.is_connected(outer, adjacency) or not self.is_connected(inner, adjacency):
+                continue
+
+            trees += itertools.product(self.get_join_trees(outer, adjacency, memo),
+                                       self.get_join_trees(inner, adjacency, memo))
+
+        memo[mask] = trees
+        return trees
+
+    def get_connected_combinations(self, adjacency):
+        def leading(tree):
+            return tree if isinstance(tree, str) else f"( {leading(tree[0])} {leading(tree[1])} )"
+
+        def joined_tables(tree):
+            return [tree] if isinstance(tree, str) else joined_tables(tree[0]) + joined_tables(tree[1])
+
+        def join_nodes(tree):
+            if isinstance(tree, str):
+                return []
+            return join_nodes(tree[0]) + join_nodes(tree[1]) + [joined_tables(tree)]
+
+        self.construct_table_scan_hints()
+
+        full_mask = (1 << len(self.alias_to_table)) - 1
+        for tree in self.get_join_trees(full_mask, adjacency, {}):
+            nodes = join_nodes(tree)
+            for joins in itertools.product(Joins, repeat=len(nodes)):
+                join_hints = " ".join(join.construct(tables) for join, tables in zip(joins, nodes))
+                yield f"{self.LEADING} ( {leading(tree)} ) {join_hints}"
+
+    def construct_hints(self, tables_order: List[str], joins: List[Joins], scans: List[str]):
+        prev_el = None
+        joined_tables = []
+        join_hints = []
+        for alias in tables_order:
+            prev_el = f"( {prev_el} {alias} )" if prev_el else alias
+            joined_tables.append(alias)
+
+            if prev_el != alias:
+                join_hints.append(joins[len(joined_tables) - 2].construct(joined_tables))
+
+        return f"{self.LEADING} ( {prev_el} ) {' '.join(join_hints)} {' '.join(scans)}"
+
+    def construct_table_scan_hints(self):
+        self.table_scan_hints = [self.get_table_scan_hints(table) for table in self.alias_to_table]
+
+    def get_table_scan_hints(self, table: Table):
+        if table.indexes is None or not self.query:
+            # no index metadata, e.g. tables loaded from older results
             tables_and_idxs = list({f"{Scans.INDEX.value}({table.alias})"
                                     for field in table.fields if field.is_index})
             tables_and_idxs += {f"{Scans.INDEX_ONLY.value}({table.alias})"
-                                    for field in table.fields if field.is_index}
+                                for field in table.fields if field.is_index}
             tables_and_idxs.append(f"{Scans.SEQ.value}({table.alias})")
-            self.table_scan_hints.append(tables_and_idxs)
+            return tables_and_idxs
+
+        filtered_columns = self.get_referenced_columns(table, filtered_only=True)
+        referenced_columns = self.get_referenced_columns(table, filtered_only=False)
+
+        tables_and_idxs = []
+        for index in table.indexes:
+            # index can serve the query only if its leading column is filtered, joined or sorted on
+            if not index.columns or \
+                    (filtered_columns is not None and index.columns[0] not in filtered_columns):
+                continue
+
+            tables_and_idxs.append(f"{Scans.INDEX.value}({table.alias} {index.name})")
+            if referenced_columns is not None and referenced_columns <= set(index.columns):
+                tables_and_idxs.append(f"{Scans.INDEX_ONLY.value}({table.alias} {index.name})")
+
+        tables_and_idxs.append(f"{Scans.SEQ.value}({table.alias})")
+        return tables_and_idxs
+
+    def get_referenced_columns(self, table: Table, filtered_only: bool):
+        """
+        Returns table columns used in the query, filtered_only limits them to columns
+        used outside of the select list. None means that columns can't be determined.
+        """
+        if self.query_columns is None:
+            try:
+                self.query_columns = Parser(self.query).columns_dict or {}
+            except Exception:
+                self.query_columns = {}
+
+        if not self.query_columns:
+            return None
+
+        table_columns = {field.name for field in table.fields}
+        result = set()
+        for section, columns in self.query_columns.items():
+            if filtered_only and section == "select":
+                continue
+
+            for column in columns:
+                table_name, _, column_name = column.rpartition(".")
+                if table_name and table_name not in (table.name, table.alias):
+                    continue
+                if column_name == "*" or column_name in table_columns:
+                    result.add(column_name)
+
+        return None if "*" in result else result
 
     def get_all_pairs_combinations(self):
         if len(self.alias_to_table) <= 1:
@@ -190,44 +484,164 @@ class Leading:
         # todo to reduce number of pairs combinations used here
         # while its not produce overwhelming amount of optimizations
         # it should provide enough number of combinations
-        table_combinations = list(self.filtered_permutations(self.alias_to_table))
         join_product = list(AllPairs([list(Joins) for _ in range(len(self.alias_to_table) - 1)]))
-        scan_product = list(AllPairs([list(Scans) for _ in range(len(self.alias_to_table))]))
-
-        for tables, joins, scans in AllPairs([table_combinations, join_product, scan_product]):
-            prev_el = None
-            joins = itertools.cycle(joins)
-            query_joins = ""
-            joined_tables = []
-
-            for table in tables:
-                prev_el = f"( {prev_el} {table.alias} )" if prev_el else table.alias
-                joined_tables.append(table.alias)
-
-                if prev_el != table.alias:
-                    query_joins += f" {next(joins).construct(joined_tables)}"
-
-            leading_hint = f"{self.LEADING} ({prev_el})"
-            scan_hints = " ".join(
-                f"{scan.value}({tables[table_idx].alias})" for table_idx, scan in
-                enumerate(scans))
-
-            self.joins.append(f"{leading_hint} {query_joins} {scan_hints}")
+        scan_product = list(AllPairs([self.get_table_scan_hints(table)
+                                      for table in self.alias_to_table]))
+
+        # AllPairs needs all table permutations at once, instead each permutation gets
+        # every join and scan combination once, shifted by the permutation number,
+        # so all pairs of table order, joins and scans are still covered
+        num_combinations = max(len(join_product), len(scan_product))
+        covered = set()
+        first_tables = None
+        for idx, tables in enumerate(self.filtered_permutations(self.alias_to_table)):
+            first_tables = first_tables or tables
+            for combination in range(num_combinations):
+                joins_and_scans = (combination % len(join_product),
+                                   (combination + idx) % len(scan_product))
+                covered.add(joins_and_scans)
+                yield self.construct_all_pairs_hints(tables, join_product[joins_and_scans[0]],
+                                                     scan_product[joins_and_scans[1]])
+
+        # too few table orders to shift scans over all join combinations
+        for joins_and_scans in itertools.product(range(len(join_product)),
+                                                 range(len(scan_product))):
+            if joins_and_scans not in covered:
+                yield self.construct_all_pairs_hints(first_tables, join_product[joins_and_scans[0]],
+                                                     scan_product[joins_and_scans[1]])
+
+    def construct_all_pairs_hints(self, tables, joins, scans):
+        prev_el = None
+        joins = itertools.cycle(joins)
+        query_joins = ""
+        joined_tables = []
+
+        for table in tables:
+            prev_el = f"( {prev_el} {table.alias} )" if prev_el else table.alias
+            joined_tables.append(table.alias)
+
+            if prev_el != table.alias:
+                query_joins += f" {next(joins).construct(joined_tables)}"
+
+        leading_hint = f"{self.LEADING} ({prev_el})"
+        scan_hints = " ".join(scans)
+
+        return f"{leading_hint} {query_joins} {scan_hints}"
+
+
+def get_explain_clause(explain_clause: str = None):
+    """
+    Returns explain clause (configured one by default), with FORMAT JSON option added if plans
+    are captured in structured format, e.g. EXPLAIN (ANALYZE, DIST, FORMAT JSON).
+    """
+    config = Config()
+    explain_clause = explain_clause or config.explain_clause
+    if not config.json_plans or \
+            not (match := EXPLAIN_OPTIONS_REGEX.match(explain_clause)):
+        return explain_clause
+
+    options = match.group(1).split(",") if match.group(1) is not None else match.group(2).split()
+    options = [option.strip() for option in options
+               if option.strip() and not option.strip().upper().startswith("FORMAT")]
+
+    return f"EXPLAIN ({', '.join(options + ['FORMAT JSON'])})"
+
+
+def get_plan_node_label(plan):
+    # same node title as in text format
+    label = plan["Node Type"]
+    if label == "Aggregate":
+        label = PLAN_JSON_AGGREGATE_STRATEGIES.get(plan.get("Strategy"), label)
+    if plan.get("Partial Mode", "Simple") != "Simple":
+        label = f"{plan['Partial Mode']} {label}"
+    if (join_type := plan.get("Join Type", "Inner")) != "Inner":
+        label = label.replace(" Join", f" {join_type} Join") if label.endswith(" Join") \
+            else f"{label} {join_type} Join"
+    if plan.get("Scan Direction") == "Backward":
+        label += " Backward"
+    if index := plan.get("Index Name"):
+        label += f" using {index}"
+
+    alias = plan.get("Alias")
+    if relation := plan.get("Relation Name") or plan.get("CTE Name") or plan.get("Function Name"):
+        label += f" on {relation}" if alias in (None, relation) else f" on {relation} {alias}"
+    elif alias:
+        label += f" on {alias}"
+
+    return label
+
+
+def get_plan_tree(plan):
+    properties = []
+    for key in PLAN_JSON_PROPERTIES:
+        if (value := plan.get(key)) is not None:
+            properties.append(f"{key}: {', '.join(value) if isinstance(value, list) else value}")
+
+    node = PlanNode(
+        node_type=plan["Node Type"],
+        relation=plan.get("Relation Name"),
+        alias=plan.get("Alias"),
+        index=plan.get("Index Name"),
+        join_type=plan.get("Join Type"),
+        startup_cost=plan.get("Startup Cost"),
+        total_cost=plan.get("Total Cost"),
+        plan_rows=plan.get("Plan Rows"),
+        plan_width=plan.get("Plan Width"),
+        actual_rows=plan.get("Actual Rows"),
+        actual_loops=plan.get("Actual Loops"),
+        actual_startup_time=plan.get("Actual Startup Time"),
+        actual_total_time=plan.get("Actual Total Time"),
+        label=get_plan_node_label(plan),
+        properties=properties or None,
+        children=[get_plan_tree(child) for child in plan.get("Plans", [])] or None)
+
+    metrics = []
+    for metric, suffixes in PLAN_JSON_STORAGE_METRICS.items():
+        for key, value in plan.items():
+            if key.endswith(suffixes) and isinstance(value, (int, float)):
+                setattr(node, metric, (getattr(node, metric) or 0) + value)
+                metrics.append(f"{key}: {value}")
+    node.metrics = metrics or None
+
+    return node
+
+
+def get_plan_lines(node: PlanNode, level: int = 0, with_metrics: bool = True):
+    # text plan layout: children are shifted by 6 spaces, properties by 2 spaces from the arrow
+    title = f"{' ' * (6 * level - 4)}->  {node.label}" if level else node.label
+    title += f"  (cost={node.startup_cost:.2f}..{node.total_cost:.2f} " \
+             f"rows={node.plan_rows:.0f} width={node.plan_width})"
+    if node.actual_loops == 0:
+        title += " (never executed)"
+    elif node.actual_total_time is not None:
+        title += f" (actual time={node.actual_startup_time:.3f}..{node.actual_total_time:.3f} " \
+                 f"rows={node.actual_rows:.0f} loops={node.actual_loops:.0f})"
+    elif node.actual_loops is not None:
+        title += f" (actual rows={node.actual_rows:.0f} loops={node.actual_loops:.0f})"
+
+    lines = [title] + [f"{' ' * (6 * level + 2)}{line}"
+                       for line in (node.properties or []) +
+                       ((node.metrics or []) if with_metrics else [])]
+    for child in node.children or []:
+        lines += get_plan_lines(child, level + 1, with_metrics)
+
+    return lines
 
 
 @dataclasses.dataclass
 class PostgresQuery(Query):
     execution_plan: 'PostgresExecutionPlan' = None
     optimizations: List['PostgresOptimization'] = None
+    true_cardinality_plan: 'PostgresOptimization' = None
 
     def get_query(self):
         return self.query
 
     def get_explain(self):
-        return f"{Config().explain_clause} {self.query}"
+        return f"{get_explain_clause()} {self.query}"
 
     def get_heuristic_explain(self):
-        return f"EXPLAIN {self.query}"
+        return f"{get_explain_clause('EXPLAIN')} {self.query}"
 
     def get_explain_analyze(self):
         return f"EXPLAIN ANALYZE {self.query}"
@@ -240,10 +654,13 @@ class PostgresQuery(Query):
             for join in Joins)
 
     def compare_plans(self, execution_plan: Type['ExecutionPlan']):
-        if clean_plan := self.execution_plan.get_clean_plan():
-            return clean_plan == self.execution_plan.get_clean_plan(execution_plan)
-        else:
-            return False
+        # structured plans are compared node by node, otherwise plans of any format by digests
+        if self.execution_plan.plan_tree and execution_plan.plan_tree:
+            return self.execution_plan.plan_tree.get_signature() == \
+                execution_plan.plan_tree.get_signature()
+
+        return self.execution_plan.plan_digest != EMPTY_PLAN_DIGEST and \
+            self.execution_plan.plan_digest == execution_plan.plan_digest
 
     def __str__(self):
         return f"Query - \"{self.query}\"\n" \
@@ -253,31 +670,44 @@ class PostgresQuery(Query):
                f"Execution time - \"{self.execution_time_ms}\""
 
     def heatmap(self):
+        """
+        Weights each node of the default plan by the number of near best optimizations
+        which plans have a node with the same signature (node type, join method and relation).
+        Heatmap is computed once and cached on the query.
+        """
+        if self.execution_plan_heatmap is not None:
+            return self.execution_plan_heatmap
+
         config = Config()
         plan_heatmap = {line_id: {'weight': 0, 'str': execution_plan_line}
                         for line_id, execution_plan_line in
                         enumerate(self.execution_plan.get_no_cost_plan().split("->"))}
 
-        best_optimization = self.get_best_optimization(config)
         if self.optimizations:
-            for optimization in self.optimizations:
-                if allowed_diff(config, best_optimization.execution_time_ms,
-                                optimization.execution_time_ms):
-                    no_cost_plan = optimization.execution_plan.get_no_cost_plan()
-                    for plan_line in plan_heatmap.values():
-                        for optimization_line in no_cost_plan.split("->"):
-                            if SequenceMatcher(
-                                    a=optimization.execution_plan.get_no_tree_plan_str(
-                                        plan_line['str']),
-                                    b=optimization.execution_plan.get_no_tree_plan_str(
-                                        optimization_line)
-                            ).ratio() > 0.9:
-                                plan_line['weight'] += 1
+            node_weights = collections.Counter()
+            for optimization in self.get_analysis(config).near_best_optimizations:
+                node_weights.update({self.get_node_signature(optimization_line)
+                                     for optimization_line in
+                                     optimization.execution_plan.get_no_cost_plan().split("->")})
+
+            for plan_line in plan_heatmap.values():
+                plan_line['weight'] = node_weights[self.get_node_signature(plan_line['str'])]
 
         self.execution_plan_heatmap = plan_heatmap
 
         return plan_heatmap
 
+    @staticmethod
+    def get_node_signature(plan_line):
+        # node title without costs, conditions on the following lines are ignored
+        return plan_line.strip().split("\n", 1)[0].strip()
+
+    def get_plan_digest(self):
+        if self.execution_plan and self.execution_plan.plan_digest != EMPTY_PLAN_DIGEST:
+            return self.execution_plan.plan_digest
+
+        return None
+
     def get_best_optimization(self, config):
         best_optimization = self
         if best_optimization.optimizations:
@@ -292,6 +722,33 @@ class PostgresQuery(Query):
 
         return best_optimization
 
+    def get_analysis(self, config):
+        """
+        Computes best and near best optimizations with a single pass over optimizations,
+        the result is cached and shared by all report sections until timings are changed
+        by use_estimator or the analysis is requested with other skip deltas.
+        """
+        analysis_key = (config.skip_percentage_delta, config.skip_timeout_delta)
+        if self._analysis and self._analysis_key == analysis_key:
+            return self._analysis
+
+        best_optimization = self.get_best_optimization(config)
+        self._analysis = QueryAnalysis(
+            best_optimization=best_optimization,
+            near_best_optimizations=[optimization for optimization in self.optimizations or []
+                                     if allowed_diff(config, best_optimization.execution_time_ms,
+                                                     optimization.execution_time_ms)],
+            score=best_optimization.execution_time_ms / self.execution_time_ms
+            if self.execution_time_ms != 0 else -1,
+            better_plan_found=not allowed_diff(config, self.execution_time_ms,
+                                               best_optimization.execution_time_ms),
+            same_plan=self.compare_plans(best_optimization.execution_plan),
+            default_plan_digest=self.get_plan_digest(),
+            best_plan_digest=best_optimization.get_plan_digest())
+        self._analysis_key = analysis_key
+
+        return self._analysis
+
 
 @dataclasses.dataclass
 class PostgresOptimization(PostgresQuery, Optimization):
@@ -301,10 +758,10 @@ class PostgresOptimization(PostgresQuery, Optimization):
         return f"/*+ {self.explain_hints} */ {self.query}"
 
     def get_explain(self):
-        return f"{Config().explain_clause}  /*+ {self.explain_hints} */ {self.query}"
+        return f"{get_explain_clause()}  /*+ {self.explain_hints} */ {self.query}"
 
     def get_heuristic_explain(self):
-        return f"EXPLAIN /*+ {self.explain_hints} */ {self.query}"
+        return f"{get_explain_clause('EXPLAIN')} /*+ {self.explain_hints} */ {self.query}"
 
 
 @dataclasses.dataclass
@@ -345,15 +802,19 @@ class PostgresExecutionPlan(ExecutionPlan):
         return self.full_str
 
     def get_estimated_cost(self):
+        if self.plan_tree:
+            return self.plan_tree.total_cost
+
         try:
-            matches = re.finditer(r"\s\(cost=\d+\.\d+\.\.(\d+\.\d+)", self.full_str,
-                                  re.MULTILINE)
-            for matchNum, match in enumerate(matches, start=1):
-                return float(match.groups()[0])
+            if match := PLAN_ESTIMATED_COST.search(self.full_str):
+                return float(match.group(1))
         except Exception as e:
             return 0
 
     def get_rpc_calls(self, execution_plan: 'ExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("read_requests"))
+
         try:
             return int(re.sub(
                 PLAN_RPC_CALLS, '',
@@ -362,6 +823,9 @@ class PostgresExecutionPlan(ExecutionPlan):
             return 0
 
     def get_rpc_wait_times(self, execution_plan: 'PostgresExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("read_wait_time"))
+
         try:
             return int(
                 re.sub(PLAN_RPC_WAIT_TIMES, '',
@@ -370,6 +834,9 @@ class PostgresExecutionPlan(ExecutionPlan):
             return 0
 
     def get_scanned_rows(self, execution_plan: 'PostgresExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("rows_scanned"))
+
         try:
             return int(
                 re.sub(PLAN_DOCDB_SCANNED_ROWS, '',
@@ -386,8 +853,8 @@ class PostgresExecutionPlan(ExecutionPlan):
             return 0
 
     def get_no_cost_plan(self, execution_plan: 'PostgresExecutionPlan' = None):
-        return re.sub(PLAN_CLEANUP_REGEX, '',
-                      execution_plan.full_str if execution_plan else self.full_str).strip()
+        return PLAN_CLEANUP_REGEX.sub('', execution_plan.full_str if execution_plan
+                                      else self.full_str).strip()
 
     def get_no_tree_plan(self, execution_plan: 'PostgresExecutionPlan' = None):
         return self.get_no_tree_plan_str(
@@ -395,12 +862,115 @@ class PostgresExecutionPlan(ExecutionPlan):
 
     @staticmethod
     def get_no_tree_plan_str(plan_str):
-        return re.sub(PLAN_TREE_CLEANUP, '\n', plan_str).strip()
+        return PLAN_TREE_CLEANUP.sub('\n', plan_str).strip()
 
     def get_clean_plan(self, execution_plan: Type['ExecutionPlan'] = None):
-        no_tree_plan = re.sub(PLAN_TREE_CLEANUP, '\n',
-                              execution_plan.full_str if execution_plan else self.full_str).strip()
-        return re.sub(PLAN_CLEANUP_REGEX, '', no_tree_plan).strip()
+        if execution_plan is not None and execution_plan is not self:
+            return execution_plan.get_clean_plan()
+
+        # cleaned once per plan, storage metrics of structured plans are not part of plan shape
+        if self._clean_plan is None:
+            self._clean_plan = self.get_clean_plan_str(
+                "\n".join(get_plan_lines(self.plan_tree, with_metrics=False))
+                if self.plan_tree else self.full_str)
+
+        return self._clean_plan
+
+    @staticmethod
+    def get_clean_plan_str(plan_str):
+        no_tree_plan = PLAN_TREE_CLEANUP.sub('\n', plan_str).strip()
+        return PLAN_CLEANUP_REGEX.sub('', no_tree_plan).strip()
+
+    def get_plan_shape(self):
+        if self.plan_tree:
+            return self.get_clean_plan()
+
+        # text plans keep only node titles and properties captured from structured plans,
+        # so that text and JSON plans of the same shape get the same digest
+        return "\n".join(
+            line for line in self.get_clean_plan().split("\n")
+            if not PLAN_SUBPLAN_LINE.match(line) and
+            (not (prop := PLAN_PROPERTY_LINE.match(line)) or prop.group(1) in PLAN_JSON_PROPERTIES))
+
+    def get_plan_nodes(self):
+        """
+        Returns plan nodes in post-order as (node line, children indices) pairs,
+        property lines like filters and conditions are skipped.
+        """
+        lines = []
+        for line in self.full_str.split("\n"):
+            if line.strip().startswith("->"):
+                lines.append((line.find("->"), line.strip()[2:].strip()))
+            elif not lines and line.strip():
+                lines.append((-1, line.strip()))
+
+        nodes = []
+        stack = []
+
+        def close_node():
+            _, node_line, children = stack.pop()
+            nodes.append((node_line, children))
+            if stack:
+                stack[-1][2].append(len(nodes) - 1)
+
+        for level, node_line in lines:
+            while stack and stack[-1][0] >= level:
+                close_node()
+            stack.append((level, node_line, []))
+
+        while stack:
+            close_node()
+
+        return nodes
+
+    def get_subtree_hashes(self):
+        # plan nodes are signed by node type and relation, properties and conditions are ignored
+        subtree_hashes = []
+        for node_line, children in self.get_plan_nodes():
+            subtree_hashes.append(get_md5(
+                f"{PLAN_NODE_PROPERTIES.sub('', node_line)}"
+                f"({','.join(subtree_hashes[child] for child in children)})"))
+
+        return collections.Counter(subtree_hashes)
+
+    def get_join_cardinalities(self):
+        """
+        Returns actual number of rows produced by each join of EXPLAIN ANALYZE plan
+        keyed by the set of joined relation aliases.
+        """
+        if self.plan_tree:
+            join_cardinalities = {}
+            self.collect_join_cardinalities(self.plan_tree, join_cardinalities)
+            return join_cardinalities
+
+        join_cardinalities = {}
+        subtree_aliases = []
+        for node_line, children in self.get_plan_nodes():
+            aliases = frozenset().union(*(subtree_aliases[child] for child in children))
+            if relation := PLAN_NODE_RELATION.search(PLAN_NODE_PROPERTIES.sub('', node_line)):
+                aliases |= {relation.group(2) or relation.group(1)}
+            subtree_aliases.append(aliases)
+
+            if PLAN_INNER_JOIN.match(PLAN_NODE_PROPERTIES.sub('', node_line)) and \
+                    len(aliases) > 1 and (actual_rows := PLAN_NODE_ACTUAL_ROWS.search(node_line)):
+                # actual rows are averaged over loops
+                join_cardinalities.setdefault(
+                    aliases, int(actual_rows.group(1)) * int(actual_rows.group(2)))
+
+        return join_cardinalities
+
+    def collect_join_cardinalities(self, node: PlanNode, join_cardinalities):
+        aliases = frozenset().union(*(self.collect_join_cardinalities(child, join_cardinalities)
+                                      for child in node.children or []))
+        if node.alias or node.relation:
+            aliases |= {node.alias or node.relation}
+
+        if PLAN_INNER_JOIN.match(node.node_type) and node.join_type in (None, "Inner") and \
+                len(aliases) > 1 and node.actual_rows is not None:
+            join_cardinalities.setdefault(
+                aliases, round(node.actual_rows * (node.actual_loops or 1)))
+
+        return aliases
 
 
 @dataclasses.dataclass
@@ -409,36 +979,168 @@ class PGListOfOptimizations(ListOfOptimizations):
         super().__init__(config, query)
 
         # todo rework this
-        self.leading = Leading(self.config, query.tables)
-        self.leading.construct()
+        self.leading = Leading(self.config, query.tables, query.query)
 
-    def get_all_optimizations(self) -> List[Optimization]:
-        optimizations = []
-        for leading_join in self.leading.joins:
+    def get_candidate_hints(self):
+        has_joins = False
+        for leading_join in self.leading.construct():
+            has_joins = True
             for table_scan_hint in itertools.product(*self.leading.table_scan_hints):
-                explain_hints = f"{leading_join} {' '.join(table_scan_hint)}"
-
-                self.add_optimization(explain_hints, optimizations)
+                yield f"{leading_join} {' '.join(table_scan_hint)}"
 
-        if not optimizations and self.leading.table_scan_hints:
+        if not has_joins and self.leading.table_scan_hints:
             # case w/o any joins
             for table_scan_hint in itertools.product(*self.leading.table_scan_hints):
-                explain_hints = f"{' '.join(table_scan_hint)}"
-
-                self.add_optimization(explain_hints, optimizations)
-
-        return optimizations
-
-    def add_optimization(self, explain_hints, optimizations):
-        skip_optimization = self.filter_optimization_tips(explain_hints)
-        if not skip_optimization:
-            optimizations.append(
-                PostgresOptimization(
-                    query=self.query.query,
-                    query_hash=self.query.query_hash,
-                    explain_hints=explain_hints
-                )
-            )
+                yield f"{' '.join(table_scan_hint)}"
+
+    def create_optimization(self, explain_hints):
+        return PostgresOptimization(
+            query=self.query.query,
+            query_hash=self.query.query_hash,
+            explain_hints=explain_hints
+        )
+
+
+# consecutive restarts without new explored states before hill climbing gives up
+HILL_CLIMBING_MAX_IDLE_RESTARTS = 100
+
+
+class SearchStrategy:
+    """
+    Explores hints space of a query using fitness function, which takes a batch of optimizations
+    and returns their estimated costs (lower is better) or None if optimization can't be explained.
+    Batches are up to workers size, so that they can be explained in parallel.
+    Returns all optimizations that were explained in exploration order.
+    """
+
+    def __init__(self, config: Config, list_of_optimizations: PGListOfOptimizations):
+        self.config = config
+        self.list_of_optimizations = list_of_optimizations
+
+    def search(self, fitness, is_stopped) -> List[Optimization]:
+        pass
+
+
+class HillClimbingSearch(SearchStrategy):
+    """
+    Randomized restart hill climbing over left-deep join order, join methods and scans.
+    Each climb starts from a random join order without cross products (if join graph
+    is known) and moves to the first neighbour with lower estimated cost: adjacent tables
+    swap, another join method or another scan for one table. Neighbours are explained
+    in batches of workers size and the cheapest improving one of a batch is taken.
+    Stops after search_budget distinct optimizations are explained
+    or when a series of restarts explores nothing new.
+    """
+
+    def __init__(self, config: Config, list_of_optimizations: PGListOfOptimizations):
+        super().__init__(config, list_of_optimizations)
+
+        self.leading = list_of_optimizations.leading
+        self.query = list_of_optimizations.query
+        self.random = random.Random(self.query.query_hash)
+        self.aliases = [table.alias for table in self.leading.alias_to_table]
+        self.join_graph = get_join_graph(self.query.query, self.aliases)
+        self.scan_options = [self.leading.get_table_scan_hints(table)
+                             for table in self.leading.alias_to_table]
+        self.batch_size = max(config.workers or 1, 1)
+
+        self.costs = {}
+        self.optimizations = []
+
+    def search(self, fitness, is_stopped) -> List[Optimization]:
+        idle_restarts = 0
+        while len(self.costs) < self.config.search_budget and not is_stopped():
+            explored_before = len(self.costs)
+            self.climb(self.get_random_state(), fitness, is_stopped)
+
+            # a restart could land in an explored basin, only a series of them
+            # means that the reachable states are exhausted
+            idle_restarts = idle_restarts + 1 if len(self.costs) == explored_before else 0
+            if idle_restarts >= HILL_CLIMBING_MAX_IDLE_RESTARTS:
+                break
+
+        return self.optimizations
+
+    def climb(self, state, fitness, is_stopped):
+        cost = self.get_costs([state], fitness)[0]
+        while len(self.costs) < self.config.search_budget and not is_stopped():
+            neighbours = list(self.get_neighbours(state))
+            self.random.shuffle(neighbours)
+
+            for idx in range(0, len(neighbours), self.batch_size):
+                if len(self.costs) >= self.config.search_budget or is_stopped():
+                    return
+
+                batch = neighbours[idx:idx + self.batch_size]
+                neighbour_cost, neighbour = min(zip(self.get_costs(batch, fitness), batch),
+                                                key=lambda cost_and_state: cost_and_state[0])
+                if neighbour_cost < cost:
+                    state, cost = neighbour, neighbour_cost
+                    break
+            else:
+                # local optimum
+                return
+
+    def get_costs(self, states, fitness):
+        # states over the search budget are not explained and get infinite cost
+        explained = {}
+        for state in states:
+            explain_hints = self.leading.construct_hints(*state)
+            if explain_hints in self.costs or explain_hints in explained:
+                continue
+
+            if len(self.costs) + len(explained) >= self.config.search_budget:
+                break
+
+            if self.list_of_optimizations.filter_optimization_tips(explain_hints):
+                self.costs[explain_hints] = float("inf")
+            else:
+                explained[explain_hints] = \
+                    self.list_of_optimizations.create_optimization(explain_hints)
+
+        if explained:
+            self.optimizations += explained.values()
+            for explain_hints, cost in zip(explained, fitness(list(explained.values()))):
+                self.costs[explain_hints] = float("inf") if cost is None else cost
+
+        return [self.costs.get(self.leading.construct_hints(*state), float("inf"))
+                for state in states]
+
+    def get_random_state(self):
+        tables_order = [self.random.choice(self.aliases)]
+        while len(tables_order) < len(self.aliases):
+            remaining = [alias for alias in self.aliases if alias not in tables_order]
+            connected = [alias for alias in remaining
+                         if self.join_graph[alias] & set(tables_order)]
+            tables_order.append(self.random.choice(connected or remaining))
+
+        joins = [self.random.choice(list(Joins)) for _ in range(len(self.aliases) - 1)]
+        scans = [self.random.choice(options) for options in self.scan_options]
+
+        return tables_order, joins, scans
+
+    def get_neighbours(self, state):
+        tables_order, joins, scans = state
+
+        for idx in range(len(tables_order) - 1):
+            swapped = list(tables_order)
+            swapped[idx], swapped[idx + 1] = swapped[idx + 1], swapped[idx]
+            yield swapped, joins, scans
+
+        for idx, join in enumerate(joins):
+            for other_join in Joins:
+                if other_join != join:
+                    yield tables_order, joins[:idx] + [other_join] + joins[idx + 1:], scans
+
+        for idx, scan in enumerate(scans):
+            for other_scan in self.scan_options[idx]:
+                if other_scan != scan:
+                    yield tables_order, joins, scans[:idx] + [other_scan] + scans[idx + 1:]
+
+
+SEARCH_STRATEGIES = {
+    "hill-climbing": HillClimbingSearch,
+}
 
 
 class PostgresListOfQueries(ListOfQueries):
@@ -17,15 +17,15 @@ JDBC_STRING_PARSE = r'\/\/(((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]
 
 ENABLE_STATISTICS_HINT = "SET yb_enable_optimizer_statistics = true;"
 
-PLAN_CLEANUP_REGEX = r"\s\(actual time.*\)|\s\(never executed\)|\s\(cost.*\)|" \
-                     r"\sMemory:.*|Planning Time.*|Execution Time.*|Peak Memory Usage.*|" \
-                     r"Read RPC Count:.*|Read RPC Wait Time:.*|DocDB Scanned Rows:.*|" \
-                     r".*Partial Aggregate:.*|YB\s|Remote\s|" \
-                     r"JIT:.*|\s+Functions:.*|\s+Options:.*|\s+Timing:.*"  # PG14 JIT info
-PLAN_RPC_CALLS = r"\nRead RPC Count:\s(\d+)"
-PLAN_RPC_WAIT_TIMES = r"\nRead RPC Wait Time:\s([+-]?([0-9]*[.])?[0-9]+)"
-PLAN_DOCDB_SCANNED_ROWS = r"\nDocDB Scanned Rows:\s(\d+)"
-PLAN_PEAK_MEMORY = r"\nPeak memory:\s(\d+)"
+PLAN_CLEANUP_REGEX = re.compile(r"\s\(actual time.*\)|\s\(never executed\)|\s\(cost.*\)|"
+                                r"\sMemory:.*|Planning Time.*|Execution Time.*|Peak Memory Usage.*|"
+                                r"Read RPC Count:.*|Read RPC Wait Time:.*|DocDB Scanned Rows:.*|"
+                                r".*Partial Aggregate:.*|YB\s|Remote\s|"
+                                r"JIT:.*|\s+Functions:.*|\s+Options:.*|\s+Timing:.*")  # PG14 JIT info
+PLAN_RPC_CALLS = re.compile(r"\nRead RPC Count:\s(\d+)")
+PLAN_RPC_WAIT_TIMES = re.compile(r"\nRead RPC Wait Time:\s([+-]?([0-9]*[.])?[0-9]+)")
+PLAN_DOCDB_SCANNED_ROWS = re.compile(r"\nDocDB Scanned Rows:\s(\d+)")
+PLAN_PEAK_MEMORY = re.compile(r"\nPeak memory:\s(\d+)")
 
 
 def yb_db_factory(config):
@@ -62,6 +62,10 @@ class Yugabyte(Postgres):
         self.logger.debug(f"Setting statement timeout to {timeout} seconds")
         evaluate_sql(cur, f"SET statement_timeout = '{timeout}s'")
 
+    def set_query_timeout_ms(self, cur, timeout_ms):
+        self.logger.debug(f"Setting statement timeout to {int(timeout_ms)} ms")
+        evaluate_sql(cur, f"SET statement_timeout = '{int(timeout_ms)}ms'")
+
     def change_version_and_compile(self, revision_or_path=None):
         pass
 
@@ -77,8 +81,8 @@ class Yugabyte(Postgres):
     def call_upgrade_ysql(self):
         pass
 
-    def get_execution_plan(self, execution_plan: str):
-        return YugabyteExecutionPlan(execution_plan)
+    def get_execution_plan(self, execution_plan: str, plan_tree=None):
+        return YugabyteExecutionPlan(execution_plan, plan_tree)
 
 
 class YugabyteQuery(PostgresQuery):
@@ -87,6 +91,9 @@ class YugabyteQuery(PostgresQuery):
 
 class YugabyteExecutionPlan(PostgresExecutionPlan):
     def get_rpc_calls(self, execution_plan: 'ExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("read_requests"))
+
         try:
             return int(re.sub(
                 PLAN_RPC_CALLS, '',
@@ -95,6 +102,9 @@ class YugabyteExecutionPlan(PostgresExecutionPlan):
             return 0
 
     def get_rpc_wait_times(self, execution_plan: 'ExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("read_wait_time"))
+
         try:
             return int(
                 re.sub(PLAN_RPC_WAIT_TIMES, '',
@@ -103,6 +113,9 @@ class YugabyteExecutionPlan(PostgresExecutionPlan):
             return 0
 
     def get_scanned_rows(self, execution_plan: 'ExecutionPlan' = None):
+        if plan_tree := (execution_plan or self).plan_tree:
+            return int(plan_tree.get_total("rows_scanned"))
+
         try:
             return int(
                 re.sub(PLAN_DOCDB_SCANNED_ROWS, '',
@@ -119,12 +132,12 @@ class YugabyteExecutionPlan(PostgresExecutionPlan):
             return 0
 
     def get_no_tree_plan_str(self, plan_str):
-        return re.sub(PLAN_TREE_CLEANUP, '\n', plan_str).strip()
+        return PLAN_TREE_CLEANUP.sub('\n', plan_str).strip()
 
-    def get_clean_plan(self, execution_plan: 'ExecutionPlan' = None):
-        no_tree_plan = re.sub(PLAN_TREE_CLEANUP, '\n',
-                              execution_plan.full_str if execution_plan else self.full_str).strip()
-        return re.sub(PLAN_CLEANUP_REGEX, '', no_tree_plan).strip()
+    @staticmethod
+    def get_clean_plan_str(plan_str):
+        no_tree_plan = PLAN_TREE_CLEANUP.sub('\n', plan_str).strip()
+        return PLAN_CLEANUP_REGEX.sub('', no_tree_plan).strip()
 
 
 class YugabyteLocalCluster(Yugabyte):
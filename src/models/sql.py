@@ -10,7 +10,7 @@ from sqlparse.sql import Comment
 from tqdm import tqdm
 
 from config import DDLStep
-from objects import QueryTips, Field
+from objects import QueryTips, Field, Index
 from db.postgres import PostgresQuery, Table
 from models.abstract import QTFModel
 from utils import get_alias_table_names, evaluate_sql, get_md5
@@ -171,21 +171,27 @@ class SQLModel(QTFModel):
                     and t.relname like '{table_name}'
                 order by
                     t.relname,
-                    i.relname;
+                    i.relname,
+                    array_position(ix.indkey::int2[], a.attnum);
                 """
             )
 
             fields = []
+            indexes = {}
 
             result = list(cur.fetchall())
             try:
                 for column in columns:
                     is_indexed = any(column == row[2] for row in result)
                     fields.append(Field(column, is_indexed))
+
+                for _, index_name, column_name in result:
+                    indexes.setdefault(index_name, Index(index_name, [])).columns.append(column_name)
             except Exception as e:
                 self.logger.exception(result, e)
 
-            created_tables.append(Table(name=table_name, fields=fields, size=0))
+            created_tables.append(Table(name=table_name, fields=fields, size=0,
+                                        indexes=list(indexes.values())))
 
         return created_tables
 
@@ -1,6 +1,9 @@
 import dataclasses
+import hashlib
+import itertools
 import json
 import os
+import random
 from typing import List, Dict, Type
 
 from dacite import Config as DaciteConfig
@@ -8,6 +11,15 @@ from dacite import from_dict
 
 from config import Config
 
+RESULTS_FORMAT = "taqo-jsonl"
+RESULTS_FORMAT_VERSION = 1
+# bump on plan cleanup changes, so that digests stored in older results are recomputed on load
+PLAN_DIGEST_VERSION = 2
+# header is always written first, so the format is recognized without parsing the whole file
+RESULTS_HEADER_PREFIX = f'{{"format": "{RESULTS_FORMAT}"'
+# marks JSON lines records of queries skipped by the run budget
+SKIPPED_RECORD_KEY = "skipped"
+
 
 @dataclasses.dataclass
 class Field:
@@ -15,12 +27,19 @@ class Field:
     is_index: bool = None
 
 
+@dataclasses.dataclass
+class Index:
+    name: str = None
+    columns: List[str] = None
+
+
 @dataclasses.dataclass
 class Table:
     alias: str = None
     name: str = None
     fields: List[Field] = None
     size: int = 0
+    indexes: List[Index] = None
 
 
 @dataclasses.dataclass
@@ -31,6 +50,51 @@ class QueryTips:
     max_timeout: str = dataclasses.field(default_factory=str)
 
 
+@dataclasses.dataclass
+class ExecutionStats:
+    p50: float = 0
+    p90: float = 0
+    p99: float = 0
+    min: float = 0
+    stddev: float = 0
+    mad: float = 0
+    trimmed_mean: float = 0
+
+
+@dataclasses.dataclass
+class SearchStats:
+    total: int = 0
+    timed: int = 0
+    pruned: int = 0
+    deduplicated: int = 0
+    # optimizations reached by the search before query budget was exhausted
+    evaluated: int = None
+    # clusters of similar plans when only cluster medoids are timed
+    clusters: int = None
+
+
+@dataclasses.dataclass
+class QueryAnalysis:
+    best_optimization: 'Query' = None
+    # optimizations within skip_percentage_delta from the best one
+    near_best_optimizations: List['Query'] = None
+    # best to default execution time ratio, -1 if default query was not timed
+    score: float = -1
+    better_plan_found: bool = False
+    same_plan: bool = False
+    # plan digests of the default and the best plans, None if the plan was not captured
+    default_plan_digest: str = None
+    best_plan_digest: str = None
+
+    def same_default_plan(self, other: 'QueryAnalysis'):
+        return self.default_plan_digest is not None and \
+            self.default_plan_digest == other.default_plan_digest
+
+    def same_best_plan(self, other: 'QueryAnalysis'):
+        return self.best_plan_digest is not None and \
+            self.best_plan_digest == other.best_plan_digest
+
+
 @dataclasses.dataclass
 class Query:
     tag: str = ""
@@ -40,21 +104,53 @@ class Query:
 
     optimizer_tips: QueryTips = None
     explain_hints: str = ""
+    # hints reported as used and ignored by pg_hint_plan while planning the query
+    effective_hints: str = None
+    ignored_hints: str = None
 
     execution_plan: 'ExecutionPlan' = None
     execution_time_ms: float = 0
+    execution_time_precision: float = None
+    execution_times: List[float] = None
+    execution_stats: ExecutionStats = None
+    planning_time_ms: float = None
     result_cardinality: int = 0
     result_hash: str = None
+    cached: bool = False
 
     parameters: List = None
+    # number of server notices received while evaluating the query by severity
+    notices: Dict[str, int] = None
 
     optimizations: List['Query'] = None
+    search_stats: SearchStats = None
+    # default plan re-planned with true join cardinalities injected
+    true_cardinality_plan: 'Optimization' = None
 
     execution_plan_heatmap: Dict[int, Dict[str, str]] = None
 
+    def __post_init__(self):
+        # analysis of loaded results, not stored
+        self._analysis = None
+        self._analysis_key = None
+
     def get_query(self):
         return self.query
 
+    def use_estimator(self, estimator: str):
+        # mean is stored in execution_time_ms already
+        if estimator != "mean" and self.execution_stats and self.execution_time_ms > 0:
+            self.execution_time_ms = getattr(self.execution_stats, estimator)
+
+        for optimization in self.optimizations or []:
+            optimization.use_estimator(estimator)
+
+        if self.true_cardinality_plan:
+            self.true_cardinality_plan.use_estimator(estimator)
+
+        # timings changed, best and near best optimizations have to be recomputed
+        self._analysis = None
+
     def get_explain(self):
         return f"{Config.explain_clause} {self.query}"
 
@@ -67,16 +163,23 @@ class Query:
     def compare_plans(self, execution_plan: Type['ExecutionPlan']):
         pass
 
+    def get_plan_digest(self):
+        pass
+
     def heatmap(self):
         pass
 
     def get_best_optimization(self, config):
         pass
 
+    def get_analysis(self, config) -> QueryAnalysis:
+        pass
+
 
 @dataclasses.dataclass
 class Optimization(Query):
-    pass
+    # explain hints of the optimization with the same plan which measurements were reused
+    representative_hints: str = None
 
 
 @dataclasses.dataclass
@@ -108,9 +211,65 @@ class EPNode:
         return self.full_str
 
 
+@dataclasses.dataclass
+class PlanNode:
+    node_type: str = None
+    relation: str = None
+    alias: str = None
+    index: str = None
+    join_type: str = None
+    startup_cost: float = None
+    total_cost: float = None
+    plan_rows: float = None
+    plan_width: int = None
+    actual_rows: float = None
+    actual_loops: float = None
+    actual_startup_time: float = None
+    actual_total_time: float = None
+    # storage metrics reported by YB with DIST option
+    read_requests: float = None
+    read_wait_time: float = None
+    rows_scanned: float = None
+    # node title and conditions as they are shown in text plan
+    label: str = None
+    properties: List[str] = None
+    metrics: List[str] = None
+    children: List['PlanNode'] = None
+
+    def walk(self):
+        yield self
+        for child in self.children or []:
+            yield from child.walk()
+
+    def get_total(self, metric: str):
+        return sum(getattr(node, metric) or 0 for node in self.walk())
+
+    def get_signature(self):
+        # everything that defines the plan shape, costs and measurements are excluded
+        return f"{self.label}[{';'.join(self.properties or [])}]" \
+               f"({','.join(child.get_signature() for child in self.children or [])})"
+
+
 @dataclasses.dataclass
 class ExecutionPlan:
     full_str: str
+    # parsed plan tree if plan was captured in structured format
+    plan_tree: PlanNode = None
+    # versioned md5 of the plan shape, stored in results so that plans are compared without cleanup
+    plan_digest: str = None
+
+    def __post_init__(self):
+        self._clean_plan = None
+        if not (self.plan_digest or "").startswith(f"v{PLAN_DIGEST_VERSION}:"):
+            self.plan_digest = self.get_plan_digest(self.get_plan_shape() or "")
+
+    @staticmethod
+    def get_plan_digest(plan_shape: str):
+        return f"v{PLAN_DIGEST_VERSION}:{hashlib.md5(plan_shape.encode('utf-8')).hexdigest()}"
+
+    def get_plan_shape(self):
+        # cleaned plan reduced to what is same for text and structured plans
+        return self.get_clean_plan()
 
     def get_estimated_cost(self):
         pass
@@ -119,6 +278,13 @@ class ExecutionPlan:
         # todo get plan tree instead here to support plan comparison between DBs
         pass
 
+    def get_join_cardinalities(self):
+        return {}
+
+    def get_subtree_hashes(self):
+        # multiset of hashed plan subtrees, used to measure plans similarity
+        pass
+
 
 @dataclasses.dataclass
 class ListOfOptimizations:
@@ -129,8 +295,36 @@ class ListOfOptimizations:
         self.query = query
 
     def get_all_optimizations(self):
+        return list(self.iterate_optimizations())
+
+    def get_candidate_hints(self):
+        return iter(())
+
+    def create_optimization(self, explain_hints):
         pass
 
+    def iterate_optimizations(self):
+        """
+        Lazily generates optimizations: candidate hints, distinct by construction,
+        are filtered by accept/reject tips and sampled before any optimization object is created.
+        """
+        sampler = random.Random(self.query.query_hash)
+        sample_rate = self.config.optimizations_sample_rate
+
+        for explain_hints in self.get_candidate_hints():
+            if self.filter_optimization_tips(explain_hints):
+                continue
+
+            if sample_rate < 1 and sampler.random() >= sample_rate:
+                continue
+
+            yield self.create_optimization(explain_hints)
+
+    def iterate_batches(self):
+        optimizations = self.iterate_optimizations()
+        while batch := list(itertools.islice(optimizations, self.config.optimizations_batch_size)):
+            yield batch
+
     def filter_optimization_tips(self, explain_hints):
         skip_optimization = False
         if self.query.optimizer_tips:
@@ -159,13 +353,154 @@ class ResultsLoader:
     def __init__(self):
         self.clazz = ListOfQueries
 
-    def get_queries_from_previous_result(self, previous_execution_path):
+    def get_queries_from_previous_result(self, previous_execution_path, stream=False):
+        """
+        With stream queries of JSON lines results are yielded one by one during a single pass
+        instead of being loaded into a list, JSON results are always loaded as a whole.
+        """
+        with open(previous_execution_path, "r") as prev_result:
+            is_json_lines = prev_result.read(len(RESULTS_HEADER_PREFIX)) == RESULTS_HEADER_PREFIX
+            prev_result.seek(0)
+
+            if not is_json_lines:
+                loq = from_dict(self.clazz, json.load(prev_result),
+                                DaciteConfig(check_types=False))
+
+        if is_json_lines:
+            header = self.read_results_header(previous_execution_path)
+            loq = from_dict(self.clazz, {"db_version": header.get("db_version", ""),
+                                         "git_message": header.get("git_message", ""),
+                                         "model_queries": header.get("model_queries")},
+                            DaciteConfig(check_types=False))
+            loq.queries = self.iterate_queries_from_result(previous_execution_path)
+            if not stream:
+                loq.queries = list(loq.queries)
+
+        if (estimator := Config().estimator) and estimator != "mean":
+            if isinstance(loq.queries, list):
+                for query in loq.queries:
+                    query.use_estimator(estimator)
+            else:
+                loq.queries = self.use_estimator(loq.queries, estimator)
+
+        return loq
+
+    @staticmethod
+    def use_estimator(queries, estimator):
+        for query in queries:
+            query.use_estimator(estimator)
+            yield query
+
+    @staticmethod
+    def read_results_header(previous_execution_path):
+        with open(previous_execution_path, "r") as prev_result:
+            return json.loads(prev_result.readline())
+
+    def iterate_queries_from_result(self, previous_execution_path):
+        """
+        Lazily yields queries of JSON lines results one by one,
+        so that only a single query record is decoded at a time.
+        """
         with open(previous_execution_path, "r") as prev_result:
-            return from_dict(self.clazz, json.load(prev_result), DaciteConfig(check_types=False))
+            # skip header
+            prev_result.readline()
+            for line in prev_result:
+                if line.strip():
+                    yield self.get_query_from_record(json.loads(line))
+
+    def get_query_from_record(self, record):
+        # use the same typing as the results file
+        return from_dict(self.clazz, {"queries": [record]},
+                         DaciteConfig(check_types=False)).queries[0]
+
+    @staticmethod
+    def get_results_path(output_json_name: str):
+        extension = "jsonl" if Config().results_format == "jsonl" else "json"
+        return f"report/{output_json_name}.{extension}"
 
     def store_queries_to_file(self, queries: Type[ListOfQueries], output_json_name: str):
         if not os.path.isdir("report"):
             os.mkdir("report")
 
-        with open(f"report/{output_json_name}.json", "w") as result_file:
+        if Config().results_format == "jsonl":
+            self.start_checkpoint(queries, output_json_name, queries.queries or [])
+            return
+
+        with open(self.get_results_path(output_json_name), "w") as result_file:
             result_file.write(json.dumps(queries, cls=EnhancedJSONEncoder))
+
+    @staticmethod
+    def get_results_header(queries: Type[ListOfQueries]):
+        return {"format": RESULTS_FORMAT,
+                "version": RESULTS_FORMAT_VERSION,
+                "db_version": queries.db_version,
+                "git_message": queries.git_message,
+                "model_queries": queries.model_queries}
+
+    def get_checkpoint_path(self, output_json_name: str):
+        # JSON lines results are written query by query, so they are the checkpoint themselves
+        if Config().results_format == "jsonl":
+            return self.get_results_path(output_json_name)
+
+        return f"report/{output_json_name}.checkpoint"
+
+    def start_checkpoint(self, queries: Type[ListOfQueries], output_json_name: str,
+                         completed_queries: List[Query] = ()):
+        """
+        Starts checkpoint with JSON lines results header followed by already completed queries.
+        Checkpoint is written to a temporary file first, so the previous one is kept until
+        the new one is complete.
+        """
+        if not os.path.isdir("report"):
+            os.mkdir("report")
+
+        checkpoint_path = self.get_checkpoint_path(output_json_name)
+        with open(f"{checkpoint_path}.tmp", "w") as checkpoint_file:
+            checkpoint_file.write(json.dumps(self.get_results_header(queries)) + "\n")
+            for query in completed_queries:
+                checkpoint_file.write(json.dumps(query, cls=EnhancedJSONEncoder) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+        os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+    def append_query_to_checkpoint(self, query: Type[Query], output_json_name: str,
+                                   skipped: bool = False):
+        record = dataclasses.asdict(query)
+        if skipped:
+            # kept to preserve queries order, but evaluated again on resume
+            record[SKIPPED_RECORD_KEY] = True
+
+        with open(self.get_checkpoint_path(output_json_name), "a") as checkpoint_file:
+            checkpoint_file.write(json.dumps(record, cls=EnhancedJSONEncoder) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+    def get_queries_from_checkpoint(self, output_json_name: str):
+        model_queries = []
+        queries = []
+        with open(self.get_checkpoint_path(output_json_name), "r") as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last record could be partially written if run was interrupted
+                    Config().logger.warning("Skipping malformed checkpoint record")
+                    continue
+
+                if "model_queries" in record:
+                    model_queries = record["model_queries"]
+                elif not record.get(SKIPPED_RECORD_KEY):
+                    queries.append(record)
+
+        # use the same typing as the results file
+        loq = from_dict(self.clazz, {"model_queries": model_queries, "queries": queries},
+                        DaciteConfig(check_types=False))
+
+        return loq.model_queries, loq.queries
+
+    def remove_checkpoint(self, output_json_name: str):
+        checkpoint_path = self.get_checkpoint_path(output_json_name)
+        if checkpoint_path != self.get_results_path(output_json_name) and \
+                os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
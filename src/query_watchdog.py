@@ -0,0 +1,68 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class CancelWatchdog:
+    """
+    Cancels running statement from the client side if it is not finished within
+    statement timeout plus grace period, e.g. because result fetch or network is stalled
+    and server side statement_timeout does not fire.
+    """
+
+    def __init__(self, conn, grace_ms: int):
+        self.conn = conn
+        self.grace_ms = grace_ms
+        self.timeout_ms = None
+        self.num_cancelled = 0
+
+        self.deadline = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def watch(self):
+        if not self.timeout_ms:
+            yield
+            return
+
+        with self.condition:
+            self.deadline = time.monotonic() + (self.timeout_ms + self.grace_ms) / 1000
+            self.condition.notify()
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.deadline = None
+                self.condition.notify()
+
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                if self.deadline is None:
+                    self.condition.wait()
+                elif (remaining := self.deadline - time.monotonic()) > 0:
+                    self.condition.wait(remaining)
+                else:
+                    self.deadline = None
+                    self.num_cancelled += 1
+                    self.conn.cancel()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.thread.join()
+
+
+@contextmanager
+def watch(watchdog: CancelWatchdog = None):
+    if watchdog:
+        with watchdog.watch():
+            yield
+    else:
+        yield
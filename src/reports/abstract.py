@@ -3,6 +3,7 @@ import os
 import shutil
 import subprocess
 import time
+from itertools import zip_longest
 from pathlib import Path
 
 from config import Config
@@ -50,6 +51,31 @@ class Report:
             self._end_source()
             self._end_collapsible()
 
+    @staticmethod
+    def pair_queries(loq, pg_loq=None):
+        """
+        Queries of both results are iterated side by side, so that results
+        streamed from JSON lines files are read in a single pass.
+        """
+        if not pg_loq:
+            for query in loq.queries:
+                yield query, None
+            return
+
+        for query, pg_query in zip_longest(loq.queries, pg_loq.queries):
+            if query is None or pg_query is None:
+                raise AttributeError("Number of queries is not matching, check input files")
+            yield query, pg_query
+
+    def _render(self, render, *args):
+        # renders a part of the report separately, so that it can be placed later
+        report, self.report = self.report, ""
+        try:
+            render(*args)
+            return self.report
+        finally:
+            self.report = report
+
     def _add_double_newline(self):
         self.report += "\n\n"
 
@@ -80,6 +106,15 @@ class Report:
     def _end_collapsible(self):
         self.report += """\n====\n\n"""
 
+    @staticmethod
+    def _cached_mark(query):
+        return " (cached)" if query.cached else ""
+
+    @staticmethod
+    def _hints(query):
+        # hints ignored by pg_hint_plan are not shown if usage is known
+        return query.effective_hints if query.effective_hints is not None else query.explain_hints
+
     @staticmethod
     def _get_plan_diff(original, changed):
         return "\n".join(
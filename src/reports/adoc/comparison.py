@@ -98,7 +98,7 @@ class ComparisonReport(Report):
         self.report += f"Estimated cost|{yb_query.execution_plan.get_estimated_cost()}|{pg_query.execution_plan.get_estimated_cost()}"
         self._end_table_row()
         self._start_table_row()
-        self.report += f"Execution time|{yb_query.execution_time_ms}|{pg_query.execution_time_ms}"
+        self.report += f"Execution time|{yb_query.execution_time_ms}{self._cached_mark(yb_query)}|{pg_query.execution_time_ms}{self._cached_mark(pg_query)}"
         self._end_table_row()
         self._end_table()
 
@@ -21,7 +21,10 @@ class RegressionReport(Report):
 
         self.v1_name = None
         self.v2_name = None
-        self.queries = {}
+        # queries are rendered right away, only report rows and per tag counters are kept
+        self.query_rows = {}
+        self.query_details = {}
+        self.tag_summaries = {}
         self.short_summary = ShortSummaryReport()
 
     @classmethod
@@ -36,7 +39,7 @@ class RegressionReport(Report):
         report.define_version(loq_v1.db_version, loq_v2.db_version)
         report.report_model(loq_v1.model_queries)
 
-        for query in zip(loq_v1.queries, loq_v2.queries):
+        for query in report.pair_queries(loq_v1, loq_v2):
             if query[0].query_hash != query[1].query_hash:
                 raise AttributeError("Query hashes are not mathing, check input files")
 
@@ -54,10 +57,20 @@ class RegressionReport(Report):
                        f"First:\n{first_version}\n\nSecond:\n{second_version}\n====\n\n"
 
     def add_query(self, first_query: Query, second_query: Query):
-        if first_query.tag not in self.queries:
-            self.queries[first_query.tag] = [[first_query, second_query], ]
-        else:
-            self.queries[first_query.tag].append([first_query, second_query])
+        tag = first_query.tag
+        first_plan, second_plan = first_query.execution_plan, second_query.execution_plan
+
+        summary = self.tag_summaries.setdefault(tag, ShortSummaryReport())
+        summary.diff_plans += not first_query.compare_plans(second_plan)
+        summary.diff_rpc_calls += first_plan.get_rpc_calls() != second_plan.get_rpc_calls()
+        summary.diff_wait_times += first_plan.get_rpc_wait_times() != second_plan.get_rpc_wait_times()
+        summary.diff_scanned_rows += first_plan.get_scanned_rows() != second_plan.get_scanned_rows()
+        summary.diff_peak_memory += first_plan.get_peak_memory() != second_plan.get_peak_memory()
+
+        rows = self.query_rows.setdefault(tag, [])
+        rows.append(self._render(self.__report_summary_row, first_query, second_query, not rows))
+        self.query_details.setdefault(tag, []).append(
+            self._render(self.__report_query, first_query, second_query))
 
     def build_report(self):
         # link to top
@@ -71,48 +84,47 @@ class RegressionReport(Report):
         num_columns = 4
         self._start_table("1,1,1,4")
         self.report += f"|{self.v1_name}|{self.v2_name}|Ratio (Second/First)|Query\n"
-        for tag, queries in self.queries.items():
+        for tag, rows in self.query_rows.items():
             self.report += f"{num_columns}+m|{tag}.sql\n"
-            for query_id, query in enumerate(queries):
-                same_plan = query[0].compare_plans(query[1].execution_plan)
-                color = "[green]" if same_plan else "[orange]"
-                ratio = "{:.2f}".format(
-                    query[1].execution_time_ms / query[0].execution_time_ms
-                    if query[0].execution_time_ms != 0 else 0)
-
-                # insert anchor to the first query in file
-                self.report += "a|"
-                if query_id == 0:
-                    self.report += f"[#{tag}]\n"
-
-                # append all query stats
-                self.report += f"{query[0].execution_time_ms}\n" \
-                               f"|{query[1].execution_time_ms}\n" \
-                               f"a|{color}#*{ratio}*#\n"
-                self.report += f"a|[#{query[0].query_hash}_query]\n" \
-                               f"<<tags_summary, Go to tags summary>>\n\n" \
-                               f"<<{query[0].query_hash}>>\n"
-                self._start_source(["sql"])
-                self.report += format_sql(query[1].query.replace("|", "\|"))
-                self._end_source()
-                self.report += "\n"
-                self._end_table_row()
+            self.report += "".join(rows)
         self._end_table()
 
-        for tag, queries in self.queries.items():
+        for tag, details in self.query_details.items():
             self.report += f"\n== {tag} queries file\n\n"
-            for query in queries:
-                self.__report_query(query[0], query[1])
+            self.report += "".join(details)
+
+    def __report_summary_row(self, first_query: Query, second_query: Query, first_in_tag: bool):
+        same_plan = first_query.compare_plans(second_query.execution_plan)
+        color = "[green]" if same_plan else "[orange]"
+        ratio = "{:.2f}".format(
+            second_query.execution_time_ms / first_query.execution_time_ms
+            if first_query.execution_time_ms != 0 else 0)
+
+        # insert anchor to the first query in file
+        self.report += "a|"
+        if first_in_tag:
+            self.report += f"[#{first_query.tag}]\n"
+
+        # append all query stats
+        self.report += f"{first_query.execution_time_ms}\n" \
+                       f"|{second_query.execution_time_ms}\n" \
+                       f"a|{color}#*{ratio}*#\n"
+        self.report += f"a|[#{first_query.query_hash}_query]\n" \
+                       f"<<tags_summary, Go to tags summary>>\n\n" \
+                       f"<<{first_query.query_hash}>>\n"
+        self._start_source(["sql"])
+        self.report += format_sql(second_query.query.replace("|", "\|"))
+        self._end_source()
+        self.report += "\n"
+        self._end_table_row()
 
     def add_plan_comparison(self):
         self._start_collapsible("Plan comparison")
         self.report += "\n[#plans_summary]\n"
         self._start_table("2")
-        for tag, queries in self.queries.items():
-            num_same_plans = sum(1 for query in queries
-                                 if query[0].compare_plans(query[1].execution_plan))
+        for tag, summary in self.tag_summaries.items():
             self.report += f"a|<<{tag}>>\n"
-            self.short_summary.diff_plans = len(queries) - num_same_plans
+            self.short_summary.diff_plans = summary.diff_plans
             color = "[green]" if self.short_summary.diff_plans == 0 else "[orange]"
             self.report += f"a|{color}#*{self.short_summary.diff_plans}*#\n"
             self._end_table_row()
@@ -123,11 +135,8 @@ class RegressionReport(Report):
         self._start_collapsible("RPC Calls")
         self.report += "\n[#rpc_summary]\n"
         self._start_table("2")
-        for tag, queries in self.queries.items():
-            self.short_summary.diff_rpc_calls = sum(
-                query[0].execution_plan.get_rpc_calls() != query[1].execution_plan.get_rpc_calls()
-                for query in queries
-            )
+        for tag, summary in self.tag_summaries.items():
+            self.short_summary.diff_rpc_calls = summary.diff_rpc_calls
             self.report += f"a|<<{tag}>>\n"
             color = "[green]" if self.short_summary.diff_rpc_calls == 0 else "[orange]"
             self.report += f"a|{color}#*{self.short_summary.diff_rpc_calls}*#\n"
@@ -139,11 +148,8 @@ class RegressionReport(Report):
         self._start_collapsible("RPC Wait Times")
         self.report += "\n[#rpc_wait_summary]\n"
         self._start_table("2")
-        for tag, queries in self.queries.items():
-            self.short_summary.diff_wait_times = sum(
-                query[0].execution_plan.get_rpc_wait_times() != query[1].execution_plan.get_rpc_wait_times()
-                for query in queries
-            )
+        for tag, summary in self.tag_summaries.items():
+            self.short_summary.diff_wait_times = summary.diff_wait_times
             self.report += f"a|<<{tag}>>\n"
             color = "[green]" if self.short_summary.diff_wait_times == 0 else "[orange]"
             self.report += f"a|{color}#*{self.short_summary.diff_wait_times}*#\n"
@@ -155,14 +161,10 @@ class RegressionReport(Report):
         self._start_collapsible("Scanned rows")
         self.report += "\n[#rows_summary]\n"
         self._start_table("2")
-        for tag, queries in self.queries.items():
-            num_same_plans = sum(
-                query[0].execution_plan.get_scanned_rows() != query[1].execution_plan.get_scanned_rows()
-                for query in queries
-            )
+        for tag, summary in self.tag_summaries.items():
             self.report += f"a|<<{tag}>>\n"
-            color = "[green]" if num_same_plans == 0 else "[orange]"
-            self.report += f"a|{color}#*{num_same_plans}*#\n"
+            color = "[green]" if summary.diff_scanned_rows == 0 else "[orange]"
+            self.report += f"a|{color}#*{summary.diff_scanned_rows}*#\n"
             self._end_table_row()
         self._end_table()
         self._end_collapsible()
@@ -171,11 +173,8 @@ class RegressionReport(Report):
         self._start_collapsible("Peak memory")
         self.report += "\n[#memory_summary]\n"
         self._start_table("2")
-        for tag, queries in self.queries.items():
-            self.short_summary.diff_peak_memory = sum(
-                query[0].execution_plan.get_peak_memory() != query[1].execution_plan.get_peak_memory()
-                for query in queries
-            )
+        for tag, summary in self.tag_summaries.items():
+            self.short_summary.diff_peak_memory = summary.diff_peak_memory
             self.report += f"a|<<{tag}>>\n"
             color = "[green]" if self.short_summary.diff_peak_memory == 0 else "[orange]"
             self.report += f"a|{color}#*{self.short_summary.diff_peak_memory}*#\n"
@@ -210,7 +209,7 @@ class RegressionReport(Report):
         self.report += f"Optimizer cost|{first_query.execution_plan.get_estimated_cost()}|{second_query.execution_plan.get_estimated_cost()}"
         self._end_table_row()
         self._start_table_row()
-        self.report += f"Execution time|{first_query.execution_time_ms}|{second_query.execution_time_ms}"
+        self.report += f"Execution time|{first_query.execution_time_ms}{self._cached_mark(first_query)}|{second_query.execution_time_ms}{self._cached_mark(second_query)}"
         self._end_table_row()
         self._end_table()
 
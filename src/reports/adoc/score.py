@@ -9,7 +9,7 @@ from sql_formatter.core import format_sql
 
 from objects import ListOfQueries, Query
 from reports.abstract import Report
-from utils import allowed_diff, disabled_path
+from utils import disabled_path
 
 
 class ScoreReport(Report):
@@ -18,7 +18,19 @@ class ScoreReport(Report):
 
         os.mkdir(f"report/{self.start_date}/imgs")
 
-        self.queries = {}
+        # queries are rendered right away, only report rows and plotted values are kept
+        self.query_rows = {}
+        self.query_details = {}
+        self.default_plot_data = ([], [])
+        self.optimizations_plot_data = ([], [])
+
+        self.yb_bests = 0
+        self.pg_bests = 0
+        self.qe_bests_geo = 1
+        self.qo_yb_bests_geo = 1
+        self.qo_pg_bests_geo = 1
+        self.total = 0
+
         self.overall_plots = {
             'color': 'k.',
             'x_values': [],
@@ -32,8 +44,8 @@ class ScoreReport(Report):
         report.define_version(loq.db_version)
         report.report_model(loq.model_queries)
 
-        for qid, query in enumerate(loq.queries):
-            report.add_query(query, pg_loq.queries[qid] if pg_loq else None)
+        for query, pg_query in report.pair_queries(loq, pg_loq):
+            report.add_query(query, pg_query)
 
         report.build_report()
         report.publish_report("score")
@@ -48,22 +60,10 @@ class ScoreReport(Report):
         if query.execution_time_ms == 0:
             return -1
         else:
-            return "{:.2f}".format(
-                query.get_best_optimization(
-                    self.config).execution_time_ms / query.execution_time_ms)
+            return "{:.2f}".format(query.get_analysis(self.config).score)
 
     def create_default_query_plot(self):
-        x_data = []
-        y_data = []
-
-        for tag, queries in self.queries.items():
-            for yb_pg_queries in queries:
-                query = yb_pg_queries[0]
-                if query.execution_time_ms:
-                    x_data.append(query.execution_plan.get_estimated_cost())
-                    y_data.append(query.execution_time_ms)
-
-        fig = self.generate_regression_and_standard_errors(x_data, y_data)
+        fig = self.generate_regression_and_standard_errors(*self.default_plot_data)
 
         file_name = f'imgs/all_queries_defaults.png'
         fig.savefig(f"report/{self.start_date}/{file_name}", dpi=300)
@@ -72,18 +72,7 @@ class ScoreReport(Report):
         return file_name
 
     def create_optimizations_plot(self):
-        x_data = []
-        y_data = []
-
-        for tag, queries in self.queries.items():
-            for yb_pg_queries in queries:
-                query = yb_pg_queries[0]
-                x_data += [q.execution_plan.get_estimated_cost() for q in query.optimizations
-                           if q.execution_time_ms != 0 and not disabled_path(q)]
-                y_data += [q.execution_time_ms for q in query.optimizations
-                           if q.execution_time_ms != 0 and not disabled_path(q)]
-
-        fig = self.generate_regression_and_standard_errors(x_data, y_data)
+        fig = self.generate_regression_and_standard_errors(*self.optimizations_plot_data)
 
         file_name = f'imgs/all_optimizations.png'
         fig.savefig(f"report/{self.start_date}/{file_name}", dpi=300)
@@ -91,6 +80,18 @@ class ScoreReport(Report):
 
         return file_name
 
+    def add_plot_data(self, query: Type[Query]):
+        x_data, y_data = self.default_plot_data
+        if query.execution_time_ms:
+            x_data.append(query.execution_plan.get_estimated_cost())
+            y_data.append(query.execution_time_ms)
+
+        x_data, y_data = self.optimizations_plot_data
+        x_data += [q.execution_plan.get_estimated_cost() for q in query.optimizations
+                   if q.execution_time_ms != 0 and not disabled_path(q)]
+        y_data += [q.execution_time_ms for q in query.optimizations
+                   if q.execution_time_ms != 0 and not disabled_path(q)]
+
     @staticmethod
     def generate_regression_and_standard_errors(x_data, y_data):
         x = np.array(x_data)
@@ -134,10 +135,29 @@ class ScoreReport(Report):
         return file_name
 
     def add_query(self, query: Type[Query], pg: Type[Query] | None):
-        if query.tag not in self.queries:
-            self.queries[query.tag] = [[query, pg], ]
-        else:
-            self.queries[query.tag].append([query, pg])
+        self.add_plot_data(query)
+        self.add_score(query, pg)
+
+        self.query_rows.setdefault(query.tag, []).append(
+            self._render(self.__report_score_row, query, pg))
+        self.query_details.setdefault(query.tag, []).append(
+            self._render(self.__report_query, query, pg, True))
+
+    def add_score(self, yb_query: Type[Query], pg_query: Type[Query]):
+        yb_best = yb_query.get_analysis(self.config).best_optimization
+        pg_best = pg_query.get_analysis(self.config).best_optimization
+
+        pg_success = pg_query.execution_time_ms != 0
+
+        self.qe_bests_geo *= yb_best.execution_time_ms / pg_best.execution_time_ms if pg_success else 1
+        self.qo_yb_bests_geo *= (
+                                    yb_query.execution_time_ms if yb_query.execution_time_ms > 0 else 1.0) / (
+                                    yb_best.execution_time_ms if yb_best.execution_time_ms > 0 else 1)
+        self.qo_pg_bests_geo *= pg_query.execution_time_ms / pg_best.execution_time_ms if pg_best.execution_time_ms != 0 else 9999999
+        self.yb_bests += 1 if yb_query.get_analysis(self.config).same_plan else 0
+        self.pg_bests += 1 if pg_success and pg_query.get_analysis(self.config).same_plan else 0
+
+        self.total += 1
 
     def build_report(self):
         self._start_table("2")
@@ -148,112 +168,78 @@ class ScoreReport(Report):
 
         self.report += "\n== QO score\n"
 
-        yb_bests = 0
-        pg_bests = 0
-        qe_bests_geo = 1
-        qo_yb_bests_geo = 1
-        qo_pg_bests_geo = 1
-        total = 0
-        for queries in self.queries.values():
-            for query in queries:
-                yb_query = query[0]
-                pg_query = query[1]
-
-                yb_best = yb_query.get_best_optimization(self.config)
-                pg_best = pg_query.get_best_optimization(self.config)
-
-                pg_success = pg_query.execution_time_ms != 0
-
-                qe_bests_geo *= yb_best.execution_time_ms / pg_best.execution_time_ms if pg_success else 1
-                qo_yb_bests_geo *= (
-                                       yb_query.execution_time_ms if yb_query.execution_time_ms > 0 else 1.0) / (
-                                       yb_best.execution_time_ms if yb_best.execution_time_ms > 0 else 1)
-                qo_pg_bests_geo *= pg_query.execution_time_ms / pg_best.execution_time_ms if pg_best.execution_time_ms != 0 else 9999999
-                yb_bests += 1 if yb_query.compare_plans(yb_best.execution_plan) else 0
-                pg_bests += 1 if pg_success and pg_query.compare_plans(
-                    pg_best.execution_plan) else 0
-
-                total += 1
-
+        total = self.total
         self._start_table("4,1,1")
         self.report += "|Statistic|YB|PG\n"
-        self.report += f"|Best execution plan picked|{'{:.2f}'.format(float(yb_bests) * 100 / total)}%|{'{:.2f}'.format(float(pg_bests) * 100 / total)}%\n"
-        self.report += f"|Geomeric mean QE best\n2+m|{'{:.2f}'.format(qe_bests_geo ** (1 / total))}\n"
-        self.report += f"|Geomeric mean QO default vs best|{'{:.2f}'.format(qo_yb_bests_geo ** (1 / total))}|{'{:.2f}'.format(qo_pg_bests_geo ** (1 / total))}\n"
+        self.report += f"|Best execution plan picked|{'{:.2f}'.format(float(self.yb_bests) * 100 / total)}%|{'{:.2f}'.format(float(self.pg_bests) * 100 / total)}%\n"
+        self.report += f"|Geomeric mean QE best\n2+m|{'{:.2f}'.format(self.qe_bests_geo ** (1 / total))}\n"
+        self.report += f"|Geomeric mean QO default vs best|{'{:.2f}'.format(self.qo_yb_bests_geo ** (1 / total))}|{'{:.2f}'.format(self.qo_pg_bests_geo ** (1 / total))}\n"
         self._end_table()
 
         self.report += "\n[#top]\n== QE score\n"
 
         num_columns = 7
-        for tag, queries in self.queries.items():
+        for tag, rows in self.query_rows.items():
             self._start_table("1,1,1,1,1,1,4")
             self.report += "|YB|YB Best|PG|PG Best|Ratio YB vs PG|Ratio Best YB vs PG|Query\n"
             self.report += f"{num_columns}+m|{tag}.sql\n"
-            for query in queries:
-                yb_query = query[0]
-                pg_query = query[1]
-
-                yb_best = yb_query.get_best_optimization(self.config)
-                pg_best = pg_query.get_best_optimization(self.config)
-
-                pg_success = pg_query.execution_time_ms != 0
-
-                default_yb_equality = "[green]" if yb_query.compare_plans(
-                    yb_best.execution_plan) else "[red]"
-                default_pg_equality = "[green]" if pg_success and pg_query.compare_plans(
-                    pg_best.execution_plan) else "[red]"
-
-                best_yb_pg_equality = "(eq) " if yb_best.compare_plans(
-                    pg_best.execution_plan) else ""
-
-                ratio_x3 = yb_query.execution_time_ms / (
-                        3 * pg_query.execution_time_ms) if pg_query.execution_time_ms != 0 else 99999999
-                ratio_x3_str = "{:.2f}".format(
-                    yb_query.execution_time_ms / pg_query.execution_time_ms if pg_query.execution_time_ms != 0 else 99999999)
-                ratio_color = "[green]" if ratio_x3 <= 1.0 else "[red]"
-
-                ratio_best = yb_best.execution_time_ms / (
-                        3 * pg_best.execution_time_ms) \
-                    if yb_best.execution_time_ms != 0 and pg_success else 99999999
-                ratio_best_x3_str = "{:.2f}".format(
-                    yb_best.execution_time_ms / pg_best.execution_time_ms
-                    if yb_best.execution_time_ms != 0 and pg_success else 99999999)
-                ratio_best_color = "[green]" if ratio_best <= 1.0 else "[red]"
-
-                bitmap_flag = "[blue]" if pg_success and "bitmap" in pg_query.execution_plan.full_str.lower() else "[black]"
-
-                self.report += f"a|[black]#*{'{:.2f}'.format(yb_query.execution_time_ms)}*#\n" \
-                               f"a|{default_yb_equality}#*{'{:.2f}'.format(yb_best.execution_time_ms)}*#\n" \
-                               f"a|{bitmap_flag}#*{'{:.2f}'.format(pg_query.execution_time_ms)}*#\n" \
-                               f"a|{default_pg_equality}#*{'{:.2f}'.format(pg_best.execution_time_ms)}*#\n" \
-                               f"a|{ratio_color}#*{ratio_x3_str}*#\n" \
-                               f"a|{ratio_best_color}#*{best_yb_pg_equality}{ratio_best_x3_str}*#\n"
-                self.report += f"a|[#{yb_query.query_hash}_top]\n<<{yb_query.query_hash}>>\n"
-                self._start_source(["sql"])
-                self.report += format_sql(pg_query.query.replace("|", "\|"))
-                self._end_source()
-                self.report += "\n"
-                self._end_table_row()
-
+            self.report += "".join(rows)
             self._end_table()
 
         # different results links
-        for tag in self.queries.keys():
+        for tag in self.query_details.keys():
             self.report += f"\n<<{tag}>>\n"
 
-        for tag, queries in self.queries.items():
+        for tag, details in self.query_details.items():
             self.report += f"\n[#{tag}]\n== {tag} queries file\n\n"
-            for query in queries:
-                self.__report_query(query[0], query[1], True)
+            self.report += "".join(details)
+
+    def __report_score_row(self, yb_query: Type[Query], pg_query: Type[Query]):
+        yb_best = yb_query.get_analysis(self.config).best_optimization
+        pg_best = pg_query.get_analysis(self.config).best_optimization
+
+        pg_success = pg_query.execution_time_ms != 0
+
+        default_yb_equality = "[green]" if yb_query.get_analysis(self.config).same_plan else "[red]"
+        default_pg_equality = "[green]" if pg_success and pg_query.get_analysis(self.config).same_plan else "[red]"
+
+        best_yb_pg_equality = "(eq) " if yb_query.get_analysis(self.config).same_best_plan(
+            pg_query.get_analysis(self.config)) else ""
+
+        ratio_x3 = yb_query.execution_time_ms / (
+                3 * pg_query.execution_time_ms) if pg_query.execution_time_ms != 0 else 99999999
+        ratio_x3_str = "{:.2f}".format(
+            yb_query.execution_time_ms / pg_query.execution_time_ms if pg_query.execution_time_ms != 0 else 99999999)
+        ratio_color = "[green]" if ratio_x3 <= 1.0 else "[red]"
+
+        ratio_best = yb_best.execution_time_ms / (
+                3 * pg_best.execution_time_ms) \
+            if yb_best.execution_time_ms != 0 and pg_success else 99999999
+        ratio_best_x3_str = "{:.2f}".format(
+            yb_best.execution_time_ms / pg_best.execution_time_ms
+            if yb_best.execution_time_ms != 0 and pg_success else 99999999)
+        ratio_best_color = "[green]" if ratio_best <= 1.0 else "[red]"
+
+        bitmap_flag = "[blue]" if pg_success and "bitmap" in pg_query.execution_plan.full_str.lower() else "[black]"
+
+        self.report += f"a|[black]#*{'{:.2f}'.format(yb_query.execution_time_ms)}*#\n" \
+                       f"a|{default_yb_equality}#*{'{:.2f}'.format(yb_best.execution_time_ms)}*#\n" \
+                       f"a|{bitmap_flag}#*{'{:.2f}'.format(pg_query.execution_time_ms)}*#\n" \
+                       f"a|{default_pg_equality}#*{'{:.2f}'.format(pg_best.execution_time_ms)}*#\n" \
+                       f"a|{ratio_color}#*{ratio_x3_str}*#\n" \
+                       f"a|{ratio_best_color}#*{best_yb_pg_equality}{ratio_best_x3_str}*#\n"
+        self.report += f"a|[#{yb_query.query_hash}_top]\n<<{yb_query.query_hash}>>\n"
+        self._start_source(["sql"])
+        self.report += format_sql(pg_query.query.replace("|", "\|"))
+        self._end_source()
+        self.report += "\n"
+        self._end_table_row()
 
     def __report_near_queries(self, query: Type[Query]):
         if query.optimizations:
-            best_optimization = query.get_best_optimization(self.config)
             if add_to_report := "".join(
-                    f"`{optimization.explain_hints}`\n\n"
-                    for optimization in query.optimizations
-                    if allowed_diff(self.config, best_optimization.execution_time_ms,
-                                    optimization.execution_time_ms)):
+                    f"`{self._hints(optimization)}`\n\n"
+                    for optimization in query.get_analysis(self.config).near_best_optimizations):
                 self._start_collapsible("Near best optimization hints")
                 self.report += add_to_report
                 self._end_collapsible()
@@ -310,7 +296,7 @@ class ScoreReport(Report):
 
     # noinspection InsecureHash
     def __report_query(self, yb_query: Type[Query], pg_query: Type[Query], show_best: bool):
-        yb_best = yb_query.get_best_optimization(self.config)
+        yb_best = yb_query.get_analysis(self.config).best_optimization
 
         self.reported_queries_counter += 1
 
@@ -331,7 +317,7 @@ class ScoreReport(Report):
 
         if show_best:
             self._add_double_newline()
-            self.report += f"YB Best explain hints - `{yb_best.explain_hints}`"
+            self.report += f"YB Best explain hints - `{self._hints(yb_best)}`"
             self._add_double_newline()
 
             self.__report_near_queries(yb_query)
@@ -342,8 +328,7 @@ class ScoreReport(Report):
         self._add_double_newline()
 
         self._add_double_newline()
-        default_yb_equality = "(eq) " if yb_query.compare_plans(
-            yb_best.execution_plan) else ""
+        default_yb_equality = "(eq) " if yb_query.get_analysis(self.config).same_plan else ""
         default_pg_equality = ""
         default_yb_pg_equality = ""
 
@@ -352,13 +337,12 @@ class ScoreReport(Report):
             self._start_table("5")
             self.report += "|Metric|YB|YB Best|PG|PG Best\n"
 
-            pg_best = pg_query.get_best_optimization(self.config)
-            default_pg_equality = "(eq) " if pg_query.compare_plans(
-                pg_best.execution_plan) else ""
-            best_yb_pg_equality = "(eq) " if yb_best.compare_plans(
-                pg_best.execution_plan) else ""
-            default_yb_pg_equality = "(eq) " if yb_query.compare_plans(
-                pg_query.execution_plan) else ""
+            pg_best = pg_query.get_analysis(self.config).best_optimization
+            default_pg_equality = "(eq) " if pg_query.get_analysis(self.config).same_plan else ""
+            best_yb_pg_equality = "(eq) " if yb_query.get_analysis(self.config).same_best_plan(
+                pg_query.get_analysis(self.config)) else ""
+            default_yb_pg_equality = "(eq) " if yb_query.get_analysis(self.config).same_default_plan(
+                pg_query.get_analysis(self.config)) else ""
 
             if 'order by' in yb_query.query:
                 self._start_table_row()
@@ -375,7 +359,7 @@ class ScoreReport(Report):
             self.report += f"Estimated cost|{yb_query.execution_plan.get_estimated_cost()}|{default_yb_equality}{yb_best.execution_plan.get_estimated_cost()}|{pg_query.execution_plan.get_estimated_cost()}|{default_pg_equality}{pg_best.execution_plan.get_estimated_cost()}"
             self._end_table_row()
             self._start_table_row()
-            self.report += f"Execution time|{'{:.2f}'.format(yb_query.execution_time_ms)}|{default_yb_equality}{'{:.2f}'.format(yb_best.execution_time_ms)}|{'{:.2f}'.format(pg_query.execution_time_ms)}|{default_pg_equality}{'{:.2f}'.format(pg_best.execution_time_ms)}"
+            self.report += f"Execution time|{'{:.2f}'.format(yb_query.execution_time_ms)}{self._cached_mark(yb_query)}|{default_yb_equality}{'{:.2f}'.format(yb_best.execution_time_ms)}{self._cached_mark(yb_best)}|{'{:.2f}'.format(pg_query.execution_time_ms)}{self._cached_mark(pg_query)}|{default_pg_equality}{'{:.2f}'.format(pg_best.execution_time_ms)}{self._cached_mark(pg_best)}"
             self._end_table_row()
         else:
             self._start_table("3")
@@ -394,7 +378,7 @@ class ScoreReport(Report):
             self.report += f"Optimizer cost|{yb_query.execution_plan.get_estimated_cost()}|{default_yb_equality}{yb_best.execution_plan.get_estimated_cost()}"
             self._end_table_row()
             self._start_table_row()
-            self.report += f"Execution time|{yb_query.execution_time_ms}|{default_yb_equality}{yb_best.execution_time_ms}"
+            self.report += f"Execution time|{yb_query.execution_time_ms}{self._cached_mark(yb_query)}|{default_yb_equality}{yb_best.execution_time_ms}{self._cached_mark(yb_best)}"
             self._end_table_row()
         self._end_table()
 
@@ -409,7 +393,7 @@ class ScoreReport(Report):
             self._end_source()
             self._end_collapsible()
 
-            pg_best = pg_query.get_best_optimization(self.config)
+            pg_best = pg_query.get_analysis(self.config).best_optimization
             bitmap_used = "(bm) " if "bitmap" in pg_best.execution_plan.full_str.lower() else ""
             self._start_collapsible(f"{default_pg_equality}{bitmap_used}PG best")
             self._start_source(["diff"])
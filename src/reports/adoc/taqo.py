@@ -6,7 +6,6 @@ from sql_formatter.core import format_sql
 
 from objects import ListOfQueries, Query
 from reports.abstract import Report
-from utils import allowed_diff
 
 
 class TaqoReport(Report):
@@ -28,8 +27,8 @@ class TaqoReport(Report):
         report.define_version(loq.db_version)
         report.report_model(loq.model_queries)
 
-        for qid, query in enumerate(loq.queries):
-            report.add_query(query, pg_loq.queries[qid] if pg_loq else None)
+        for query, pg_query in report.pair_queries(loq, pg_loq):
+            report.add_query(query, pg_query)
 
         report.build_report()
         report.publish_report("taqo")
@@ -44,8 +43,7 @@ class TaqoReport(Report):
         if query.execution_time_ms == 0:
             return -1
         else:
-            return "{:.2f}".format(
-                query.get_best_optimization(self.config, ).execution_time_ms / query.execution_time_ms)
+            return "{:.2f}".format(query.get_analysis(self.config).score)
 
     def create_plot(self, best_optimization, optimizations, query):
         plt.xlabel('Execution time')
@@ -65,21 +63,22 @@ class TaqoReport(Report):
         return file_name
 
     def add_query(self, query: Type[Query], pg: Type[Query] | None):
-        best_optimization = query.get_best_optimization(self.config)
+        # queries are rendered right away, so only report sections are kept in memory
+        analysis = query.get_analysis(self.config)
+        best_optimization = analysis.best_optimization
 
         if len(query.optimizations) > 1:
             if self.config.compare_with_pg and query.result_hash != pg.result_hash:
-                self.failed_validation.append([query, pg])
+                self.failed_validation.append(self._render(self.__report_query, query, pg, True))
             if not self.config.compare_with_pg and query.result_hash != best_optimization.result_hash:
-                self.failed_validation.append([query, pg])
+                self.failed_validation.append(self._render(self.__report_query, query, pg, True))
 
-            if allowed_diff(self.config, query.execution_time_ms,
-                            best_optimization.execution_time_ms):
-                self.same_execution_plan.append([query, pg])
+            if not analysis.better_plan_found:
+                self.same_execution_plan.append(self._render(self.__report_query, query, pg, False))
             else:
-                self.better_plan_found.append([query, pg])
+                self.better_plan_found.append(self._render(self.__report_query, query, pg, True))
         else:
-            self.same_execution_plan.append([query, pg])
+            self.same_execution_plan.append(self._render(self.__report_query, query, pg, False))
 
     def build_report(self):
         # link to top
@@ -90,28 +89,47 @@ class TaqoReport(Report):
         self.report += "\n<<found>>\n"
 
         self.report += f"\n[#result]\n== Result validation failure ({len(self.failed_validation)})\n\n"
-        for query in self.failed_validation:
-            self.__report_query(query[0], query[1], True)
+        self.report += "".join(self.failed_validation)
 
         self.report += f"\n[#better]\n== Better plan found queries ({len(self.better_plan_found)})\n\n"
-        for query in self.better_plan_found:
-            self.__report_query(query[0], query[1], True)
+        self.report += "".join(self.better_plan_found)
 
         self.report += f"\n[#found]\n== No better plan found ({len(self.same_execution_plan)})\n\n"
-        for query in self.same_execution_plan:
-            self.__report_query(query[0], query[1], False)
+        self.report += "".join(self.same_execution_plan)
 
     def __report_near_queries(self, query: Query):
-        best_optimization = query.get_best_optimization(self.config)
         if add_to_report := "".join(
-                f"`{optimization.explain_hints}`\n\n"
-                for optimization in query.optimizations
-                if allowed_diff(self.config, best_optimization.execution_time_ms,
-                                optimization.execution_time_ms)):
+                f"`{self._hints(optimization)}`\n\n"
+                for optimization in query.get_analysis(self.config).near_best_optimizations):
             self._start_collapsible("All best optimization hints")
             self.report += add_to_report
             self._end_collapsible()
 
+    def __report_true_cardinality_plan(self, query: Query, true_cardinality_plan: Query,
+                                       best_optimization: Query):
+        self._add_double_newline()
+        self._start_table("4")
+        self.report += "|Metric|Default|True cardinality|Best\n"
+        self._start_table_row()
+        self.report += f"Optimizer cost|{query.execution_plan.get_estimated_cost()}" \
+                       f"|{true_cardinality_plan.execution_plan.get_estimated_cost()}" \
+                       f"|{best_optimization.execution_plan.get_estimated_cost()}"
+        self._end_table_row()
+        self._start_table_row()
+        self.report += f"Execution time|{query.execution_time_ms}" \
+                       f"|{true_cardinality_plan.execution_time_ms}" \
+                       f"{self._cached_mark(true_cardinality_plan)}" \
+                       f"|{best_optimization.execution_time_ms}"
+        self._end_table_row()
+        self._end_table()
+
+        self._start_collapsible("True cardinality plan")
+        self.report += f"`{true_cardinality_plan.explain_hints}`\n\n"
+        self._start_source(["diff"])
+        self.report += true_cardinality_plan.execution_plan.full_str
+        self._end_source()
+        self._end_collapsible()
+
     def __report_heatmap(self, query: Query):
         """
         Here is the deal. In PG plans we can separate each plan tree node by splitting by `->`
@@ -161,7 +179,7 @@ class TaqoReport(Report):
 
     # noinspection InsecureHash
     def __report_query(self, query: Query, pg_query: Query, show_best: bool):
-        best_optimization = query.get_best_optimization(self.config)
+        best_optimization = query.get_analysis(self.config).best_optimization
 
         self.reported_queries_counter += 1
 
@@ -178,9 +196,20 @@ class TaqoReport(Report):
         self.report += f"Default explain hints - `{query.explain_hints}`"
         self._add_double_newline()
 
+        if search_stats := query.search_stats:
+            self.report += f"Optimizations - {search_stats.total} generated, " \
+                           f"{search_stats.timed} timed, {search_stats.pruned} pruned, " \
+                           f"{search_stats.deduplicated} deduplicated"
+            if search_stats.evaluated is not None and search_stats.total:
+                self.report += f", {search_stats.evaluated}/{search_stats.total} evaluated " \
+                               f"({search_stats.evaluated * 100 // search_stats.total}% coverage)"
+            if search_stats.clusters:
+                self.report += f", {search_stats.clusters} plan clusters"
+            self._add_double_newline()
+
         if show_best:
             self._add_double_newline()
-            self.report += f"Better explain hints - `{best_optimization.explain_hints}`"
+            self.report += f"Better explain hints - `{self._hints(best_optimization)}`"
             self._add_double_newline()
 
             self.__report_near_queries(query)
@@ -212,10 +241,17 @@ class TaqoReport(Report):
         self.report += f"Optimizer cost|{query.execution_plan.get_estimated_cost()}|{best_optimization.execution_plan.get_estimated_cost()}"
         self._end_table_row()
         self._start_table_row()
-        self.report += f"Execution time|{query.execution_time_ms}|{best_optimization.execution_time_ms}"
+        self.report += f"Execution time|{query.execution_time_ms}{self._cached_mark(query)}|{best_optimization.execution_time_ms}{self._cached_mark(best_optimization)}"
         self._end_table_row()
+        if query.planning_time_ms is not None:
+            self._start_table_row()
+            self.report += f"Planning time|{query.planning_time_ms}|{best_optimization.planning_time_ms}"
+            self._end_table_row()
         self._end_table()
 
+        if true_cardinality_plan := query.true_cardinality_plan:
+            self.__report_true_cardinality_plan(query, true_cardinality_plan, best_optimization)
+
         self._start_table()
         self._start_table_row()
 
@@ -235,7 +271,7 @@ class TaqoReport(Report):
             self._end_source()
             self._end_collapsible()
 
-            best_pg = pg_query.get_best_optimization(self.config)
+            best_pg = pg_query.get_analysis(self.config).best_optimization
             self._start_collapsible("Best Postgres plan")
             self._start_source(["diff"])
             self.report += best_pg.execution_plan.full_str
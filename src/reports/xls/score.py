@@ -35,9 +35,7 @@ class ScoreXlsReport(Report):
         if query.execution_time_ms == 0:
             return -1
         else:
-            return "{:.2f}".format(
-                query.get_best_optimization(
-                    self.config).execution_time_ms / query.execution_time_ms)
+            return "{:.2f}".format(query.get_analysis(self.config).score)
 
     def create_plot(self, best_optimization, optimizations, query):
         plt.xlabel('Execution time')
@@ -101,11 +99,11 @@ class ScoreXlsReport(Report):
                 yb_query = query[0]
                 pg_query = query[1]
 
-                yb_best = yb_query.get_best_optimization(self.config, )
-                pg_best = pg_query.get_best_optimization(self.config, )
+                yb_best = yb_query.get_analysis(self.config).best_optimization
+                pg_best = pg_query.get_analysis(self.config).best_optimization
 
-                yb_bests += 1 if yb_query.compare_plans(yb_best.execution_plan) else 0
-                pg_bests += 1 if pg_query.compare_plans(pg_best.execution_plan) else 0
+                yb_bests += 1 if yb_query.get_analysis(self.config).same_plan else 0
+                pg_bests += 1 if pg_query.get_analysis(self.config).same_plan else 0
 
                 total += 1
 
@@ -125,14 +123,16 @@ class ScoreXlsReport(Report):
                 yb_query: PostgresQuery = query[0]
                 pg_query: PostgresQuery = query[1]
 
-                yb_best = yb_query.get_best_optimization(self.config, )
-                pg_best = pg_query.get_best_optimization(self.config, )
+                yb_best = yb_query.get_analysis(self.config).best_optimization
+                pg_best = pg_query.get_analysis(self.config).best_optimization
 
-                default_yb_equality = yb_query.compare_plans(yb_best.execution_plan)
-                default_pg_equality = pg_query.compare_plans(pg_best.execution_plan)
+                default_yb_equality = yb_query.get_analysis(self.config).same_plan
+                default_pg_equality = pg_query.get_analysis(self.config).same_plan
 
-                default_yb_pg_equality = yb_query.compare_plans(pg_query.execution_plan)
-                best_yb_pg_equality = yb_best.compare_plans(pg_best.execution_plan)
+                default_yb_pg_equality = yb_query.get_analysis(self.config).same_default_plan(
+                    pg_query.get_analysis(self.config))
+                best_yb_pg_equality = yb_query.get_analysis(self.config).same_best_plan(
+                    pg_query.get_analysis(self.config))
 
                 ratio_x3 = yb_query.execution_time_ms / (
                         3 * pg_query.execution_time_ms) if pg_query.execution_time_ms != 0 else 99999999
@@ -16,6 +16,10 @@ from reports.adoc.taqo import TaqoReport
 from scenario import Scenario
 from utils import get_bool_from_str
 
+ESTIMATORS = {"mean", "p50", "p90", "p99", "min", "trimmed_mean"}
+SEARCH_STRATEGIES = {"exhaustive", "hill-climbing"}
+RESULTS_FORMATS = {"json", "jsonl"}
+
 
 def parse_ddls(ddl_ops):
     result = set()
@@ -55,6 +59,10 @@ if __name__ == "__main__":
     parser.add_argument('--type',
                         help='Report type - taqo, regression, comparison or selectivity')
 
+    parser.add_argument('--estimator',
+                        default="mean",
+                        help='Report: execution time estimator - mean, p50, p90, p99, min or trimmed_mean')
+
     # TAQO or Comparison
     parser.add_argument('--results',
                         default=None,
@@ -111,6 +119,47 @@ if __name__ == "__main__":
                         action=argparse.BooleanOptionalAction,
                         default=False,
                         help='Evaluate optimizations for each query')
+    parser.add_argument('--search-strategy',
+                        default=None,
+                        help='Optimizations search for queries with all-pairs-threshold or more tables: '
+                             'exhaustive (AllPairs) or hill-climbing')
+    parser.add_argument('--query-budget',
+                        default=0,
+                        help='Maximum number of seconds spent on optimizations of a single query')
+    parser.add_argument('--run-budget',
+                        default=0,
+                        help='Maximum number of seconds spent on all test queries, split between queries')
+    parser.add_argument('--workers',
+                        default=0,
+                        help='Number of parallel connections used to evaluate optimizations (Default 1)')
+    parser.add_argument('--explain-first',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Explain all optimizations first and evaluate only one optimization per distinct plan')
+    parser.add_argument('--cost-guided',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Evaluate optimizations in order of estimated cost and prune expensive ones')
+    parser.add_argument('--plan-clustering',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Time only medoids of similar plan clusters and plans near the best one')
+    parser.add_argument('--cardinality-injection',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Evaluate each query with true join cardinalities injected by Rows hints')
+    parser.add_argument('--json-plans',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Capture execution plans in JSON format and store parsed plan trees')
+    parser.add_argument('--cache',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Reuse execution times measured in previous runs for unchanged plans')
+    parser.add_argument('--refresh-cache',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Ignore cached measurements and time all queries again')
     parser.add_argument('--model',
                         default="simple",
                         help='Test model to use - complex, tpch, subqueries, any other custom model')
@@ -183,9 +232,31 @@ if __name__ == "__main__":
                         action=argparse.BooleanOptionalAction,
                         default=False,
                         help='Run parametrized query instead of normal')
+    parser.add_argument('--prepared',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Run query as prepared statement, planning time is stored separately')
+
+    parser.add_argument('--adaptive-retries',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Repeat query until execution time confidence interval is narrow enough')
+    parser.add_argument('--server-side-fingerprint',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Hash query results inside database and discard rows in timed runs')
 
     parser.add_argument('--output',
-                        help='Output JSON file name in report folder, [.json] will be added')
+                        help='Output JSON file name in report folder, [.json] or [.jsonl] will be added')
+    parser.add_argument('--results-format',
+                        default=None,
+                        help='Results file format - json or jsonl, JSON lines are written query by query')
+
+    parser.add_argument('--resume',
+                        action=argparse.BooleanOptionalAction,
+                        default=False,
+                        help='Continue interrupted collect run from report/[output].checkpoint '
+                             'or report/[output].jsonl')
 
     parser.add_argument('--clear',
                         action=argparse.BooleanOptionalAction,
@@ -227,6 +298,8 @@ if __name__ == "__main__":
 
         model=args.model,
         output=args.output,
+        results_format=args.results_format or configuration.get("results-format", "json"),
+        resume=args.resume,
         ddls=ddls,
         remote_data_path=args.remote_data_path,
         ddl_prefix=args.ddl_prefix if args.ddl_prefix else (
@@ -243,18 +316,59 @@ if __name__ == "__main__":
 
         skip_percentage_delta=configuration.get("skip-percentage-delta", 0.05),
         skip_timeout_delta=configuration.get("skip-timeout-delta", 1),
+        timeout_multiplier=configuration.get("timeout-multiplier", 3),
+        timeout_floor_ms=configuration.get("timeout-floor-ms", 100),
+        watchdog_grace_ms=configuration.get("watchdog-grace-ms", 5000),
         ddl_query_timeout=configuration.get("ddl-query-timeout", 3600),
         test_query_timeout=configuration.get("test-query-timeout", 1200),
+        query_budget=int(args.query_budget) or configuration.get("query-budget", 0),
+        run_budget=int(args.run_budget) or configuration.get("run-budget", 0),
         look_near_best_plan=configuration.get("look-near-best-plan", True),
         all_pairs_threshold=configuration.get("all-pairs-threshold", 3),
+        join_graph_threshold=configuration.get("join-graph-threshold", 0),
+        bushy_join_orders=get_bool_from_str(configuration.get("bushy-join-orders", False)),
+        optimizations_batch_size=configuration.get("optimizations-batch-size", 1000),
+        search_strategy=args.search_strategy or configuration.get("search-strategy", "exhaustive"),
+        search_budget=configuration.get("search-budget", 500),
+        search_timed_plans=configuration.get("search-timed-plans", 10),
+        optimizations_sample_rate=configuration.get("optimizations-sample-rate", 1.0),
+        workers=int(args.workers) or configuration.get("workers", 1),
+        explain_first=args.explain_first or get_bool_from_str(
+            configuration.get("explain-first", False)),
+        cost_guided=args.cost_guided or get_bool_from_str(
+            configuration.get("cost-guided", False)),
+        cost_prune_factor=configuration.get("cost-prune-factor", 0),
+        plan_clustering=args.plan_clustering or get_bool_from_str(
+            configuration.get("plan-clustering", False)),
+        plan_similarity=configuration.get("plan-similarity", 0.8),
+        cardinality_injection=args.cardinality_injection or get_bool_from_str(
+            configuration.get("cardinality-injection", False)),
+        json_plans=args.json_plans or get_bool_from_str(configuration.get("json-plans", False)),
+        cache=args.cache or get_bool_from_str(configuration.get("cache", False)),
+        cache_path=configuration.get("cache-path", "cache/measurements.json"),
+        cache_ttl=configuration.get("cache-ttl", 168),
+        cache_size=configuration.get("cache-size", 500000),
+        refresh_cache=args.refresh_cache,
 
         num_queries=int(args.num_queries)
         if int(args.num_queries) > 0 else configuration.get("num-queries", -1),
         num_retries=configuration.get("num-retries", 5),
         num_warmup=configuration.get("num-warmup", 2),
+        result_fetch_size=configuration.get("result-fetch-size", 10000),
+        notices_buffer_size=configuration.get("notices-buffer-size", 100),
+        server_side_fingerprint=args.server_side_fingerprint or get_bool_from_str(
+            configuration.get("server-side-fingerprint", False)),
+        adaptive_retries=args.adaptive_retries or get_bool_from_str(
+            configuration.get("adaptive-retries", False)),
+        target_precision=configuration.get("target-precision", 0.05),
+        max_retries=configuration.get("max-retries", 30),
+        adaptive_time_budget=configuration.get("adaptive-time-budget", 60),
 
         parametrized=args.parametrized,
+        prepared=args.prepared or get_bool_from_str(configuration.get("prepared", False)),
+        plan_cache_mode=configuration.get("plan-cache-mode", None),
 
+        estimator=args.estimator,
         asciidoctor_path=configuration.get("asciidoctor-path", "asciidoc"),
 
         clear=args.clear)
@@ -267,6 +381,12 @@ if __name__ == "__main__":
     loader = PostgresResultsLoader()
 
     if args.action == "collect":
+        if config.search_strategy not in SEARCH_STRATEGIES:
+            raise AttributeError(f"Unknown search strategy defined {config.search_strategy}")
+
+        if config.results_format not in RESULTS_FORMATS:
+            raise AttributeError(f"Unknown results format defined {config.results_format}")
+
         config.logger.info("")
         config.logger.info(f"Collecting results for model: {config.model}")
         config.logger.info("Configuration:")
@@ -285,22 +405,26 @@ if __name__ == "__main__":
         sc = Scenario(config)
         sc.evaluate()
     elif args.action == "report":
+        if args.estimator not in ESTIMATORS:
+            raise AttributeError(f"Unknown estimator defined {args.estimator}")
+
         config.logger.info("")
         config.logger.info(f"Generation {args.type} report")
+        config.logger.info(f"Execution time estimator: {config.estimator}")
         config.logger.info(
             f"Allowed execution time percentage deviation: {config.skip_percentage_delta * 100}%")
         config.logger.info("------------------------------------------------------------")
 
         if args.type == "taqo":
-            yb_queries = loader.get_queries_from_previous_result(args.results)
+            yb_queries = loader.get_queries_from_previous_result(args.results, stream=True)
             pg_queries = loader.get_queries_from_previous_result(
-                args.pg_results) if args.pg_results else None
+                args.pg_results, stream=True) if args.pg_results else None
 
             TaqoReport.generate_report(yb_queries, pg_queries)
         elif args.type == "score":
-            yb_queries = loader.get_queries_from_previous_result(args.results)
+            yb_queries = loader.get_queries_from_previous_result(args.results, stream=True)
             pg_queries = loader.get_queries_from_previous_result(
-                args.pg_results) if args.pg_results else None
+                args.pg_results, stream=True) if args.pg_results else None
 
             ScoreReport.generate_report(yb_queries, pg_queries)
         elif args.type == "score_xls":
@@ -312,8 +436,8 @@ if __name__ == "__main__":
         elif args.type == "regression":
             report = RegressionReport()
 
-            v1_queries = loader.get_queries_from_previous_result(args.v1_results)
-            v2_queries = loader.get_queries_from_previous_result(args.v2_results)
+            v1_queries = loader.get_queries_from_previous_result(args.v1_results, stream=True)
+            v2_queries = loader.get_queries_from_previous_result(args.v2_results, stream=True)
 
             report.generate_report(args.v1_name, args.v2_name, v1_queries, v2_queries)
         elif args.type == "regression_xls":
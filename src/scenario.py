@@ -1,10 +1,83 @@
+import dataclasses
+import itertools
+import os
+import queue
+import re
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
 
 import psycopg2
 from tqdm import tqdm
 
+from cache import MeasurementsCache
+from clustering import cluster_plans, get_medoid
+from db.postgres import Leading
 from models.factory import get_test_model
-from utils import evaluate_sql, calculate_avg_execution_time, get_md5
+from objects import SearchStats
+from query_watchdog import CancelWatchdog
+from utils import evaluate_sql, calculate_avg_execution_time, get_md5, get_timeout_ms
+
+
+HINT_NAME_REGEX = r"(\w+)\s*\("
+SCAN_HINT_REGEX = r"(SeqScan|IndexScan|IndexOnlyScan)\s*\([^)]*\)"
+# planner estimates are cheap to read and change once reloaded data is analyzed
+DATA_SIZE_QUERY = "SELECT relname, reltuples::bigint, relpages FROM pg_class " \
+                  "WHERE relkind IN ('r', 'm', 'p') AND relname = ANY(%s)"
+
+
+@dataclasses.dataclass
+class OptimizationsState:
+    # shared between optimization workers, must be accessed under lock
+    min_execution_time: float
+    incumbent_cost: float = None
+    num_skipped: int = 0
+    num_timed: int = 0
+    num_pruned: int = 0
+    # monotonic time after which no more optimizations are evaluated
+    deadline: float = None
+    execution_plans_checked: Set[str] = dataclasses.field(default_factory=set)
+    # optimizations grouped by hints actually used by pg_hint_plan, first one is timed
+    effective_hints_classes: Dict[str, List] = dataclasses.field(default_factory=dict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+    def is_out_of_budget(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+
+class HintsHistory:
+    """
+    Keeps track of hint types (HashJoin, IndexScan, etc.) used by the best optimizations
+    found so far in this run, so that candidates with historically winning hints are tried earlier.
+    """
+
+    def __init__(self):
+        self.wins = {}
+        self.trials = {}
+
+    @staticmethod
+    def get_hint_names(explain_hints):
+        return {name for name in re.findall(HINT_NAME_REGEX, explain_hints or "")
+                if name != Leading.LEADING}
+
+    def win_rate(self, explain_hints):
+        if not (hint_names := self.get_hint_names(explain_hints)):
+            return 0
+
+        return sum(self.wins.get(name, 0) / self.trials[name]
+                   for name in hint_names if self.trials.get(name)) / len(hint_names)
+
+    def record(self, original_query, best_optimization):
+        for optimization in original_query.optimizations:
+            if optimization.execution_time_ms > 0 and not optimization.representative_hints:
+                for name in self.get_hint_names(optimization.explain_hints):
+                    self.trials[name] = self.trials.get(name, 0) + 1
+
+        if best_optimization is not original_query:
+            for name in self.get_hint_names(best_optimization.explain_hints):
+                self.wins[name] = self.wins.get(name, 0) + 1
 
 
 class Scenario:
@@ -12,6 +85,14 @@ class Scenario:
         self.config = config
         self.logger = self.config.logger
         self.sut_database = self.config.database
+        self.worker_connections = []
+        self.watchdogs = {}
+        self.lock = threading.Lock()
+        self.hints_history = HintsHistory()
+        self.measurements_cache = MeasurementsCache(config) if config.cache else None
+        self.run_deadline = None
+        self.remaining_queries = 1
+        self.budget_exhausted = False
 
     def start_db(self):
         self.logger.info(f"Initializing {self.sut_database.__class__.__name__} DB")
@@ -46,22 +127,37 @@ class Scenario:
 
             loq = self.config.database.get_list_queries()
             loq.db_version = self.sut_database.connection.get_version()
-            loq.model_queries, loq.queries = self.run_ddl_and_testing_queries(
-                self.sut_database.connection.conn, self.config.with_optimizations)
             loq.git_message = commit_message
+            loq.model_queries, loq.queries = self.run_ddl_and_testing_queries(
+                self.sut_database.connection.conn, self.config.with_optimizations, loq)
 
-            self.logger.info(f"Storing results to report/{self.config.output}")
-            loader.store_queries_to_file(loq, self.config.output)
+            if self.config.results_format == "jsonl":
+                # checkpoint is the JSON lines results file, queries are written already
+                self.logger.info(f"Results stored to {loader.get_results_path(self.config.output)}")
+            else:
+                self.logger.info(f"Storing results to report/{self.config.output}")
+                loader.store_queries_to_file(loq, self.config.output)
+            if self.budget_exhausted:
+                self.logger.info("Run budget exhausted, use --resume to evaluate skipped queries")
+            else:
+                loader.remove_checkpoint(self.config.output)
         except Exception as e:
             self.logger.exception(e)
             raise e
         finally:
+            self.close_worker_connections()
+            self.stop_watchdogs()
+
+            if self.measurements_cache:
+                self.measurements_cache.store()
+
             if self.config.clean_db:
                 self.sut_database.stop_database()
 
     def run_ddl_and_testing_queries(self,
                                     connection,
-                                    evaluate_optimizations=False):
+                                    evaluate_optimizations=False,
+                                    loq=None):
         queries = []
         model_queries = []
         try:
@@ -72,19 +168,100 @@ class Scenario:
             self.logger.exception("Failed to evaluate DDL queries", e)
             exit(1)
 
+        if self.measurements_cache:
+            self.measurements_cache.set_context(
+                self.sut_database.connection.get_version(),
+                self.get_data_fingerprint(connection, created_tables, model_queries))
+
+        if loq is None:
+            loq = self.config.database.get_list_queries()
+        loq.model_queries = model_queries
+        model_queries, completed_queries = self.start_checkpoint(loq)
+
         connection.autocommit = False
-        self.evaluate_testing_queries(connection, queries, evaluate_optimizations)
+        self.evaluate_testing_queries(connection, queries, evaluate_optimizations,
+                                      completed_queries)
 
         return model_queries, queries
 
-    def evaluate_testing_queries(self, conn, queries, evaluate_optimizations):
+    def get_data_fingerprint(self, connection, created_tables, model_queries):
+        tables = sorted(f"{table.name}({','.join(field.name for field in table.fields or [])})"
+                        for table in created_tables)
+
+        with connection.cursor() as cur:
+            cur.execute(DATA_SIZE_QUERY, ([table.name for table in created_tables],))
+            table_sizes = sorted(cur.fetchall())
+
+        return get_md5(f"{self.config.model}|{self.config.basic_multiplier}|"
+                       f"{tables}|{model_queries}|{table_sizes}")
+
+    def measure_execution_time(self, cur, query, connection):
+        if self.measurements_cache and self.measurements_cache.get(query):
+            self.logger.debug(f"Using cached measurement for {query.query_hash}")
+            return True
+
+        if result := calculate_avg_execution_time(cur, query, self.sut_database,
+                                                  num_retries=int(self.config.num_retries),
+                                                  connection=connection,
+                                                  watchdog=self.get_watchdog(connection)):
+            if self.measurements_cache:
+                self.measurements_cache.put(query)
+
+        return result
+
+    def start_checkpoint(self, loq):
+        loader = self.config.database.get_results_loader()
+
+        if self.config.resume and os.path.exists(loader.get_checkpoint_path(self.config.output)):
+            checkpoint_model_queries, checkpoint_queries = \
+                loader.get_queries_from_checkpoint(self.config.output)
+            self.logger.info(f"Resuming from checkpoint, "
+                             f"{len(checkpoint_queries)} queries already evaluated")
+
+            loq.model_queries = loq.model_queries or checkpoint_model_queries
+
+            # rewrite checkpoint to get rid of partially written and skipped records,
+            # completed queries are evaluated in order, so they stay in front of the new ones
+            loader.start_checkpoint(loq, self.config.output, checkpoint_queries)
+            completed_queries = {}
+            for query in checkpoint_queries:
+                completed_queries.setdefault(query.query_hash, []).append(query)
+
+            return loq.model_queries, completed_queries
+
+        loader.start_checkpoint(loq, self.config.output)
+
+        return loq.model_queries, {}
+
+    def evaluate_testing_queries(self, conn, queries, evaluate_optimizations,
+                                 completed_queries=None):
+        loader = self.config.database.get_results_loader()
+        completed_queries = completed_queries or {}
+
+        if self.config.run_budget:
+            self.run_deadline = time.monotonic() + self.config.run_budget
+
         counter = 1
-        for original_query in queries:
+        for query_id, original_query in enumerate(queries):
+            if completed_queries.get(original_query.query_hash):
+                queries[query_id] = completed_queries[original_query.query_hash].pop(0)
+                counter += 1
+                continue
+
+            if not self.start_query_budget(len(queries) - query_id):
+                # query is kept in results to preserve queries order between runs
+                self.logger.info(f"Skipping query [{counter}/{len(queries)}], run budget exhausted")
+                original_query.execution_plan = self.config.database.get_execution_plan('')
+                loader.append_query_to_checkpoint(original_query, self.config.output, skipped=True)
+                counter += 1
+                continue
+
+            notices_before = self.get_notices_counters(conn)
             with conn.cursor() as cur:
                 self.sut_database.prepare_query_execution(cur)
 
                 try:
-                    self.sut_database.set_query_timeout(cur, self.config.test_query_timeout)
+                    self.set_statement_timeout(cur, self.config.test_query_timeout * 1000)
 
                     short_query = original_query.query.replace('\n', '')[:40]
                     self.logger.info(
@@ -92,18 +269,16 @@ class Scenario:
 
                     try:
                         evaluate_sql(cur, original_query.get_explain())
-                        original_query.execution_plan = self.config.database.get_execution_plan(
-                            '\n'.join(
-                                str(item[0]) for item in cur.fetchall()))
+                        original_query.execution_plan = \
+                            self.config.database.fetch_execution_plan(cur)
 
                         conn.rollback()
                         self.sut_database.prepare_query_execution(cur)
                     except psycopg2.errors.QueryCanceled:
                         try:
                             evaluate_sql(cur, original_query.get_heuristic_explain())
-                            original_query.execution_plan = self.config.database.get_execution_plan(
-                                '\n'.join(
-                                    str(item[0]) for item in cur.fetchall()))
+                            original_query.execution_plan = \
+                                self.config.database.fetch_execution_plan(cur)
 
                             conn.rollback()
                             self.sut_database.prepare_query_execution(cur)
@@ -116,9 +291,11 @@ class Scenario:
                         original_query.execution_time_ms = \
                             original_query.execution_plan.get_estimated_cost()
                     else:
-                        calculate_avg_execution_time(cur, original_query, self.sut_database,
-                                                     num_retries=int(self.config.num_retries),
-                                                     connection=conn)
+                        self.measure_execution_time(cur, original_query, conn)
+
+                        if self.config.cardinality_injection and \
+                                "dml" not in original_query.optimizer_tips.tags:
+                            self.evaluate_true_cardinality_plan(conn, cur, original_query)
 
                     if evaluate_optimizations and "dml" not in original_query.optimizer_tips.tags:
                         self.logger.debug("Evaluating optimizations...")
@@ -132,91 +309,527 @@ class Scenario:
                     raise e
                 finally:
                     counter += 1
+                    original_query.notices = dict(
+                        self.get_notices_counters(conn) - notices_before) or None
 
             conn.rollback()
 
+            loader.append_query_to_checkpoint(original_query, self.config.output)
+
+    def start_query_budget(self, remaining_queries):
+        if self.run_deadline is not None and time.monotonic() >= self.run_deadline:
+            self.budget_exhausted = True
+            return False
+
+        self.remaining_queries = remaining_queries
+        return True
+
+    def get_optimizations_deadline(self):
+        # query budget covers optimizations only, default query is explained and timed before,
+        # remaining run time is split equally, so time left by fast queries goes to next ones
+        now = time.monotonic()
+        budgets = [self.config.query_budget] if self.config.query_budget else []
+        if self.run_deadline is not None:
+            budgets.append(max(self.run_deadline - now, 0) / self.remaining_queries)
+
+        return now + min(budgets) if budgets else None
+
+    def evaluate_true_cardinality_plan(self, connection, cur, original_query):
+        # same query planned with actual join cardinalities separates estimation errors
+        # from cost model errors
+        try:
+            analyzed_plan = original_query.execution_plan
+            if not analyzed_plan.get_join_cardinalities():
+                evaluate_sql(cur, original_query.get_explain_analyze())
+                analyzed_plan = self.config.database.fetch_execution_plan(cur)
+
+                connection.rollback()
+                self.sut_database.prepare_query_execution(cur)
+
+            optimization = self.config.database.get_cardinality_optimization(original_query,
+                                                                             analyzed_plan)
+            if not optimization:
+                return
+
+            evaluate_sql(cur, optimization.get_explain())
+            optimization.execution_plan = self.config.database.fetch_execution_plan(cur)
+
+            connection.rollback()
+            self.sut_database.prepare_query_execution(cur)
+        except psycopg2.errors.QueryCanceled as e:
+            self.logger.debug(f"Getting true cardinality plan failed with {e}")
+
+            connection.rollback()
+            self.sut_database.prepare_query_execution(cur)
+            return
+
+        self.measure_execution_time(cur, optimization, connection)
+        original_query.true_cardinality_plan = optimization
+
     def evaluate_optimizations(self, connection, cur, original_query):
-        # build all possible optimizations
+        state = OptimizationsState(
+            min_execution_time=original_query.execution_time_ms
+            if original_query.execution_time_ms > 0 else (self.config.test_query_timeout * 1000),
+            incumbent_cost=original_query.execution_plan.get_estimated_cost()
+            if original_query.execution_time_ms > 0 else None,
+            deadline=self.get_optimizations_deadline())
+
+        if strategy := self.config.database.get_search_strategy(original_query):
+            return self.evaluate_search_strategy(connection, cur, original_query, state, strategy)
+
+        explain_all = self.config.explain_first or self.config.cost_guided or \
+            self.config.plan_clustering
+        if not explain_all:
+            return self.evaluate_optimization_batches(connection, cur, original_query, state)
+
+        # explain first, cost guided and clustered search need the whole hints space at once
         database = self.config.database
         list_of_optimizations = database.get_list_optimizations(original_query)
 
         self.logger.debug(f"{len(list_of_optimizations)} optimizations generated")
-        progress_bar = tqdm(list_of_optimizations)
-        num_skipped = 0
-        min_execution_time = original_query.execution_time_ms if original_query.execution_time_ms > 0 else (
-                    self.config.test_query_timeout * 1000)
+        original_query.optimizations = list(list_of_optimizations)
+
+        plan_classes = None
+        self.run_optimizations(connection, cur, original_query, list_of_optimizations, state,
+                               self.explain_optimization)
+        candidates = [optimization for optimization in list_of_optimizations
+                      if optimization.execution_plan and optimization.execution_plan.full_str]
+
+        if self.config.explain_first or self.config.plan_clustering:
+            plan_classes = self.group_by_plan(candidates)
+            self.logger.debug(f"{len(list_of_optimizations)} optimizations collapsed "
+                              f"into {len(plan_classes)} distinct plans")
+            candidates = [members[0] for members in plan_classes.values()]
+
+        if self.config.cost_guided or self.config.plan_clustering:
+            candidates = self.order_by_expected_cost(candidates)
+        elif state.deadline is not None:
+            candidates = self.interleave_join_orders(candidates)
+
+        clusters = None
+        if self.config.plan_clustering:
+            clusters = cluster_plans(candidates, self.config.plan_similarity)
+            self.logger.debug(f"{len(candidates)} distinct plans clustered "
+                              f"into {len(clusters)} clusters")
+            candidates = [get_medoid(cluster) for cluster in clusters]
+
+        self.run_optimizations(connection, cur, original_query, candidates, state,
+                               self.evaluate_optimization)
+
+        if clusters:
+            self.evaluate_best_cluster(connection, cur, original_query, clusters, state)
+
+        if plan_classes:
+            self.copy_representative_measurements(plan_classes)
+
+        evaluated = self.drop_unexplained_optimizations(original_query, state)
+        original_query.search_stats = SearchStats(
+            total=len(list_of_optimizations),
+            timed=state.num_timed,
+            pruned=state.num_pruned,
+            # optimizations without a plan (failed or timed out EXPLAIN) are not duplicates
+            deduplicated=sum(len(members) - 1 for members in plan_classes.values())
+            if plan_classes else 0,
+            evaluated=evaluated,
+            clusters=len(clusters) if clusters else None)
+        self.logger.debug(f"Optimizations search: {original_query.search_stats}")
+
+        if self.config.cost_guided:
+            self.hints_history.record(original_query,
+                                      original_query.get_best_optimization(self.config))
+
+        return list_of_optimizations
+
+    def evaluate_best_cluster(self, connection, cur, original_query, clusters, state):
+        # only plans similar to the fastest medoid are worth timing,
+        # other clusters are represented by their medoids
+        timed_clusters = [cluster for cluster in clusters
+                          if get_medoid(cluster).execution_time_ms > 0]
+        if not timed_clusters:
+            return
+
+        best_cluster = min(timed_clusters, key=lambda cluster: get_medoid(cluster).execution_time_ms)
+        self.logger.debug(f"Evaluating {len(best_cluster) - 1} plans near the best cluster medoid")
+        self.run_optimizations(connection, cur, original_query, best_cluster[1:], state,
+                               self.evaluate_optimization)
+
+    def evaluate_search_strategy(self, connection, cur, original_query, state, strategy):
+        # estimated cost is the fitness of explored optimizations,
+        # only the cheapest distinct plans are timed
+        progress_bar = tqdm(total=self.config.search_budget)
+
+        def fitness(optimizations):
+            self.run_optimizations(connection, cur, original_query, optimizations, state,
+                                   self.explain_optimization, progress_bar)
+
+            return [optimization.execution_plan.get_estimated_cost()
+                    if optimization.execution_plan and optimization.execution_plan.full_str
+                    else None
+                    for optimization in optimizations]
+
+        optimizations = strategy.search(fitness, state.is_out_of_budget)
+        progress_bar.close()
+        original_query.optimizations = optimizations
+
+        plan_classes = self.group_by_plan(
+            [optimization for optimization in optimizations if optimization.execution_plan])
+        candidates = self.order_by_expected_cost(
+            [members[0] for members in plan_classes.values()])[:self.config.search_timed_plans]
+        self.logger.debug(f"{len(optimizations)} optimizations explored, "
+                          f"{len(candidates)} cheapest distinct plans are evaluated")
+
+        self.run_optimizations(connection, cur, original_query, candidates, state,
+                               self.evaluate_optimization)
+
+        # explored optimizations with the same plan as a timed one get its measurements,
+        # plans which are not among the cheapest stay without measurements
+        timed_ids = {id(candidate) for candidate in candidates}
+        self.copy_representative_measurements(
+            {plan_digest: members for plan_digest, members in plan_classes.items()
+             if id(members[0]) in timed_ids})
+
+        original_query.search_stats = SearchStats(
+            total=len(optimizations),
+            timed=state.num_timed,
+            pruned=state.num_pruned,
+            evaluated=len(optimizations))
+        self.logger.debug(f"Optimizations search: {original_query.search_stats}")
+
+        return optimizations
+
+    def evaluate_optimization_batches(self, connection, cur, original_query, state):
+        # optimizations are generated lazily and evaluated batch by batch,
+        # under a time budget each batch is evaluated round-robin over join orders
         original_query.optimizations = []
-        execution_plans_checked = set()
+        total = 0
+        progress_bar = tqdm()
+        batches = self.config.database.get_optimization_batches(original_query)
+        for batch in batches:
+            total += len(batch)
+            original_query.optimizations += batch
+            if state.deadline is not None:
+                batch = self.interleave_join_orders(batch)
+
+            progress_bar.total = total
+            self.run_optimizations(connection, cur, original_query, batch, state,
+                                   self.evaluate_optimization, progress_bar)
+
+            if state.is_out_of_budget():
+                # rest of the hints space is only counted for the coverage
+                total += sum(len(rest) for rest in batches)
+                break
+        progress_bar.close()
+
+        evaluated = self.drop_unexplained_optimizations(original_query, state)
+        self.logger.debug(f"{total} optimizations generated")
+        original_query.search_stats = SearchStats(
+            total=total,
+            timed=state.num_timed,
+            pruned=state.num_pruned,
+            evaluated=evaluated)
+        self.logger.debug(f"Optimizations search: {original_query.search_stats}")
+
+        return original_query.optimizations
+
+    @staticmethod
+    def drop_unexplained_optimizations(original_query, state):
+        """
+        Optimizations are stored in generation order regardless of the evaluation order.
+        If the budget is out, optimizations that were not even explained are dropped from results.
+        Returns the number of explained optimizations.
+        """
+        evaluated = sum(optimization.execution_plan is not None
+                        for optimization in original_query.optimizations)
+        if state.is_out_of_budget():
+            original_query.optimizations = [optimization
+                                            for optimization in original_query.optimizations
+                                            if optimization.execution_plan is not None]
+
+        return evaluated
+
+    @staticmethod
+    def interleave_join_orders(optimizations):
+        # round-robin over join hints, so that limited budget covers as many join orders
+        # as possible instead of all scan variants of the first ones
+        join_groups = {}
+        for optimization in optimizations:
+            join_hints = re.sub(SCAN_HINT_REGEX, "", optimization.explain_hints).strip()
+            join_groups.setdefault(join_hints, []).append(optimization)
+
+        return [optimization
+                for group_optimizations in itertools.zip_longest(*join_groups.values())
+                for optimization in group_optimizations if optimization is not None]
+
+    def order_by_expected_cost(self, optimizations):
+        # cheapest plans with historically winning hints go first to get a good incumbent early
+        def expected_cost(optimization):
+            estimated_cost = optimization.execution_plan.get_estimated_cost()
+            if estimated_cost is None:
+                return float("inf")
+
+            return estimated_cost / (1 + self.hints_history.win_rate(optimization.explain_hints))
+
+        return sorted(optimizations, key=expected_cost)
+
+    def run_optimizations(self, connection, cur, original_query, optimizations, state, action,
+                          progress_bar=None):
+        own_progress_bar = progress_bar is None
+        if own_progress_bar:
+            progress_bar = tqdm(total=len(optimizations))
+
+        if self.config.workers > 1 and len(optimizations) > 1:
+            self.run_optimizations_in_parallel(original_query, optimizations, state, action,
+                                               progress_bar)
+        else:
+            self.set_optimization_timeout(cur, original_query, state)
+            for optimization in optimizations:
+                if state.is_out_of_budget():
+                    break
 
-        for optimization in progress_bar:
-            # in case of enable statistics enabled
-            # we can get failure here and throw timeout
-            original_query.optimizations.append(optimization)
+                action(connection, cur, original_query, optimization, state)
 
-            # set maximum execution time if this is first query,
-            # or we are evaluating queries near best execution time
-            if self.config.look_near_best_plan or len(original_query.optimizations) == 1:
-                optimizer_query_timeout = \
-                    (original_query.optimizer_tips and original_query.optimizer_tips.max_timeout) or \
-                    f"{int(min_execution_time / 1000) + int(self.config.skip_timeout_delta)}"
+                progress_bar.update()
+                progress_bar.set_postfix(
+                    {'skipped': state.num_skipped,
+                     'min_execution_time_ms': state.min_execution_time})
 
-                self.sut_database.set_query_timeout(cur, optimizer_query_timeout)
+        if own_progress_bar:
+            progress_bar.close()
 
-            self.try_to_get_default_explain_hints(cur, optimization, original_query)
+        # representatives are measured by now, even if other workers picked up the duplicates
+        self.copy_representative_measurements(state.effective_hints_classes)
 
-            try:
-                evaluate_sql(cur, optimization.get_explain())
-                optimization.execution_plan = database.get_execution_plan(
-                    '\n'.join(
-                        str(item[0]) for item in cur.fetchall()))
+    def run_optimizations_in_parallel(self, original_query, optimizations, state, action,
+                                      progress_bar):
+        candidates = queue.SimpleQueue()
+        for optimization in optimizations:
+            candidates.put(optimization)
 
-                connection.rollback()
+        def run_with_worker(worker_connection):
+            conn = worker_connection.conn
+            with conn.cursor() as cur:
                 self.sut_database.prepare_query_execution(cur)
-            except psycopg2.errors.QueryCanceled as e:
-                # failed by timeout - it's ok just skip optimization
-                self.logger.debug(f"Getting execution plan failed with {e}")
+                self.set_optimization_timeout(cur, original_query, state)
 
-                num_skipped += 1
-                optimization.execution_time_ms = 0
-                optimization.execution_plan = database.get_execution_plan("")
-                continue
+                while not state.is_out_of_budget():
+                    try:
+                        optimization = candidates.get_nowait()
+                    except queue.Empty:
+                        break
 
-            exec_plan_md5 = get_md5(optimization.execution_plan.get_clean_plan())
-            not_unique_plan = exec_plan_md5 in execution_plans_checked
-            execution_plans_checked.add(exec_plan_md5)
-
-            if self.config.plans_only:
-                original_query.execution_time_ms = \
-                    original_query.execution_plan.get_estimated_cost()
-            elif not_unique_plan or not calculate_avg_execution_time(
-                    cur,
-                    optimization,
-                    self.sut_database,
-                    num_retries=int(self.config.num_retries),
-                    connection=connection):
-                num_skipped += 1
-
-            # get new minimum execution time
-            if optimization.execution_time_ms != 0 and \
-                    optimization.execution_time_ms < min_execution_time:
-                min_execution_time = optimization.execution_time_ms
-
-            progress_bar.set_postfix(
-                {'skipped': num_skipped, 'min_execution_time_ms': min_execution_time})
+                    action(conn, cur, original_query, optimization, state)
 
-        return list_of_optimizations
+                    with state.lock:
+                        progress_bar.update()
+                        progress_bar.set_postfix(
+                            {'skipped': state.num_skipped,
+                             'min_execution_time_ms': state.min_execution_time})
 
-    def try_to_get_default_explain_hints(self, cur, optimization, original_query):
-        if not original_query.explain_hints:
-            if self.config.enable_statistics or optimization.execution_plan is None:
-                evaluate_sql(cur, optimization.get_heuristic_explain())
+            conn.rollback()
 
-                execution_plan = self.config.database.get_execution_plan('\n'.join(
-                    str(item[0]) for item in cur.fetchall()))
-            else:
-                execution_plan = optimization.execution_plan
+        workers = self.get_worker_connections()[:len(optimizations)]
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            futures = [executor.submit(run_with_worker, worker) for worker in workers]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def group_by_plan(optimizations):
+        # first optimization in generation order represents the whole plan class
+        plan_classes = {}
+        for optimization in optimizations:
+            if optimization.execution_plan.get_clean_plan():
+                plan_classes.setdefault(optimization.execution_plan.plan_digest,
+                                        []).append(optimization)
+
+        return plan_classes
+
+    @staticmethod
+    def copy_representative_measurements(plan_classes):
+        for representative, *members in plan_classes.values():
+            for optimization in members:
+                optimization.representative_hints = representative.explain_hints
+                optimization.execution_time_ms = representative.execution_time_ms
+                optimization.execution_time_precision = representative.execution_time_precision
+                optimization.execution_times = representative.execution_times
+                optimization.execution_stats = representative.execution_stats
+                optimization.planning_time_ms = representative.planning_time_ms
+                optimization.result_cardinality = representative.result_cardinality
+                optimization.result_hash = representative.result_hash
+                optimization.cached = representative.cached
+                optimization.parameters = representative.parameters
+
+    def get_worker_connections(self):
+        if not self.worker_connections:
+            self.logger.info(f"Opening {self.config.workers} worker connections")
+            for _ in range(self.config.workers):
+                worker_connection = self.sut_database.create_connection(
+                    self.config.connection.database)
+                worker_connection.conn.autocommit = False
+                self.worker_connections.append(worker_connection)
+
+        return self.worker_connections
+
+    def get_notices_counters(self, conn):
+        counters = self.config.database.get_notices_counters(conn)
+        for worker_connection in self.worker_connections:
+            counters += self.config.database.get_notices_counters(worker_connection.conn)
+
+        return counters
+
+    def close_worker_connections(self):
+        for worker_connection in self.worker_connections:
+            watchdog = self.watchdogs.pop(id(worker_connection.conn), None)
+            if watchdog:
+                watchdog.stop()
+            worker_connection.close()
+
+        self.worker_connections = []
+
+    def get_watchdog(self, conn):
+        if not self.config.watchdog_grace_ms:
+            return None
+
+        with self.lock:
+            if id(conn) not in self.watchdogs:
+                self.watchdogs[id(conn)] = CancelWatchdog(conn, self.config.watchdog_grace_ms)
+
+            return self.watchdogs[id(conn)]
+
+    def stop_watchdogs(self):
+        for watchdog in self.watchdogs.values():
+            if watchdog.num_cancelled:
+                self.logger.info(f"{watchdog.num_cancelled} statements cancelled by client watchdog")
+            watchdog.stop()
+
+        self.watchdogs = {}
+
+    def set_statement_timeout(self, cur, timeout_ms):
+        self.sut_database.set_query_timeout_ms(cur, timeout_ms)
+
+        if watchdog := self.get_watchdog(cur.connection):
+            watchdog.timeout_ms = timeout_ms
+
+    def set_optimization_timeout(self, cur, original_query, state):
+        min_execution_time = state.min_execution_time
+        if original_query.optimizer_tips and original_query.optimizer_tips.max_timeout:
+            timeout_ms = get_timeout_ms(original_query.optimizer_tips.max_timeout)
+        elif self.config.timeout_multiplier:
+            timeout_ms = max(min_execution_time * self.config.timeout_multiplier,
+                             self.config.timeout_floor_ms)
+        else:
+            timeout_ms = (int(min_execution_time / 1000) + int(self.config.skip_timeout_delta)) * 1000
+
+        if state.deadline is not None:
+            # a statement can't run past the remaining time budget of the query
+            timeout_ms = min(timeout_ms, max((state.deadline - time.monotonic()) * 1000, 1))
+
+        self.set_statement_timeout(cur, timeout_ms)
+
+    def explain_optimization(self, connection, cur, original_query, optimization, state):
+        # in case of enable statistics enabled
+        # we can get failure here and throw timeout
+        self.try_to_get_default_explain_hints(cur, optimization, original_query, state)
+
+        try:
+            self.config.database.clear_notices(connection)
+            evaluate_sql(cur, optimization.get_explain())
+            optimization.execution_plan = self.config.database.fetch_execution_plan(cur)
+            optimization.effective_hints, optimization.ignored_hints = \
+                self.config.database.get_hints_usage(connection)
+
+            connection.rollback()
+            self.sut_database.prepare_query_execution(cur)
+        except psycopg2.errors.QueryCanceled as e:
+            # failed by timeout - it's ok just skip optimization
+            self.logger.debug(f"Getting execution plan failed with {e}")
+
+            optimization.execution_time_ms = 0
+            optimization.execution_plan = self.config.database.get_execution_plan("")
+            with state.lock:
+                state.num_skipped += 1
+            return False
+
+        return True
+
+    def evaluate_optimization(self, connection, cur, original_query, optimization, state):
+        # set maximum execution time if we are evaluating queries near best execution time
+        # or the remaining time budget shrinks
+        if self.config.look_near_best_plan or state.deadline is not None:
+            self.set_optimization_timeout(cur, original_query, state)
+
+        if optimization.execution_plan is None and \
+                not self.explain_optimization(connection, cur, original_query, optimization, state):
+            return
+
+        exec_plan_md5 = optimization.execution_plan.plan_digest
+        with state.lock:
+            not_unique_plan = exec_plan_md5 in state.execution_plans_checked
+            state.execution_plans_checked.add(exec_plan_md5)
+
+            # hints ignored by pg_hint_plan do not change anything, so same effective hints
+            # will give the same execution time
+            if optimization.effective_hints is not None:
+                not_unique_plan |= optimization.effective_hints in state.effective_hints_classes
+                state.effective_hints_classes.setdefault(optimization.effective_hints,
+                                                         []).append(optimization)
+
+        if self.is_pruned_by_cost(optimization, state):
+            self.logger.debug(f"Pruning optimization by estimated cost: {optimization.explain_hints}")
+            with state.lock:
+                state.num_skipped += 1
+                state.num_pruned += 1
+            return
+
+        if self.config.plans_only:
+            original_query.execution_time_ms = \
+                original_query.execution_plan.get_estimated_cost()
+        elif not_unique_plan:
+            with state.lock:
+                state.num_skipped += 1
+        elif not self.measure_execution_time(cur, optimization, connection):
+            with state.lock:
+                state.num_skipped += 1
+                # timed out because of the tightened timeout
+                if optimization.execution_time_ms < 0:
+                    state.num_pruned += 1
+        else:
+            with state.lock:
+                state.num_timed += 1
+
+        # get new minimum execution time
+        with state.lock:
+            if 0 < optimization.execution_time_ms < state.min_execution_time:
+                state.min_execution_time = optimization.execution_time_ms
+                state.incumbent_cost = optimization.execution_plan.get_estimated_cost()
+
+    def is_pruned_by_cost(self, optimization, state):
+        if not self.config.cost_guided or not self.config.cost_prune_factor:
+            return False
+
+        with state.lock:
+            incumbent_cost = state.incumbent_cost
+
+        estimated_cost = optimization.execution_plan.get_estimated_cost()
 
-            if original_query.compare_plans(execution_plan) and original_query.tips_looks_fair(
-                    optimization):
-                # store execution plan hints from optimization
-                original_query.explain_hints = optimization.explain_hints
+        return incumbent_cost is not None and estimated_cost is not None and \
+            estimated_cost > incumbent_cost * self.config.cost_prune_factor
+
+    def try_to_get_default_explain_hints(self, cur, optimization, original_query, state):
+        with state.lock:
+            if original_query.explain_hints:
+                return
+
+        if self.config.enable_statistics or optimization.execution_plan is None:
+            evaluate_sql(cur, optimization.get_heuristic_explain())
+
+            execution_plan = self.config.database.fetch_execution_plan(cur)
+        else:
+            execution_plan = optimization.execution_plan
+
+        if original_query.compare_plans(execution_plan) and original_query.tips_looks_fair(
+                optimization):
+            # store execution plan hints from optimization, first worker wins
+            with state.lock:
+                if not original_query.explain_hints:
+                    original_query.explain_hints = optimization.explain_hints
@@ -1,5 +1,7 @@
 import hashlib
+import math
 import re
+import statistics
 import time
 import traceback
 from copy import copy
@@ -9,10 +11,28 @@ from sql_metadata import Parser
 
 from config import Config
 from db.database import Database
-from objects import Query
+from objects import Query, ExecutionStats
+from query_watchdog import watch
 
 PARAMETER_VARIABLE = r"[^'](\%\((.*?)\))"
+JOIN_PREDICATE = r"\b(\w+)\.\w+\s*=\s*(\w+)\.\w+\b"
 WITH_ORDINALITY = r"[Ww][Ii][Tt][Hh]\s*[Oo][Rr][Dd][Ii][Nn][Aa][Ll][Ii][Tt][yY]\s*[Aa][Ss]\s*.*(.*)"
+TRIMMED_MEAN_SHARE = 0.1
+DEFAULT_FETCH_SIZE = 10000
+RESULT_CURSOR_NAME = "taqo_result"
+LEADING_HINTS_COMMENT = r"^\s*(/\*\+.*?\*/)"
+FINGERPRINT_QUERY = "SELECT count(*), coalesce(md5(string_agg(row_hash, '' ORDER BY row_hash)), '') " \
+                    "FROM (SELECT md5(result_row::text) AS row_hash FROM ({query}) result_row) hashed_rows"
+DISCARD_RESULT_EXPLAIN = "EXPLAIN (ANALYZE, TIMING OFF)"
+PLANNING_SUMMARY_EXPLAIN = "EXPLAIN (SUMMARY ON)"
+PREPARED_STATEMENT_NAME = "taqo_statement"
+# %s placeholders outside of string literals, quoted identifiers and comments
+PREPARED_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|%s", re.DOTALL)
+PLANNING_TIME = re.compile(r"Planning\sTime:\s(\d+\.\d+)\sms")
+# two-sided Student's t critical values for 95% confidence, 1..30 degrees of freedom
+T_VALUES_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+               2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+               2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
 
 
 def current_milli_time():
@@ -48,12 +68,146 @@ def get_result(cur, is_dml):
     return cardinality, str_result
 
 
+def get_result_digest(cur, is_dml, fetch_size, cursor_name=None):
+    if is_dml:
+        return cur.rowcount, get_md5(f"{cur.rowcount} updates")
+
+    # same digest as md5 of all concatenated cell values, without building the string
+    digest = hashlib.md5()
+    cardinality = 0
+    while rows := fetch_result_rows(cur, fetch_size, cursor_name):
+        for row in rows:
+            cardinality += 1
+            for column_value in row:
+                digest.update(str(column_value).encode('utf-8'))
+
+    return cardinality, str(digest.hexdigest())
+
+
+def fetch_result_rows(cur, fetch_size, cursor_name=None):
+    if cursor_name:
+        cur.execute(f"FETCH FORWARD {fetch_size} FROM {cursor_name}")
+        return cur.fetchall()
+
+    return cur.fetchmany(fetch_size)
+
+
+def evaluate_streamed_sql(connection, cur, sql, is_dml):
+    """
+    Execute query and hash its result batch by batch, using a server-side cursor
+    so that client memory does not depend on the result size.
+    """
+    fetch_size = Config().result_fetch_size
+
+    # cursors can be declared only for queries and inside a transaction
+    if is_dml or not fetch_size or connection.autocommit:
+        parameters = evaluate_sql(cur, sql)
+        return parameters, *get_result_digest(cur, is_dml, fetch_size or DEFAULT_FETCH_SIZE)
+
+    # cursor is declared explicitly, since psycopg2 named cursors put DECLARE in front of hints
+    hints, sql = split_leading_hints(sql)
+    parameters = evaluate_sql(
+        cur, f"{hints}DECLARE {RESULT_CURSOR_NAME} NO SCROLL CURSOR FOR {sql.strip().rstrip(';')}")
+    cardinality, result_hash = get_result_digest(cur, is_dml, fetch_size, RESULT_CURSOR_NAME)
+    cur.execute(f"CLOSE {RESULT_CURSOR_NAME}")
+
+    return parameters, cardinality, result_hash
+
+
+def split_leading_hints(sql):
+    # hints must stay in front of the wrapping statement to be picked up by pg_hint_plan
+    if match := re.match(LEADING_HINTS_COMMENT, sql, re.DOTALL):
+        return f"{match.group(1)} ", sql[match.end():]
+
+    return "", sql
+
+
+def get_fingerprint_query(sql):
+    hints, sql = split_leading_hints(sql)
+
+    return hints + FINGERPRINT_QUERY.format(query=sql.strip().rstrip(";"))
+
+
+def evaluate_fingerprint_sql(cur, sql):
+    parameters = evaluate_sql(cur, get_fingerprint_query(sql))
+    cardinality, fingerprint = cur.fetchone()
+
+    return parameters, cardinality, fingerprint
+
+
+def prepare_statement(cur, sql):
+    config = Config()
+
+    hints, sql = split_leading_hints(sql)
+    parameters, sql, sql_wo_parameters = parse_clear_and_parametrized_sql(sql)
+
+    if config.parametrized and parameters:
+        sql = get_prepared_sql(sql)
+    else:
+        parameters = []
+        sql = sql_wo_parameters
+
+    # prepared statements are not transactional, so drop leftovers from failed runs first
+    evaluate_sql(cur, "DEALLOCATE ALL")
+    evaluate_sql(cur, f"{hints}PREPARE {PREPARED_STATEMENT_NAME} AS {sql.strip().rstrip(';')}")
+
+    return parameters
+
+
+def get_prepared_sql(sql):
+    # %s placeholders become $1, $2, ... parameters, same text in literals and comments is kept
+    placeholders = iter(range(1, sql.count("%s") + 1))
+
+    return PREPARED_PLACEHOLDER.sub(
+        lambda match: f"${next(placeholders)}" if match.group(0) == "%s" else match.group(0), sql)
+
+
+def evaluate_prepared_sql(cur, parameters, explain_clause=None):
+    arguments = f"({', '.join(['%s'] * len(parameters))})" if parameters else ""
+    sql = f"EXECUTE {PREPARED_STATEMENT_NAME}{arguments}"
+    if explain_clause:
+        sql = f"{explain_clause} {sql}"
+
+    Config().logger.debug(f"{sql} {parameters}")
+
+    try:
+        cur.execute(sql, parameters or None)
+    except psycopg2.errors.QueryCanceled as e:
+        cur.connection.rollback()
+        raise e
+
+    return parameters
+
+
+def evaluate_timed_sql(cur, sql, prepared_parameters=None, explain_clause=None):
+    if prepared_parameters is not None:
+        return evaluate_prepared_sql(cur, prepared_parameters, explain_clause)
+
+    return evaluate_sql(cur, f"{explain_clause} {sql}" if explain_clause else sql)
+
+
+def get_planning_time(cur, prepared_parameters):
+    # plans the prepared statement the same way as EXECUTE does, without executing it
+    evaluate_prepared_sql(cur, prepared_parameters, PLANNING_SUMMARY_EXPLAIN)
+    _, result = get_result(cur, False)
+
+    return extract_planning_time(result)
+
+
+def extract_planning_time(result):
+    if match := PLANNING_TIME.search(result):
+        return float(match.groups()[0])
+
+    return None
+
+
 def calculate_avg_execution_time(cur,
                                  query: Query,
                                  sut_database: Database,
                                  query_str: str = None,
                                  num_retries: int = 0,
-                                 connection=None) -> object:
+                                 connection=None,
+                                 watchdog=None) -> object:
     config = Config()
 
     query_str = query_str or query.get_query()
@@ -61,46 +215,89 @@ def calculate_avg_execution_time(cur,
 
     with_analyze = query_with_analyze(query_str_lower)
     is_dml = query_is_dml(query_str_lower)
+    server_side_fingerprint = config.server_side_fingerprint and not is_dml and not with_analyze
+    prepared = config.prepared and not with_analyze
+    prepared_parameters = None
 
-    sum_execution_times = 0
-    actual_evaluations = 0
+    execution_times = []
+    planning_times = []
 
     # run at least one iteration
     num_retries = max(num_retries, 2)
     num_warmup = config.num_warmup
 
-    for iteration in range(num_retries + num_warmup):
+    iteration = 0
+    started_at = current_milli_time()
+    while iteration < num_warmup or (need_more_samples(config, execution_times, started_at)
+                                     if config.adaptive_retries
+                                     else iteration < num_retries + num_warmup):
         # noinspection PyUnresolvedReferences
         try:
-            start_time = current_milli_time()
-            query.parameters = evaluate_sql(cur, query_str)
-
-            result = None
-            if iteration >= num_warmup and with_analyze:
-                _, result = get_result(cur, is_dml)
-                connection.rollback()
-                # todo make wrapper for this
-                sut_database.prepare_query_execution(cur)
-
-                # get cardinality for queries with analyze
-                evaluate_sql(cur, query.get_query())
-                cardinality, _ = get_result(cur, is_dml)
-                connection.rollback()
-                sut_database.prepare_query_execution(cur)
-
-                sum_execution_times += extract_execution_time_from_analyze(result)
-                query.result_cardinality = cardinality
-            else:
-                sum_execution_times += current_milli_time() - start_time
-
-            if iteration == 0:
-                if not result:
-                    cardinality, result = get_result(cur, is_dml)
-                    query.result_cardinality = cardinality
+            with watch(watchdog):
+                if prepared and iteration == 0:
+                    prepared_parameters = prepare_statement(cur, query_str)
+                    if not server_side_fingerprint:
+                        # planned once before any EXECUTE, extra plannings between timed runs
+                        # would shift custom to generic plan switch of plan_cache_mode = auto
+                        planning_times.append(get_planning_time(cur, prepared_parameters) or 0)
+
+                if server_side_fingerprint:
+                    if iteration == 0:
+                        query.parameters, query.result_cardinality, query.result_hash = \
+                            evaluate_fingerprint_sql(cur, query_str)
+                        connection.rollback()
+                        sut_database.prepare_query_execution(cur)
+
+                    evaluate_timed_sql(cur, query_str, prepared_parameters, DISCARD_RESULT_EXPLAIN)
+                    _, result = get_result(cur, is_dml)
+                    if iteration >= num_warmup:
+                        execution_times.append(extract_execution_time_from_analyze(result))
+                        if prepared:
+                            planning_times.append(extract_planning_time(result) or 0)
+                    continue
+
+                if iteration == 0 and iteration < num_warmup and not with_analyze:
+                    # validation pass is not timed, so result can be streamed
+                    query.parameters, query.result_cardinality, query.result_hash = \
+                        evaluate_streamed_sql(connection, cur, query_str, is_dml)
+                    connection.rollback()
+                    sut_database.prepare_query_execution(cur)
+                    continue
+
+                start_time = current_milli_time()
+                query.parameters = evaluate_timed_sql(cur, query_str, prepared_parameters)
+
+                result = None
+                if iteration >= num_warmup and with_analyze:
+                    _, result = get_result(cur, is_dml)
+                    connection.rollback()
+                    # todo make wrapper for this
+                    sut_database.prepare_query_execution(cur)
+
+                    # get cardinality for queries with analyze
+                    _, cardinality, _ = evaluate_streamed_sql(connection, cur, query.get_query(), is_dml)
                     connection.rollback()
                     sut_database.prepare_query_execution(cur)
 
-                query.result_hash = get_md5(result)
+                    execution_times.append(extract_execution_time_from_analyze(result))
+                    query.result_cardinality = cardinality
+                elif iteration >= num_warmup:
+                    execution_times.append(current_milli_time() - start_time)
+
+                if iteration == 0:
+                    if result:
+                        query.result_hash = get_md5(result)
+                    elif with_analyze or is_dml:
+                        query.result_cardinality, query.result_hash = \
+                            get_result_digest(cur, is_dml, config.result_fetch_size or DEFAULT_FETCH_SIZE)
+                        connection.rollback()
+                        sut_database.prepare_query_execution(cur)
+                    else:
+                        # without warmup the first run is timed, so result is streamed once more
+                        query.parameters, query.result_cardinality, query.result_hash = \
+                            evaluate_streamed_sql(connection, cur, query_str, is_dml)
+                        connection.rollback()
+                        sut_database.prepare_query_execution(cur)
         except psycopg2.errors.QueryCanceled:
             # failed by timeout - it's ok just skip optimization
             query.execution_time_ms = -1
@@ -114,14 +311,79 @@ def calculate_avg_execution_time(cur,
             traceback.print_exc(limit=None, file=None, chain=True)
             return False
         finally:
-            if iteration >= num_warmup:
-                actual_evaluations += 1
+            iteration += 1
 
-    query.execution_time_ms = sum_execution_times / actual_evaluations
+    if planning_times:
+        query.planning_time_ms = sum(planning_times) / len(planning_times)
+
+    query.execution_time_ms = sum(execution_times) / len(execution_times)
+    query.execution_time_precision = get_relative_precision(execution_times)
+    query.execution_times = [round(execution_time, 3) for execution_time in execution_times]
+    query.execution_stats = get_execution_stats(execution_times)
 
     return True
 
 
+def need_more_samples(config, execution_times, started_at):
+    if len(execution_times) < 2:
+        return True
+
+    if len(execution_times) >= config.max_retries:
+        return False
+
+    if config.adaptive_time_budget and \
+            current_milli_time() - started_at > config.adaptive_time_budget * 1000:
+        return False
+
+    precision = get_relative_precision(execution_times)
+
+    return precision is not None and precision > config.target_precision
+
+
+def get_execution_stats(execution_times):
+    if not execution_times:
+        return None
+
+    sorted_times = sorted(execution_times)
+    median = statistics.median(sorted_times)
+    trimmed = sorted_times[int(len(sorted_times) * TRIMMED_MEAN_SHARE):
+                           len(sorted_times) - int(len(sorted_times) * TRIMMED_MEAN_SHARE)]
+
+    return ExecutionStats(
+        p50=median,
+        p90=get_percentile(sorted_times, 0.9),
+        p99=get_percentile(sorted_times, 0.99),
+        min=sorted_times[0],
+        stddev=statistics.stdev(sorted_times) if len(sorted_times) > 1 else 0,
+        mad=statistics.median(abs(execution_time - median) for execution_time in sorted_times),
+        trimmed_mean=statistics.fmean(trimmed))
+
+
+def get_percentile(sorted_times, percentile):
+    # linear interpolation between closest ranks
+    position = (len(sorted_times) - 1) * percentile
+    lower = math.floor(position)
+    upper = math.ceil(position)
+
+    return sorted_times[lower] + (sorted_times[upper] - sorted_times[lower]) * (position - lower)
+
+
+def get_relative_precision(execution_times):
+    # relative half-width of the 95% confidence interval of the mean
+    if len(execution_times) < 2:
+        return None
+
+    mean = statistics.fmean(execution_times)
+    if mean <= 0:
+        return None
+
+    degrees_of_freedom = len(execution_times) - 1
+    t_value = T_VALUES_95[degrees_of_freedom - 1] \
+        if degrees_of_freedom <= len(T_VALUES_95) else 1.96
+
+    return t_value * statistics.stdev(execution_times) / math.sqrt(len(execution_times)) / mean
+
+
 def query_with_analyze(query_str_lower):
     return query_str_lower is not None and \
         "explain" in query_str_lower and \
@@ -187,6 +449,18 @@ def get_alias_table_names(sql_str, tables_in_sut):
     return table_objects_in_query
 
 
+def get_join_graph(sql_str, aliases):
+    # equality predicates between two different aliases of the query
+    join_graph = {alias: set() for alias in aliases}
+    for match in re.finditer(JOIN_PREDICATE, sql_str):
+        left, right = match.groups()
+        if left != right and left in join_graph and right in join_graph:
+            join_graph[left].add(right)
+            join_graph[right].add(left)
+
+    return join_graph
+
+
 def evaluate_sql(cur, sql):
     config = Config()
 
@@ -260,6 +534,15 @@ def parse_clear_and_parametrized_sql(sql):
     return parameters, sql, sql_wo_parameters
 
 
+def get_timeout_ms(timeout: str):
+    # accepts "500ms", "5s" or number of seconds
+    timeout = str(timeout).strip().lower()
+    if timeout.endswith("ms"):
+        return float(timeout[:-2])
+
+    return float(timeout.rstrip("s")) * 1000
+
+
 def allowed_diff(config, original_execution_time, optimization_execution_time):
     if optimization_execution_time <= 0:
         return False
@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config import Config, Singleton, init_logger  # noqa: E402
+
+PLAN = "Hash Join  (cost=0.00..150.00 rows=10 width=4)"
+ROWS = [(idx, f"value{idx}") for idx in range(25)]
+
+
+@pytest.fixture
+def config():
+    def create_config(**kwargs):
+        Singleton._instances.pop(Config, None)
+        defaults = dict(logger=init_logger("WARNING"), explain_clause="explain",
+                        skip_percentage_delta=0.15, skip_timeout_delta=1,
+                        all_pairs_threshold=3)
+        defaults.update(kwargs)
+
+        from db.postgres import Postgres
+        created = Config(**defaults)
+        created.database = Postgres(created)
+
+        return created
+
+    yield create_config
+
+    Singleton._instances.pop(Config, None)
+
+
+def get_optimization(explain_hints, plan=PLAN, execution_time_ms=0, **kwargs):
+    from db.postgres import PostgresExecutionPlan, PostgresOptimization
+
+    return PostgresOptimization(query="select 1", query_hash="hash", explain_hints=explain_hints,
+                                execution_plan=PostgresExecutionPlan(plan),
+                                execution_time_ms=execution_time_ms, **kwargs)
+
+
+class FakeCursor:
+    """
+    Records executed statements, SELECTs return ROWS and result cursors are fetched in pages.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, parameters=None):
+        self.connection.statements.append(sql)
+        if sql.startswith("FETCH FORWARD"):
+            fetch_size = int(sql.split()[2])
+            self.rows, self.connection.declared = \
+                self.connection.declared[:fetch_size], self.connection.declared[fetch_size:]
+        elif "DECLARE" in sql:
+            self.connection.declared = list(ROWS)
+        elif sql.lower().startswith("select") or sql.startswith("/*+"):
+            self.rows = list(ROWS)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    """
+    Stands for both the SUT connection wrapper and psycopg2 connection.
+    """
+
+    def __init__(self, autocommit=False):
+        self.conn = self
+        self.autocommit = autocommit
+        self.statements = []
+        self.declared = []
+        self.notices = []
+        self.num_cancels = 0
+        self.cancelled = threading.Event()
+
+    def cursor(self, **kwargs):
+        assert not kwargs, "named cursors put DECLARE in front of hints"
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def cancel(self):
+        self.num_cancels += 1
+        self.cancelled.set()
@@ -0,0 +1,92 @@
+from conftest import PLAN as HASH_JOIN_PLAN, get_optimization
+from db.postgres import PostgresExecutionPlan, PostgresQuery
+from objects import ExecutionStats
+
+NESTED_LOOP_PLAN = "Nested Loop  (cost=0.00..250.00 rows=10 width=4)"
+SEQ_SCAN_PLAN = """Hash Join  (cost=1.00..20.50 rows=10 width=8)
+  Hash Cond: (a.id = b.id)
+  ->  Seq Scan on t1 a  (cost=0.00..5.00 rows=10 width=4)
+  ->  Hash  (cost=0.00..5.00 rows=10 width=4)
+        ->  Seq Scan on t2 b  (cost=0.00..5.00 rows=10 width=4)"""
+INDEX_SCAN_PLAN = SEQ_SCAN_PLAN.replace("Seq Scan on t2 b", "Index Scan using t2_pkey on t2 b")
+
+
+def get_query(default_time=100, default_p50=None):
+    query = PostgresQuery(query="select 1", execution_plan=PostgresExecutionPlan(HASH_JOIN_PLAN),
+                          execution_time_ms=default_time,
+                          execution_stats=ExecutionStats(p50=default_p50) if default_p50 else None)
+    query.optimizations = [
+        get_optimization("HashJoin(a b)", HASH_JOIN_PLAN, 100, execution_stats=ExecutionStats(p50=100)),
+        get_optimization("NestLoop(a b)", NESTED_LOOP_PLAN, 50, execution_stats=ExecutionStats(p50=200)),
+        get_optimization("MergeJoin(a b)", NESTED_LOOP_PLAN, 52, execution_stats=ExecutionStats(p50=300)),
+    ]
+
+    return query
+
+
+def test_analysis_best_and_near_best(config):
+    query = get_query()
+    analysis = query.get_analysis(config())
+
+    assert analysis.best_optimization.explain_hints == "NestLoop(a b)"
+    assert [optimization.explain_hints for optimization in analysis.near_best_optimizations] == \
+           ["NestLoop(a b)", "MergeJoin(a b)"]
+    assert analysis.score == 0.5
+    assert analysis.better_plan_found and not analysis.same_plan
+    assert analysis.default_plan_digest == query.execution_plan.plan_digest
+    assert analysis.best_plan_digest == query.optimizations[1].execution_plan.plan_digest
+    assert query.get_analysis(config()) is analysis
+
+
+def test_analysis_recomputed_after_estimator_change(config):
+    query = get_query(default_p50=100)
+    assert query.get_analysis(config()).best_optimization.explain_hints == "NestLoop(a b)"
+
+    query.use_estimator("p50")
+
+    analysis = query.get_analysis(config())
+    assert analysis.best_optimization is query
+    assert analysis.same_plan and not analysis.better_plan_found
+    assert query.get_best_optimization(config()) is query
+
+
+def test_analysis_recomputed_for_other_skip_delta(config):
+    query = get_query()
+    assert len(query.get_analysis(config()).near_best_optimizations) == 2
+
+    assert len(query.get_analysis(config(skip_percentage_delta=0.01)).near_best_optimizations) == 1
+
+
+def test_analyses_compare_plan_digests(config):
+    yb_analysis = get_query().get_analysis(config())
+    pg_analysis = get_query().get_analysis(config())
+
+    assert yb_analysis.same_default_plan(pg_analysis)
+    assert yb_analysis.same_best_plan(pg_analysis)
+
+    no_plan = PostgresQuery(query="select 1", execution_plan=PostgresExecutionPlan(""))
+    no_plan_analysis = no_plan.get_analysis(config())
+    assert no_plan_analysis.default_plan_digest is None
+    assert not no_plan_analysis.same_default_plan(no_plan.get_analysis(config()))
+
+
+def test_heatmap_counts_near_best_plans_with_node(config):
+    config()
+    query = PostgresQuery(query="select 1", execution_plan=PostgresExecutionPlan(SEQ_SCAN_PLAN),
+                          execution_time_ms=100)
+    query.optimizations = [
+        get_optimization("SeqScan(b)", SEQ_SCAN_PLAN, 50),
+        get_optimization("IndexScan(b)", INDEX_SCAN_PLAN, 52),
+        # not near best, so its nodes are not counted
+        get_optimization("NestLoop(a b)", SEQ_SCAN_PLAN.replace("Hash Join", "Nested Loop"), 200),
+    ]
+
+    heatmap = query.heatmap()
+
+    assert [(query.get_node_signature(row['str']), row['weight']) for row in heatmap.values()] == \
+           [("Hash Join", 2), ("Seq Scan on t1 a", 2), ("Hash", 2), ("Seq Scan on t2 b", 1)]
+    assert query.heatmap() is heatmap
+
+
+def test_node_signature_ignores_conditions():
+    assert PostgresQuery.get_node_signature("  Hash Join \n  Hash Cond: (a.id = b.id)\n  ") == "Hash Join"
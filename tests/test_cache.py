@@ -0,0 +1,117 @@
+from cache import MeasurementsCache
+from conftest import get_optimization
+
+
+def get_cache(config, tmp_path, **kwargs):
+    defaults = dict(cache_path=str(tmp_path / "measurements.json"), cache_ttl=0, cache_size=0)
+    defaults.update(kwargs)
+    cache = MeasurementsCache(config(**defaults))
+    cache.set_context("PostgreSQL 15", "data")
+
+    return cache
+
+
+def get_measured_optimization(execution_time_ms=5):
+    return get_optimization("HashJoin(a b)", execution_time_ms=execution_time_ms,
+                            execution_times=[execution_time_ms], result_cardinality=3,
+                            result_hash="client_hash")
+
+
+def test_measurement_is_reused_for_same_plan(config, tmp_path):
+    cache = get_cache(config, tmp_path)
+    cache.put(get_measured_optimization())
+    cache.store()
+
+    cache = get_cache(config, tmp_path)
+    optimization = get_optimization("HashJoin(a b)")
+    assert cache.get(optimization)
+    assert optimization.cached
+    assert (optimization.execution_time_ms, optimization.result_cardinality,
+            optimization.result_hash) == (5, 3, "client_hash")
+
+
+def test_fingerprint_mode_switch_misses_cache(config, tmp_path):
+    cache = get_cache(config, tmp_path)
+    cache.put(get_measured_optimization())
+    cache.store()
+
+    cache = get_cache(config, tmp_path, server_side_fingerprint=True)
+    assert not cache.get(get_optimization("HashJoin(a b)"))
+
+    cache = get_cache(config, tmp_path, num_retries=10)
+    assert not cache.get(get_optimization("HashJoin(a b)"))
+
+
+def test_measurement_key_depends_on_plan_and_context(config, tmp_path):
+    cache = get_cache(config, tmp_path)
+    cache.put(get_measured_optimization())
+
+    assert not cache.get(get_optimization("HashJoin(a b)", "Nested Loop  (cost=0.00..1.00)"))
+    assert not cache.get(get_optimization("HashJoin(a b)", ""))
+
+    cache.set_context("PostgreSQL 15", "reloaded data")
+    assert not cache.get(get_optimization("HashJoin(a b)"))
+
+
+def test_failed_measurements_are_not_stored(config, tmp_path):
+    cache = get_cache(config, tmp_path)
+    cache.put(get_measured_optimization(execution_time_ms=-1))
+
+    assert not cache.entries
+
+
+def test_expired_measurements_are_ignored(config, tmp_path):
+    cache = get_cache(config, tmp_path, cache_ttl=1)
+    cache.put(get_measured_optimization())
+    for entry in cache.entries.values():
+        entry["stored_at"] -= 2 * 3600
+
+    assert not cache.get(get_optimization("HashJoin(a b)"))
+    cache.store()
+    assert not get_cache(config, tmp_path, cache_ttl=1).entries
+
+
+def test_oldest_measurements_are_evicted(config, tmp_path):
+    cache = get_cache(config, tmp_path, cache_size=2)
+    optimizations = [get_optimization("HashJoin(a b)", f"Hash Join  (cost=0.00..{idx}.00)",
+                                      execution_time_ms=5) for idx in range(3)]
+    for stored_at, optimization in enumerate(optimizations):
+        cache.put(optimization)
+        cache.entries[cache.get_key(optimization)]["stored_at"] = stored_at
+    cache.store()
+
+    cache = get_cache(config, tmp_path, cache_size=2)
+    assert set(cache.entries) == {cache.get_key(optimization) for optimization in optimizations[1:]}
+
+
+def test_data_fingerprint_covers_table_sizes(config):
+    from objects import Table
+    from scenario import Scenario
+
+    scenario = Scenario(config(model="basic", basic_multiplier=10))
+    tables = [Table(name="t1", fields=[])]
+
+    class SizedConnection:
+        def __init__(self, sizes):
+            self.sizes = sizes
+            self.rows = []
+
+        def cursor(self):
+            return self
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def execute(self, sql, parameters=None):
+            self.rows = [("t1", *self.sizes)]
+
+        def fetchall(self):
+            return self.rows
+
+    assert scenario.get_data_fingerprint(SizedConnection((100, 1)), tables, []) == \
+           scenario.get_data_fingerprint(SizedConnection((100, 1)), tables, [])
+    assert scenario.get_data_fingerprint(SizedConnection((100, 1)), tables, []) != \
+           scenario.get_data_fingerprint(SizedConnection((200, 2)), tables, [])
@@ -0,0 +1,52 @@
+from db.postgres import PostgresExecutionPlan, PostgresQuery, get_plan_tree
+from objects import Table
+
+ANALYZED_PLAN = """Nested Loop  (cost=0.00..50.00 rows=10 width=8) (actual time=0.1..0.9 rows=30 loops=1)
+  ->  Hash Semi Join  (cost=0.00..20.00 rows=10 width=8) (actual time=0.1..0.5 rows=5 loops=1)
+        Hash Cond: (a.id = b.id)
+        ->  Seq Scan on t1 a  (cost=0.00..5.00 rows=10 width=4) (actual time=0.01..0.2 rows=10 loops=1)
+        ->  Hash  (cost=0.00..5.00 rows=10 width=4) (actual time=0.01..0.2 rows=10 loops=1)
+              ->  Seq Scan on t2 b  (cost=0.00..5.00 rows=10 width=4) (actual time=0.01..0.2 rows=10 loops=1)
+  ->  Nested Loop  (cost=0.00..5.00 rows=1 width=4) (actual time=0.01..0.1 rows=6 loops=5)
+        ->  Index Scan using t3_pkey on t3 c  (cost=0.00..1.00 rows=1 width=4) (actual time=0.01..0.02 rows=1 loops=5)
+        ->  Index Scan using t4_pkey on t4 d  (cost=0.00..1.00 rows=1 width=4) (actual time=0.01..0.02 rows=6 loops=5)
+Execution Time: 1.000 ms"""
+
+
+def get_scan(alias, rows, loops):
+    return {"Node Type": "Seq Scan", "Relation Name": f"t_{alias}", "Alias": alias,
+            "Startup Cost": 0.0, "Total Cost": 1.0, "Plan Rows": 1, "Plan Width": 4,
+            "Actual Rows": rows, "Actual Loops": loops}
+
+
+def get_join(node_type, join_type, rows, loops, *children):
+    return {"Node Type": node_type, "Join Type": join_type, "Startup Cost": 0.0, "Total Cost": 1.0,
+            "Plan Rows": 1, "Plan Width": 4, "Actual Rows": rows, "Actual Loops": loops,
+            "Plans": list(children)}
+
+
+def test_text_plan_join_cardinalities():
+    join_cardinalities = PostgresExecutionPlan(ANALYZED_PLAN).get_join_cardinalities()
+
+    assert join_cardinalities == {frozenset("abcd"): 30, frozenset("cd"): 30}
+
+
+def test_plan_tree_join_cardinalities():
+    plan_tree = get_plan_tree(
+        get_join("Nested Loop", "Inner", 30, 1,
+                 get_join("Hash Join", "Anti", 5, 1, get_scan("a", 10, 1), get_scan("b", 10, 1)),
+                 get_join("Merge Join", "Inner", 6.4, 5, get_scan("c", 1, 5), get_scan("d", 6, 5))))
+    execution_plan = PostgresExecutionPlan("", plan_tree=plan_tree)
+
+    assert execution_plan.get_join_cardinalities() == {frozenset("abcd"): 30, frozenset("cd"): 32}
+
+
+def test_cardinality_optimization(config):
+    database = config().database
+    query = PostgresQuery(query="select 1", query_hash="hash",
+                          tables=[Table(alias=alias, name=f"t{i}")
+                                  for i, alias in enumerate("abcd", 1)])
+
+    optimization = database.get_cardinality_optimization(query, PostgresExecutionPlan(ANALYZED_PLAN))
+
+    assert optimization.explain_hints == "Rows(c d #30) Rows(a b c d #30)"
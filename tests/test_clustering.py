@@ -0,0 +1,43 @@
+from collections import Counter
+
+from clustering import cluster_plans, get_medoid, get_plan_similarity
+from conftest import get_optimization
+
+SEQ_SCAN_PLAN = """Hash Join  (cost=1.00..20.50 rows=10 width=8)
+  Hash Cond: (a.id = b.id)
+  ->  Seq Scan on t1 a  (cost=0.00..5.00 rows=10 width=4)
+  ->  Hash  (cost=0.00..5.00 rows=10 width=4)
+        ->  Seq Scan on t2 b  (cost=0.00..5.00 rows=10 width=4)"""
+INDEX_SCAN_PLAN = """Hash Join  (cost=1.00..18.50 rows=10 width=8)
+  Hash Cond: (a.id = b.id)
+  ->  Seq Scan on t1 a  (cost=0.00..5.00 rows=10 width=4)
+  ->  Hash  (cost=0.00..3.00 rows=10 width=4)
+        ->  Index Scan using t2_pkey on t2 b  (cost=0.00..3.00 rows=10 width=4)"""
+NESTED_LOOP_PLAN = """Nested Loop  (cost=0.00..40.00 rows=10 width=8)
+  ->  Index Scan using t3_pkey on t3 c  (cost=0.00..5.00 rows=10 width=4)
+  ->  Index Scan using t4_pkey on t4 d  (cost=0.00..3.00 rows=1 width=4)"""
+
+
+def test_plan_similarity():
+    assert get_plan_similarity(Counter(), Counter()) == 1.0
+    assert get_plan_similarity(Counter("aab"), Counter("ab")) == 2 / 3
+    assert get_plan_similarity(Counter("a"), Counter("b")) == 0
+
+
+def test_similar_plans_are_clustered_around_medoid():
+    leader = get_optimization("IndexScan(b)", INDEX_SCAN_PLAN)
+    # estimated costs differ, but plan nodes are the same
+    seq_scans = [get_optimization("SeqScan(b)", SEQ_SCAN_PLAN),
+                 get_optimization("Leading((a b)) SeqScan(b)", SEQ_SCAN_PLAN.replace("20.50", "21.50"))]
+    nested_loop = get_optimization("NestLoop(c d)", NESTED_LOOP_PLAN)
+
+    clusters = cluster_plans([leader, *seq_scans, nested_loop], threshold=0.1)
+
+    assert [[member.explain_hints for member in cluster] for cluster in clusters] == \
+           [["SeqScan(b)", "Leading((a b)) SeqScan(b)", "IndexScan(b)"], ["NestLoop(c d)"]]
+    assert get_medoid(clusters[0]) is seq_scans[0]
+
+    # plans with different scans of b share only the scan of a
+    clusters = cluster_plans([leader, *seq_scans, nested_loop], threshold=0.5)
+    assert [len(cluster) for cluster in clusters] == [1, 2, 1]
+    assert get_medoid(clusters[0]) is leader
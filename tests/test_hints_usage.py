@@ -0,0 +1,59 @@
+from conftest import FakeConnection
+from db.postgres import NoticesBuffer
+
+HINT_PLAN_NOTICE = """LOG:  pg_hint_plan:
+used hint:
+Leading((a b))
+HashJoin(a b)
+not used hint:
+IndexScan(c)
+duplication hint:
+HashJoin(a b)
+SeqScan(a)
+error hint:
+NestLoop(a
+"""
+
+
+def test_hints_usage_sections(config):
+    database = config().database
+    connection = FakeConnection()
+    connection.notices = ["NOTICE:  table t1 does not exist\n", HINT_PLAN_NOTICE]
+
+    assert database.get_hints_usage(connection) == \
+           ("Leading((a b)) HashJoin(a b)", "IndexScan(c) SeqScan(a) NestLoop(a")
+
+
+def test_hints_usage_without_hint_plan_notice(config):
+    database = config().database
+    connection = FakeConnection()
+    connection.notices = ["NOTICE:  table t1 does not exist\n"]
+
+    assert database.get_hints_usage(connection) == (None, None)
+
+
+def test_hints_usage_with_empty_sections(config):
+    database = config().database
+    connection = FakeConnection()
+    connection.notices = ["LOG:  pg_hint_plan:\nused hint:\nnot used hint:\n"
+                          "duplication hint:\nerror hint:\n"]
+
+    assert database.get_hints_usage(connection) == ("", "")
+
+
+def test_notices_buffer_keeps_last_notices_and_counts_all(config):
+    database = config().database
+    connection = FakeConnection()
+    connection.notices = NoticesBuffer(2)
+    for notice in ["NOTICE:  first\n", "WARNING:  second\n", "NOTICE:  third\n", HINT_PLAN_NOTICE]:
+        connection.notices.append(notice)
+
+    assert list(connection.notices) == ["NOTICE:  third\n", HINT_PLAN_NOTICE]
+    assert database.get_notices_counters(connection) == {"NOTICE": 2, "WARNING": 1, "LOG": 1}
+    assert database.get_hints_usage(connection)[0] == "Leading((a b)) HashJoin(a b)"
+
+    # counters survive clearing notices between statements
+    database.clear_notices(connection)
+    assert len(connection.notices) == 0
+    assert database.get_notices_counters(connection)["NOTICE"] == 2
+    assert database.get_notices_counters(FakeConnection()) == {}
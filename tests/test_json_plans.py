@@ -0,0 +1,44 @@
+from db.postgres import get_plan_tree
+
+
+def get_plan_json(**top_level):
+    return {
+        "Plan": {"Node Type": "Hash Join", "Join Type": "Inner", "Startup Cost": 1.0,
+                 "Total Cost": 20.5, "Plan Rows": 10, "Plan Width": 8, "Actual Startup Time": 0.1,
+                 "Actual Total Time": 0.5, "Actual Rows": 42, "Actual Loops": 1,
+                 "Hash Cond": "(a.id = b.id)",
+                 "Plans": [
+                     {"Node Type": "Seq Scan", "Relation Name": "t1", "Alias": "a",
+                      "Startup Cost": 0.0, "Total Cost": 5.0, "Plan Rows": 10, "Plan Width": 4,
+                      "Actual Startup Time": 0.01, "Actual Total Time": 0.2, "Actual Rows": 10,
+                      "Actual Loops": 1, "Storage Table Read Requests": 2},
+                     {"Node Type": "Hash", "Startup Cost": 0.0, "Total Cost": 5.0,
+                      "Plan Rows": 10, "Plan Width": 4, "Actual Startup Time": 0.01,
+                      "Actual Total Time": 0.2, "Actual Rows": 10, "Actual Loops": 1,
+                      "Plans": [
+                          {"Node Type": "Index Scan", "Index Name": "t2_pkey",
+                           "Relation Name": "t2", "Alias": "b", "Startup Cost": 0.0,
+                           "Total Cost": 5.0, "Plan Rows": 10, "Plan Width": 4,
+                           "Actual Startup Time": 0.01, "Actual Total Time": 0.1,
+                           "Actual Rows": 10, "Actual Loops": 1, "Index Cond": "(id > 1)"}]}]},
+        **top_level}
+
+
+def test_plan_tree(config):
+    config()
+    plan_tree = get_plan_tree(get_plan_json()["Plan"])
+
+    assert [node.label for node in plan_tree.walk()] == [
+        "Hash Join", "Seq Scan on t1 a", "Hash", "Index Scan using t2_pkey on t2 b"]
+    assert plan_tree.get_total("read_requests") == 2
+
+
+def test_json_execution_plan(config):
+    database = config().database
+    execution_plan = database.get_json_execution_plan(
+        get_plan_json(**{"Planning Time": 0.123, "Execution Time": 1.5, "Query Identifier": 42,
+                         "Time Zone": "UTC"}))
+
+    assert "Planning Time: 0.123 ms" in execution_plan.full_str
+    assert "Time Zone: UTC" in execution_plan.full_str
+    assert execution_plan.get_estimated_cost() == 20.5
@@ -0,0 +1,178 @@
+import itertools
+import re
+import types
+
+from db.postgres import PostgresQuery, HillClimbingSearch, PGListOfOptimizations, Leading
+from objects import Table, Field, Index, QueryTips
+
+ALIASES = "abcdefg"
+
+
+def get_query(num_tables, chain=True):
+    aliases = ALIASES[:num_tables]
+    tables = [Table(alias=alias, name=f"t{i}", fields=[Field("id", True), Field("v", False)])
+              for i, alias in enumerate(aliases)]
+    query = f"select * from {', '.join(f't{i} {alias}' for i, alias in enumerate(aliases))}"
+    if chain and num_tables > 1:
+        query += " where " + " and ".join(f"{left}.id = {right}.id"
+                                          for left, right in zip(aliases, aliases[1:]))
+
+    return PostgresQuery(tag="test", query=query, query_hash=f"hash{num_tables}", tables=tables,
+                         optimizer_tips=QueryTips())
+
+
+def test_hill_climbing_explains_batches_within_budget(config):
+    created = config(workers=3, search_budget=40)
+    search = HillClimbingSearch(created, PGListOfOptimizations(created, get_query(6)))
+    batch_sizes = []
+
+    def fitness(optimizations):
+        batch_sizes.append(len(optimizations))
+        return [len(optimization.explain_hints) for optimization in optimizations]
+
+    optimizations = search.search(fitness, lambda: False)
+    explain_hints = [optimization.explain_hints for optimization in optimizations]
+
+    assert len(optimizations) == 40
+    assert len(set(explain_hints)) == len(explain_hints)
+    assert max(batch_sizes) == 3
+
+
+def test_hill_climbing_restarts_until_budget_is_used(config):
+    # length of hints is minimal in a few basins, so most restarts land in explored ones
+    def fitness(optimizations):
+        return [len(optimization.explain_hints) for optimization in optimizations]
+
+    created = config(search_budget=600)
+    search = HillClimbingSearch(created, PGListOfOptimizations(created, get_query(3)))
+    assert len(search.search(fitness, lambda: False)) == 600
+
+    # small state space is exhausted without spinning forever
+    created = config(search_budget=1000)
+    search = HillClimbingSearch(created, PGListOfOptimizations(created, get_query(2)))
+    assert 38 < len(search.search(fitness, lambda: False)) <= 54
+
+
+def test_connected_join_orders_without_cross_products(config):
+    created = config(join_graph_threshold=7, all_pairs_threshold=3)
+    query = get_query(4)
+
+    joins = list(Leading(created, query.tables, query.query).construct())
+
+    # left deep orders of a 4 tables chain are 2^3, each with 3^3 join methods
+    assert len(joins) == 8 * 27
+    assert len(set(joins)) == len(joins)
+    for join in joins:
+        order = [alias for alias in join.split(")")[0].split() if alias in ALIASES]
+        for idx in range(1, len(order)):
+            assert any(abs(ALIASES.index(order[idx]) - ALIASES.index(alias)) == 1
+                       for alias in order[:idx])
+
+
+def test_bushy_join_orders(config):
+    created = config(join_graph_threshold=7, bushy_join_orders=True)
+    query = get_query(4)
+
+    joins = list(Leading(created, query.tables, query.query).construct())
+
+    assert "Leading ( ( ( a b ) ( c d ) ) ) HashJoin(a b) HashJoin(c d) HashJoin(a b c d)" in joins
+    assert len(set(joins)) == len(joins)
+
+
+def test_all_pairs_combinations_cover_pairs(config):
+    created = config(join_graph_threshold=0, all_pairs_threshold=3)
+    query = get_query(3, chain=False)
+    leading = Leading(created, query.tables, query.query)
+
+    hints = list(leading.construct())
+    parsed = [(hint.split(")")[0], tuple(re.findall(r"(\w+)Join|NestLoop", hint)),
+               tuple(re.findall(r"\w*Scan\(\w+\)", hint)))
+              for hint in hints]
+    join_options = {joins for _, joins, _ in parsed}
+    scan_options = {scans for _, _, scans in parsed}
+
+    assert len(set(hints)) == len(hints)
+    for order in {order for order, _, _ in parsed}:
+        assert {joins for other, joins, _ in parsed if other == order} == join_options
+    assert {(joins, scans) for _, joins, scans in parsed} == \
+           set(itertools.product(join_options, scan_options))
+
+
+def get_indexed_table():
+    return Table(alias="t", name="t1", fields=[Field(name, name == "id") for name in ("id", "a", "b", "c")],
+                 indexes=[Index("t1_a_idx", ["a"]), Index("t1_c_idx", ["c"]),
+                          Index("t1_b_a_idx", ["b", "a"]), Index("t1_id_a_b_idx", ["id", "a", "b"])])
+
+
+def test_scan_hints_use_indexes_on_filtered_columns(config):
+    leading = Leading(config(), [get_indexed_table()],
+                      "select t.a from t1 t join t2 u on t.id = u.id where t.a > 1 order by t.b")
+
+    # t1_c_idx leading column is not used, only the covering index gets an index only scan
+    assert leading.get_table_scan_hints(get_indexed_table()) == [
+        "IndexScan(t t1_a_idx)", "IndexScan(t t1_b_a_idx)",
+        "IndexScan(t t1_id_a_b_idx)", "IndexOnlyScan(t t1_id_a_b_idx)", "SeqScan(t)"]
+
+
+def test_scan_hints_without_known_columns(config):
+    leading = Leading(config(), [get_indexed_table()], "select * from t1 t where t.c = 1")
+
+    # select list can't be resolved, so no index is known to cover the query
+    assert leading.get_table_scan_hints(get_indexed_table()) == ["IndexScan(t t1_c_idx)", "SeqScan(t)"]
+
+    # results without index metadata fall back to per table hints
+    table = get_indexed_table()
+    table.indexes = None
+    assert leading.get_table_scan_hints(table) == ["IndexScan(t)", "IndexOnlyScan(t)", "SeqScan(t)"]
+
+
+def test_candidate_hints_are_generated_lazily(config):
+    created = config(join_graph_threshold=7)
+    list_of_optimizations = PGListOfOptimizations(created, get_query(7))
+
+    candidate_hints = list_of_optimizations.get_candidate_hints()
+    first_hints = list(itertools.islice(candidate_hints, 5))
+
+    assert len(first_hints) == 5
+    assert isinstance(candidate_hints, types.GeneratorType)
+
+
+def test_optimization_batches(config):
+    created = config(join_graph_threshold=7, optimizations_batch_size=100,
+                     optimizations_sample_rate=1)
+    list_of_optimizations = PGListOfOptimizations(created, get_query(3))
+
+    batches = list(list_of_optimizations.iterate_batches())
+    explain_hints = [optimization.explain_hints for batch in batches for optimization in batch]
+
+    assert [len(batch) for batch in batches[:-1]] == [100] * (len(batches) - 1)
+    assert 0 < len(batches[-1]) <= 100
+    assert explain_hints == [optimization.explain_hints
+                             for optimization in list_of_optimizations.get_all_optimizations()]
+
+
+def test_optimizations_sampling_is_reproducible(config):
+    created = config(join_graph_threshold=7, optimizations_sample_rate=0.3)
+
+    def get_sample():
+        return [optimization.explain_hints for optimization in
+                PGListOfOptimizations(created, get_query(3)).iterate_optimizations()]
+
+    created.optimizations_sample_rate = 1
+    total = len(get_sample())
+    created.optimizations_sample_rate = 0.3
+
+    assert get_sample() == get_sample()
+    assert 0.2 * total < len(get_sample()) < 0.4 * total
+
+
+def test_accept_and_reject_tips(config):
+    created = config(join_graph_threshold=7)
+    query = get_query(3)
+    query.optimizer_tips = QueryTips(accept=["HashJoin(a b)"], reject=["SeqScan(c)"])
+
+    explain_hints = [optimization.explain_hints for optimization in
+                     PGListOfOptimizations(created, query).iterate_optimizations()]
+
+    assert explain_hints
+    assert all("HashJoin(a b)" in hints and "SeqScan(c)" not in hints for hints in explain_hints)
@@ -0,0 +1,78 @@
+import dataclasses
+import json
+
+from dacite import Config as DaciteConfig, from_dict
+
+from db.postgres import PostgresExecutionPlan, PostgresQuery, get_plan_tree, EMPTY_PLAN_DIGEST
+from objects import EnhancedJSONEncoder, PLAN_DIGEST_VERSION
+from test_json_plans import get_plan_json
+from utils import get_md5
+
+TEXT_PLAN = """Hash Join  (cost=1.00..20.50 rows=10 width=8) (actual time=0.100..0.500 rows=42 loops=1)
+  Hash Cond: (a.id = b.id)
+  ->  Seq Scan on t1 a  (cost=0.00..5.00 rows=10 width=4) (actual time=0.010..0.200 rows=10 loops=1)
+        Rows Removed by Filter: 3
+  ->  Hash  (cost=0.00..5.00 rows=10 width=4) (actual time=0.010..0.200 rows=10 loops=1)
+        Buckets: 1024  Batches: 1  Memory Usage: 9kB
+        ->  Index Scan using t2_pkey on t2 b  (cost=0.00..5.00 rows=10 width=4) (actual time=0.010..0.100 rows=10 loops=1)
+              Index Cond: (id > 1)
+Planning Time: 0.123 ms
+Execution Time: 1.500 ms"""
+
+
+def test_text_and_json_plans_have_same_digest(config):
+    json_plan = config().database.get_json_execution_plan(get_plan_json())
+    text_plan = PostgresExecutionPlan(TEXT_PLAN)
+
+    assert json_plan.plan_digest == text_plan.plan_digest
+    assert json_plan.plan_digest.startswith(f"v{PLAN_DIGEST_VERSION}:")
+    assert PostgresQuery(execution_plan=text_plan).compare_plans(json_plan)
+
+
+def test_plan_digest_ignores_measurements():
+    other_run = TEXT_PLAN.replace("rows=42", "rows=40").replace("Filter: 3", "Filter: 5")
+
+    assert PostgresExecutionPlan(TEXT_PLAN).plan_digest == \
+           PostgresExecutionPlan(other_run).plan_digest
+    assert PostgresExecutionPlan(TEXT_PLAN).plan_digest != \
+           PostgresExecutionPlan(TEXT_PLAN.replace("id > 1", "id > 2")).plan_digest
+    assert PostgresExecutionPlan("").plan_digest == EMPTY_PLAN_DIGEST
+    assert not PostgresQuery(execution_plan=PostgresExecutionPlan("")).compare_plans(
+        PostgresExecutionPlan(""))
+
+
+def test_plan_digest_is_recomputed_for_older_versions():
+    execution_plan = PostgresExecutionPlan(TEXT_PLAN)
+    stored = json.loads(json.dumps(execution_plan, cls=EnhancedJSONEncoder))
+    stored_old = dict(stored, plan_digest=get_md5(execution_plan.get_clean_plan()))
+
+    loaded = from_dict(PostgresExecutionPlan, stored, DaciteConfig(check_types=False))
+    loaded_old = from_dict(PostgresExecutionPlan, stored_old, DaciteConfig(check_types=False))
+
+    assert loaded.plan_digest == loaded_old.plan_digest == execution_plan.plan_digest
+
+
+def test_plan_trees_are_compared_by_signature(config):
+    database = config().database
+    plan_json = get_plan_json()
+    query = PostgresQuery(execution_plan=database.get_json_execution_plan(plan_json))
+
+    plan_json["Plan"]["Actual Rows"] = 1
+    assert query.compare_plans(database.get_json_execution_plan(plan_json))
+
+    plan_json["Plan"]["Join Type"] = "Left"
+    assert not query.compare_plans(database.get_json_execution_plan(plan_json))
+
+
+def test_clean_plan_is_memoized(monkeypatch):
+    execution_plan = PostgresExecutionPlan(TEXT_PLAN)
+    calls = []
+    monkeypatch.setattr(PostgresExecutionPlan, "get_clean_plan_str",
+                        staticmethod(lambda plan_str: calls.append(plan_str) or plan_str))
+
+    execution_plan.get_clean_plan()
+    execution_plan.get_clean_plan()
+
+    assert not calls
+    assert dataclasses.replace(execution_plan).get_clean_plan() == TEXT_PLAN
+    assert len(calls) == 1
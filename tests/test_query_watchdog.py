@@ -0,0 +1,55 @@
+import time
+
+from conftest import FakeConnection
+from query_watchdog import CancelWatchdog, watch
+from utils import get_timeout_ms
+
+
+def test_stalled_statement_is_cancelled():
+    conn = FakeConnection()
+    watchdog = CancelWatchdog(conn, grace_ms=10)
+    watchdog.timeout_ms = 10
+    try:
+        with watch(watchdog):
+            assert conn.cancelled.wait(5)
+    finally:
+        watchdog.stop()
+
+    assert conn.num_cancels == 1 and watchdog.num_cancelled == 1
+
+
+def test_finished_statement_is_not_cancelled():
+    conn = FakeConnection()
+    watchdog = CancelWatchdog(conn, grace_ms=50)
+    watchdog.timeout_ms = 50
+    try:
+        for _ in range(3):
+            with watch(watchdog):
+                pass
+        time.sleep(0.2)
+    finally:
+        watchdog.stop()
+
+    assert conn.num_cancels == 0
+    assert not watchdog.thread.is_alive()
+
+
+def test_watchdog_is_idle_without_timeout():
+    conn = FakeConnection()
+    watchdog = CancelWatchdog(conn, grace_ms=0)
+    try:
+        with watch(watchdog):
+            time.sleep(0.05)
+        with watch(None):
+            pass
+    finally:
+        watchdog.stop()
+
+    assert conn.num_cancels == 0
+
+
+def test_timeout_units():
+    assert get_timeout_ms("500ms") == 500
+    assert get_timeout_ms("5s") == 5000
+    assert get_timeout_ms(2) == 2000
+    assert get_timeout_ms("0.5") == 500
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from conftest import PLAN, get_optimization
+from db.postgres import PostgresExecutionPlan, PostgresQuery, PostgresListOfQueries
+from objects import ExecutionStats, SKIPPED_RECORD_KEY
+from reports.abstract import Report
+from scenario import Scenario
+
+
+def get_query(query_hash, execution_time_ms=10):
+    return PostgresQuery(
+        tag="tag", query=f"select {query_hash}", query_hash=query_hash,
+        execution_plan=PostgresExecutionPlan(PLAN), execution_time_ms=execution_time_ms,
+        execution_stats=ExecutionStats(p50=execution_time_ms),
+        optimizations=[get_optimization("HashJoin(a b)", execution_time_ms=execution_time_ms / 2)])
+
+
+def get_list_of_queries(queries=None):
+    return PostgresListOfQueries(db_version="PostgreSQL 15", git_message="commit",
+                                 model_queries=["create table t1 (id int)"], queries=queries)
+
+
+def test_json_lines_round_trip(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    loader = config(results_format="jsonl").database.get_results_loader()
+
+    loader.store_queries_to_file(get_list_of_queries([get_query("q1"), get_query("q2", 20)]), "results")
+
+    loq = loader.get_queries_from_previous_result("report/results.jsonl")
+    assert (loq.db_version, loq.git_message, loq.model_queries) == \
+           ("PostgreSQL 15", "commit", ["create table t1 (id int)"])
+    assert [query.query_hash for query in loq.queries] == ["q1", "q2"]
+    assert isinstance(loq.queries[1].execution_plan, PostgresExecutionPlan)
+    assert loq.queries[1].execution_stats.p50 == 20
+    assert loq.queries[1].optimizations[0].execution_time_ms == 10
+    assert loq.queries[1].optimizations[0].explain_hints == "HashJoin(a b)"
+
+
+def test_streamed_json_lines_are_read_in_single_pass(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    loader = config(results_format="jsonl", estimator="p50").database.get_results_loader()
+
+    first_query = get_query("q1")
+    first_query.execution_stats = ExecutionStats(p50=7)
+    loader.store_queries_to_file(get_list_of_queries([first_query, get_query("q2", 20)]), "results")
+    loader.store_queries_to_file(get_list_of_queries([get_query("q1")]), "pg_results")
+
+    loq = loader.get_queries_from_previous_result("report/results.jsonl", stream=True)
+    assert loq.db_version == "PostgreSQL 15"
+    assert not isinstance(loq.queries, list)
+
+    query = next(loq.queries)
+    # estimator is applied to every streamed query
+    assert query.query_hash == "q1" and query.execution_time_ms == 7
+    assert [query.query_hash for query in loq.queries] == ["q2"]
+    assert list(loq.queries) == []
+
+    loq = loader.get_queries_from_previous_result("report/results.jsonl", stream=True)
+    assert [(query.query_hash, pg_query) for query, pg_query in Report.pair_queries(loq)] == \
+           [("q1", None), ("q2", None)]
+
+    loq = loader.get_queries_from_previous_result("report/results.jsonl", stream=True)
+    pg_loq = loader.get_queries_from_previous_result("report/pg_results.jsonl", stream=True)
+    with pytest.raises(AttributeError):
+        list(Report.pair_queries(loq, pg_loq))
+
+
+def test_json_results_are_still_readable(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    loader = config(results_format="json").database.get_results_loader()
+
+    loader.store_queries_to_file(get_list_of_queries([get_query("q1")]), "results")
+
+    loq = loader.get_queries_from_previous_result("report/results.json")
+    assert [query.query_hash for query in loq.queries] == ["q1"]
+    assert loq.queries[0].optimizations[0].execution_time_ms == 5
+
+
+def test_json_lines_results_are_checkpoint(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    loader = config(results_format="jsonl").database.get_results_loader()
+
+    loader.start_checkpoint(get_list_of_queries(), "results")
+    loader.append_query_to_checkpoint(get_query("q1"), "results")
+    loader.append_query_to_checkpoint(get_query("q2"), "results", skipped=True)
+    loader.remove_checkpoint("results")
+
+    assert loader.get_checkpoint_path("results") == "report/results.jsonl"
+    assert not (tmp_path / "report" / "results.checkpoint").exists()
+    with open("report/results.jsonl") as results_file:
+        lines = results_file.readlines()
+    assert len(lines) == 3 and json.loads(lines[2])[SKIPPED_RECORD_KEY]
+
+    # skipped queries are kept in results to preserve queries order
+    loq = loader.get_queries_from_previous_result("report/results.jsonl")
+    assert [query.query_hash for query in loq.queries] == ["q1", "q2"]
+
+
+def test_resume_skips_partial_and_skipped_records(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scenario = Scenario(config(results_format="json", output="results", resume=True))
+    loader = scenario.config.database.get_results_loader()
+
+    loader.start_checkpoint(get_list_of_queries(), "results")
+    loader.append_query_to_checkpoint(get_query("q1"), "results")
+    loader.append_query_to_checkpoint(get_query("q2"), "results", skipped=True)
+    with open("report/results.checkpoint", "a") as checkpoint_file:
+        checkpoint_file.write('{"query_hash": "q3", "execution_pl')
+
+    loq = get_list_of_queries()
+    loq.model_queries = None
+    model_queries, completed_queries = scenario.start_checkpoint(loq)
+
+    assert model_queries == ["create table t1 (id int)"]
+    assert list(completed_queries) == ["q1"]
+    assert completed_queries["q1"][0].optimizations[0].execution_time_ms == 5
+
+    # rewritten checkpoint keeps only completed queries
+    assert loader.get_queries_from_checkpoint("results")[1][0].query_hash == "q1"
+    with open("report/results.checkpoint") as checkpoint_file:
+        assert len(checkpoint_file.readlines()) == 2
+    assert not (tmp_path / "report" / "results.checkpoint.tmp").exists()
@@ -0,0 +1,212 @@
+import time
+
+from conftest import FakeConnection, get_optimization
+from db.postgres import PostgresExecutionPlan, PostgresOptimization
+from scenario import Scenario, OptimizationsState, HintsHistory
+
+
+def get_scenario(config, measured_times, **kwargs):
+    scenario = Scenario(config(look_near_best_plan=False, **kwargs))
+
+    def measure_execution_time(cur, optimization, connection):
+        optimization.execution_time_ms = measured_times[optimization.explain_hints]
+        return optimization.execution_time_ms > 0
+
+    scenario.measure_execution_time = measure_execution_time
+
+    return scenario
+
+
+def test_failed_measurement_is_not_new_minimum(config):
+    scenario = get_scenario(config, {"HashJoin(a b)": -1, "NestLoop(a b)": 5})
+    state = OptimizationsState(min_execution_time=10)
+
+    for explain_hints in ("HashJoin(a b)", "NestLoop(a b)"):
+        optimization = get_optimization(explain_hints, f"{explain_hints}  (cost=0.00..1.00)")
+        scenario.evaluate_optimization(None, None, None, optimization, state)
+        if explain_hints == "HashJoin(a b)":
+            assert state.min_execution_time == 10
+
+    assert state.min_execution_time == 5
+    assert state.num_timed == 1 and state.num_skipped == 1
+
+
+def test_hints_history_win_rate():
+    hints_history = HintsHistory()
+    winner = get_optimization("Leading((a b)) HashJoin(a b) SeqScan(a)")
+    winner.execution_time_ms = 1
+    loser = get_optimization("Leading((a b)) NestLoop(a b) SeqScan(a)")
+    loser.execution_time_ms = 2
+
+    class OriginalQuery:
+        optimizations = [winner, loser]
+
+    hints_history.record(OriginalQuery, winner)
+
+    assert hints_history.win_rate("HashJoin(a b)") == 1
+    assert hints_history.win_rate("NestLoop(a b)") == 0
+    assert hints_history.win_rate("Leading((a b)) SeqScan(a)") == 0.5
+
+
+def test_parallel_evaluation_sets_default_hints_once(config):
+    scenario = Scenario(config(workers=3, session_props=[]))
+    workers = [FakeConnection() for _ in range(3)]
+    scenario.get_worker_connections = lambda: workers
+
+    original_query = get_optimization("")
+    original_query.explain_hints = None
+    optimizations = [get_optimization(f"HashJoin(a b) Set(x {i})") for i in range(30)]
+    evaluated = []
+
+    def explain(conn, cur, query, optimization, state):
+        scenario.try_to_get_default_explain_hints(cur, optimization, query, state)
+        evaluated.append(optimization.explain_hints)
+
+    scenario.run_optimizations(None, None, original_query, optimizations,
+                               OptimizationsState(min_execution_time=10), explain)
+
+    assert sorted(evaluated) == sorted(optimization.explain_hints for optimization in optimizations)
+    assert original_query.explain_hints in evaluated
+
+
+def test_effective_hints_duplicates_get_measurements(config):
+    scenario = get_scenario(config, {"HashJoin(a b)": 7, "HashJoin(a b) Set(x 1)": 99})
+    state = OptimizationsState(min_execution_time=10)
+    optimizations = [get_optimization("HashJoin(a b)"), get_optimization("HashJoin(a b) Set(x 1)")]
+    for optimization in optimizations:
+        optimization.effective_hints = "HashJoin(a b)"
+
+    connection = FakeConnection()
+    scenario.run_optimizations(connection, connection.cursor(), get_optimization(""),
+                               optimizations, state, scenario.evaluate_optimization)
+
+    assert state.num_timed == 1 and state.num_skipped == 1
+    assert optimizations[1].execution_time_ms == 7
+    assert optimizations[1].representative_hints == "HashJoin(a b)"
+
+
+def test_search_strategy_copies_measurements(config):
+    scenario = get_scenario(config, {"a": 3, "b": 9, "c": 1}, search_timed_plans=1)
+    explored = [get_optimization("a", "Hash Join  (cost=0.00..2.00)"),
+                get_optimization("b", "Nested Loop  (cost=0.00..9.00)"),
+                get_optimization("c", "Hash Join  (cost=0.00..2.00)")]
+
+    class Strategy:
+        @staticmethod
+        def search(fitness, is_stopped):
+            return explored
+
+    connection = FakeConnection()
+    scenario.evaluate_search_strategy(connection, connection.cursor(), get_optimization(""),
+                                      OptimizationsState(min_execution_time=10), Strategy)
+
+    assert [optimization.execution_time_ms for optimization in explored] == [3, 0, 3]
+    assert explored[2].representative_hints == "a"
+
+
+def test_statement_timeout_is_capped_by_budget(config):
+    scenario = Scenario(config(timeout_multiplier=0))
+    timeouts = []
+    scenario.set_statement_timeout = lambda cur, timeout_ms: timeouts.append(timeout_ms)
+    original_query = get_optimization("")
+
+    scenario.set_optimization_timeout(None, original_query,
+                                      OptimizationsState(min_execution_time=10))
+    scenario.set_optimization_timeout(None, original_query,
+                                      OptimizationsState(min_execution_time=10,
+                                                         deadline=time.monotonic() + 0.5))
+    scenario.set_optimization_timeout(None, original_query,
+                                      OptimizationsState(min_execution_time=10,
+                                                         deadline=time.monotonic() - 1))
+
+    assert timeouts[0] == 1000
+    assert 400 < timeouts[1] <= 500
+    assert timeouts[2] == 1
+
+
+def test_budgeted_batches_stop_and_count_coverage(config):
+    scenario = get_scenario(config, {f"hints{i}": 1 for i in range(10)})
+
+    class Database:
+        @staticmethod
+        def get_optimization_batches(original_query):
+            for start in range(0, 10, 2):
+                yield [PostgresOptimization(query="select 1", explain_hints=f"hints{i}")
+                       for i in range(start, start + 2)]
+
+    def explain_optimization(connection, cur, original_query, optimization, state):
+        optimization.execution_plan = PostgresExecutionPlan(
+            f"{optimization.explain_hints}  (cost=0.00..1.00)")
+        return True
+
+    scenario.config.database = Database
+    scenario.explain_optimization = explain_optimization
+    state = OptimizationsState(min_execution_time=10, deadline=time.monotonic() + 60)
+    original_query = get_optimization("")
+    evaluate_optimization = scenario.evaluate_optimization
+
+    def evaluate_until_out_of_budget(connection, cur, query, optimization, state):
+        evaluate_optimization(connection, cur, query, optimization, state)
+        if optimization.explain_hints == "hints2":
+            state.deadline = time.monotonic() - 1
+
+    scenario.evaluate_optimization = evaluate_until_out_of_budget
+    connection = FakeConnection()
+    scenario.evaluate_optimization_batches(connection, connection.cursor(), original_query, state)
+
+    assert [optimization.explain_hints for optimization in original_query.optimizations] == \
+           ["hints0", "hints1", "hints2"]
+    assert original_query.search_stats.total == 10
+    assert original_query.search_stats.evaluated == 3
+
+
+def test_explain_first_times_one_optimization_per_plan(config):
+    plans = {"HashJoin(a b)": "Hash Join  (cost=0.00..2.00)",
+             "HashJoin(a b) SeqScan(a)": "Hash Join  (cost=0.00..2.00)",
+             "NestLoop(a b)": "Nested Loop  (cost=0.00..9.00)",
+             "MergeJoin(a b)": ""}
+    scenario = get_scenario(config, {"HashJoin(a b)": 3, "NestLoop(a b)": 7}, explain_first=True)
+    optimizations = [PostgresOptimization(query="select 1", explain_hints=explain_hints)
+                     for explain_hints in plans]
+
+    class Database:
+        @staticmethod
+        def get_search_strategy(original_query):
+            return None
+
+        @staticmethod
+        def get_list_optimizations(original_query):
+            return optimizations
+
+    def explain_optimization(connection, cur, original_query, optimization, state):
+        # merge join EXPLAIN fails with an empty plan
+        optimization.execution_plan = PostgresExecutionPlan(plans[optimization.explain_hints])
+
+    scenario.config.database = Database
+    scenario.explain_optimization = explain_optimization
+    original_query = get_optimization("", execution_time_ms=10)
+    connection = FakeConnection()
+    scenario.evaluate_optimizations(connection, connection.cursor(), original_query)
+
+    assert [optimization.execution_time_ms for optimization in original_query.optimizations] == \
+           [3, 3, 7, 0]
+    assert original_query.optimizations[1].representative_hints == "HashJoin(a b)"
+    assert original_query.optimizations[2].representative_hints is None
+    assert original_query.search_stats.timed == 2
+    assert original_query.search_stats.deduplicated == 1
+
+
+def test_query_budget_starts_with_optimizations(config):
+    scenario = Scenario(config(query_budget=10))
+    assert scenario.start_query_budget(4)
+    # default query EXPLAIN and timing are not counted
+    time.sleep(0.1)
+    deadline = scenario.get_optimizations_deadline()
+    assert 9.95 < deadline - time.monotonic() <= 10
+
+    scenario.run_deadline = time.monotonic() + 8
+    assert 1.9 < scenario.get_optimizations_deadline() - time.monotonic() <= 2
+
+    scenario.run_deadline = time.monotonic() - 1
+    assert not scenario.start_query_budget(3)
+    assert scenario.budget_exhausted
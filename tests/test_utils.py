@@ -0,0 +1,161 @@
+import hashlib
+import math
+import statistics
+import time
+
+from conftest import FakeConnection, FakeCursor, ROWS
+from db.postgres import PostgresQuery
+from utils import evaluate_streamed_sql, get_md5, calculate_avg_execution_time, get_prepared_sql, \
+    get_relative_precision, need_more_samples, current_milli_time, get_execution_stats, \
+    get_fingerprint_query
+
+
+def test_streamed_result_keeps_hints_in_front(config):
+    config(result_fetch_size=10)
+    connection = FakeConnection()
+
+    _, cardinality, result_hash = evaluate_streamed_sql(
+        connection, connection.cursor(), "/*+ HashJoin(a b) */ select * from a, b;", False)
+
+    assert cardinality == len(ROWS)
+    assert result_hash == get_md5("".join(f"{idx}{value}" for idx, value in ROWS))
+    assert connection.statements[0] == \
+           "/*+ HashJoin(a b) */ DECLARE taqo_result NO SCROLL CURSOR FOR select * from a, b"
+    assert sum(statement.startswith("FETCH") for statement in connection.statements) == 4
+    assert connection.statements[-1] == "CLOSE taqo_result"
+
+
+def test_client_cursor_result_in_autocommit(config):
+    config(result_fetch_size=10)
+    connection = FakeConnection(autocommit=True)
+
+    _, cardinality, result_hash = evaluate_streamed_sql(
+        connection, connection.cursor(), "select * from a", False)
+
+    digest = hashlib.md5()
+    for row in ROWS:
+        for value in row:
+            digest.update(str(value).encode("utf-8"))
+    assert (cardinality, result_hash) == (len(ROWS), digest.hexdigest())
+    assert connection.statements == ["select * from a"]
+
+
+def test_result_is_streamed_without_warmup(config):
+    created = config(result_fetch_size=10, num_warmup=0, session_props=[])
+    connection = FakeConnection()
+    query = PostgresQuery(query="select * from a")
+
+    assert calculate_avg_execution_time(connection.cursor(), query, created.database,
+                                        num_retries=2, connection=connection)
+
+    assert connection.statements[:2] == \
+           ["select * from a", "DECLARE taqo_result NO SCROLL CURSOR FOR select * from a"]
+    assert query.result_cardinality == len(ROWS)
+    assert query.result_hash == get_md5("".join(f"{idx}{value}" for idx, value in ROWS))
+    assert len(query.execution_times) == 2
+
+
+def test_prepared_sql_placeholders():
+    sql = "select * from t where a = %s and b like '%s%%' and \"c%s\" = %s -- %s\n" \
+          "and d = /* %s */ %s"
+
+    assert get_prepared_sql(sql) == "select * from t where a = $1 and b like '%s%%' and " \
+                                    "\"c%s\" = $2 -- %s\nand d = /* %s */ $3"
+
+
+class PreparedCursor(FakeCursor):
+    def execute(self, sql, parameters=None):
+        self.connection.statements.append(sql)
+        if sql.startswith("EXPLAIN (SUMMARY ON)"):
+            self.connection.planned += 1
+            self.rows = [("Result  (cost=0.00..0.01 rows=1 width=4)",),
+                         (f"Planning Time: {10 * self.connection.planned}.000 ms",)]
+        elif sql.startswith("EXECUTE"):
+            time.sleep(0.05)
+            self.rows = list(ROWS)
+
+
+def test_planning_time_is_measured_once_before_timed_runs(config):
+    created = config(result_fetch_size=10, num_warmup=1, session_props=[], prepared=True)
+    connection = FakeConnection()
+    connection.planned = 0
+    query = PostgresQuery(query="select * from a")
+
+    assert calculate_avg_execution_time(PreparedCursor(connection), query, created.database,
+                                        num_retries=3, connection=connection)
+
+    # no plannings between timed runs to keep plan cache state of auto plan_cache_mode
+    assert [statement.split(" taqo")[0] for statement in connection.statements
+            if "taqo_statement" in statement] == \
+           ["PREPARE", "EXPLAIN (SUMMARY ON) EXECUTE"] + ["EXECUTE"] * 3
+    assert query.planning_time_ms == 10
+    assert len(query.execution_times) == 3
+    assert all(execution_time >= 45 for execution_time in query.execution_times)
+
+
+def test_relative_precision_uses_t_distribution():
+    assert get_relative_precision([10]) is None
+    assert get_relative_precision([0, 0]) is None
+
+    execution_times = [9, 10, 11]
+    # 95% two-sided t quantile for 2 degrees of freedom
+    expected = 4.303 * statistics.stdev(execution_times) / math.sqrt(3) / 10
+    assert math.isclose(get_relative_precision(execution_times), expected)
+
+    # normal quantile is used beyond the t table
+    execution_times = [9, 11] * 20
+    expected = 1.96 * statistics.stdev(execution_times) / math.sqrt(40) / 10
+    assert math.isclose(get_relative_precision(execution_times), expected)
+
+
+def test_need_more_samples_until_target_precision(config):
+    config = config(target_precision=0.05, max_retries=10, adaptive_time_budget=None)
+    started_at = current_milli_time()
+
+    assert need_more_samples(config, [10], started_at)
+    assert need_more_samples(config, [5, 15], started_at)
+    assert not need_more_samples(config, [10, 10.01, 9.99], started_at)
+    assert not need_more_samples(config, [5, 15] * 5, started_at)
+
+
+def test_need_more_samples_stops_on_time_budget(config):
+    config = config(target_precision=0.05, max_retries=10, adaptive_time_budget=1)
+
+    assert need_more_samples(config, [5, 15], current_milli_time())
+    assert not need_more_samples(config, [5, 15], current_milli_time() - 2000)
+
+
+def test_execution_stats_estimators():
+    assert get_execution_stats([]) is None
+
+    execution_times = [10, 1, 2, 3, 4, 5, 6, 7, 8, 9, 100]
+    stats = get_execution_stats(execution_times)
+
+    assert stats.p50 == 6 and stats.min == 1
+    assert math.isclose(stats.p90, 10)
+    assert math.isclose(stats.p99, 91)
+    assert stats.mad == 3
+    # 10% of samples are cut from each side
+    assert stats.trimmed_mean == statistics.fmean(range(2, 11))
+    assert math.isclose(stats.stddev, statistics.stdev(execution_times))
+
+
+def test_query_uses_estimator(config):
+    query = PostgresQuery(execution_time_ms=20, execution_stats=get_execution_stats([10, 10, 40]),
+                          optimizations=[PostgresQuery(execution_time_ms=-1,
+                                                       execution_stats=get_execution_stats([5]))])
+
+    query.use_estimator("p50")
+
+    assert query.execution_time_ms == 10
+    # failed measurements are kept as is
+    assert query.optimizations[0].execution_time_ms == -1
+
+
+def test_fingerprint_query_keeps_hints_in_front():
+    assert get_fingerprint_query("/*+ HashJoin(a b) */\nselect * from a, b;  ") == \
+           "/*+ HashJoin(a b) */ SELECT count(*), " \
+           "coalesce(md5(string_agg(row_hash, '' ORDER BY row_hash)), '') " \
+           "FROM (SELECT md5(result_row::text) AS row_hash " \
+           "FROM (select * from a, b) result_row) hashed_rows"
+    assert get_fingerprint_query("select 1").startswith("SELECT count(*)")